@@ -0,0 +1,210 @@
+"""Replay JSONL conversations through the graph, several at a time.
+
+Input, one JSON object per line:
+    {"id": "greet-1", "prompt": "who made you?"}
+    {"id": "multi-1", "messages": [{"role": "user", "content": "weather in Pune"},
+                                   {"role": "user", "content": "and Mumbai?"}]}
+
+Each output line has the replies, per-turn latency and tool-call count.
+Results are appended and flushed as items finish, so re-running with the
+same --output skips finished items (--no-resume starts over).
+
+    python batch.py requests.jsonl -o results.jsonl --workers 8
+    python batch.py regression.jsonl -o out.jsonl --stub   # no Groq calls
+"""
+
+import argparse
+import asyncio
+import dataclasses
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+from typing import Dict, Iterator, Optional, Set, Tuple
+
+from langchain_core.messages import HumanMessage
+
+from engine import EngineConfig, get_engine
+from streaming import astream_turn
+
+
+def read_items(path: str) -> Iterator[Tuple[int, Dict]]:
+    """Yield (line number, item) lazily; blank lines are skipped."""
+    with open(path, encoding="utf-8") as f:
+        for line_no, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            item = json.loads(line)
+            item.setdefault("id", f"line-{line_no}")
+            yield line_no, item
+
+
+def completed_ids(path: str) -> Set[str]:
+    """Ids already written to the output file (a torn last line is ignored)."""
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                done.add(json.loads(line)["id"])
+            except (ValueError, KeyError):
+                continue
+    return done
+
+
+def user_turns(item: Dict):
+    if "prompt" in item:
+        return [item["prompt"]]
+    return [m["content"] for m in item.get("messages", []) if m.get("role") == "user"]
+
+
+async def run_item(graph, run_id: str, line_no: int, item: Dict) -> Dict:
+    thread_id = f"batch-{run_id}-{item['id']}"
+    config = {"configurable": {"thread_id": thread_id}}
+    result = {
+        "id": item["id"],
+        "line": line_no,
+        "replies": [],
+        "turn_latencies": [],
+        "ttft": [],
+        "tool_calls": 0,
+        "error": None,
+    }
+    start = time.perf_counter()
+    try:
+        # turns of one transcript run in order, on one thread_id
+        for prompt in user_turns(item):
+            turn_start = time.perf_counter()
+            state = {"messages": [HumanMessage(content=prompt)]}
+            async for event in astream_turn(graph, state, config):
+                if event.kind == "tool_start":
+                    result["tool_calls"] += 1
+                elif event.kind == "done":
+                    result["replies"].append(event.text)
+                    result["ttft"].append(event.ttft)
+            result["turn_latencies"].append(time.perf_counter() - turn_start)
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    result["latency"] = time.perf_counter() - start
+    return result
+
+
+async def run_batch(
+    engine,
+    input_path: str,
+    output_path: str,
+    workers: int,
+    resume: bool = True,
+    limit: Optional[int] = None,
+) -> Dict:
+    graph = await engine.aget_graph()
+    run_id = uuid.uuid4().hex[:8]
+
+    done = completed_ids(output_path) if resume else set()
+    mode = "a" if resume else "w"
+    if resume and os.path.exists(output_path) and os.path.getsize(output_path):
+        with open(output_path, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            torn = f.read(1) != b"\n"
+        if torn:
+            # crash mid-write: start our lines on a fresh line
+            with open(output_path, "a", encoding="utf-8") as f:
+                f.write("\n")
+    queue: "asyncio.Queue" = asyncio.Queue(maxsize=workers * 2)
+    latencies = []
+    stats = {"items": 0, "errors": 0, "skipped": 0, "tool_calls": 0}
+
+    with open(output_path, mode, encoding="utf-8") as out:
+
+        async def worker():
+            while True:
+                entry = await queue.get()
+                if entry is None:
+                    return
+                result = await run_item(graph, run_id, *entry)
+                out.write(json.dumps(result, ensure_ascii=False) + "\n")
+                out.flush()
+                stats["items"] += 1
+                stats["tool_calls"] += result["tool_calls"]
+                if result["error"]:
+                    stats["errors"] += 1
+                latencies.append(result["latency"])
+
+        start = time.perf_counter()
+        tasks = [asyncio.create_task(worker()) for _ in range(workers)]
+        queued = 0
+        # producer: bounded queue keeps only a few items in memory
+        for line_no, item in read_items(input_path):
+            if item["id"] in done:
+                stats["skipped"] += 1
+                continue
+            if limit is not None and queued >= limit:
+                break
+            await queue.put((line_no, item))
+            queued += 1
+        for _ in tasks:
+            await queue.put(None)
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - start
+
+    stats["seconds"] = round(elapsed, 3)
+    stats["throughput"] = round(stats["items"] / elapsed, 2) if elapsed else 0.0
+    if latencies:
+        latencies.sort()
+        stats["latency_p50"] = round(statistics.median(latencies), 3)
+        stats["latency_p95"] = round(latencies[int(0.95 * (len(latencies) - 1))], 3)
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description=__doc__.splitlines()[0],
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="\n".join(__doc__.splitlines()[1:]),
+    )
+    parser.add_argument("input", help="JSONL file with prompts or transcripts")
+    parser.add_argument("-o", "--output", required=True, help="results JSONL")
+    parser.add_argument("-w", "--workers", type=int, default=4)
+    parser.add_argument("--limit", type=int, help="stop after this many new items")
+    parser.add_argument("--no-resume", action="store_true")
+    parser.add_argument(
+        "--db", help="checkpoint DB for batch threads (default: a temp file)"
+    )
+    parser.add_argument(
+        "--stub",
+        action="store_true",
+        help="use the offline echo model instead of Groq (regression runs)",
+    )
+    args = parser.parse_args(argv)
+
+    if args.stub:
+        os.environ.setdefault("GROQ_API_KEY", "stub")
+    db_path = args.db or os.path.join(tempfile.mkdtemp(), "batch.db")
+    config = EngineConfig.from_env()
+    engine = get_engine(dataclasses.replace(config, db_path=db_path))
+    if args.stub:
+        from benchmarks.fakes import echo_reply, install_fake_llm
+
+        install_fake_llm(engine, replies=[echo_reply])
+
+    stats = asyncio.run(
+        run_batch(
+            engine,
+            args.input,
+            args.output,
+            workers=args.workers,
+            resume=not args.no_resume,
+            limit=args.limit,
+        )
+    )
+    print(json.dumps(stats), file=sys.stderr)
+    return 1 if stats["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,108 @@
+"""Threads held and throughput at N concurrent conversations: sync vs async engine.
+
+Run from the repo root:
+    python -m benchmarks.concurrency --conversations 50 --latency 0.5
+
+The chat model is a local fake with fixed latency, so the numbers show
+engine overhead and how many threads each turn pins, not Groq speed.
+"""
+
+import argparse
+import asyncio
+import dataclasses
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+os.environ.setdefault("GROQ_API_KEY", "bench-dummy-key")
+
+from langchain_core.messages import HumanMessage  # noqa: E402
+
+from benchmarks.fakes import install_fake_llm  # noqa: E402
+from engine import EngineConfig, get_engine  # noqa: E402
+
+
+class ThreadSampler:
+    """Samples threading.active_count() in the background, keeps the max."""
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.peak = threading.active_count()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, threading.active_count())
+            time.sleep(self.interval)
+
+    def __enter__(self):
+        self.baseline = threading.active_count()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def _state(i):
+    return {"messages": [HumanMessage(content=f"hello {i}")]}
+
+
+def _config(prefix, i):
+    return {"configurable": {"thread_id": f"{prefix}-{i}-{time.time_ns()}"}}
+
+
+def run_sync(engine, n):
+    with ThreadSampler() as sampler:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=n) as pool:
+            list(
+                pool.map(
+                    lambda i: engine.graph.invoke(_state(i), _config("sync", i)),
+                    range(n),
+                )
+            )
+        elapsed = time.perf_counter() - start
+    return elapsed, sampler.peak - sampler.baseline
+
+
+def run_async(engine, n):
+    async def all_turns():
+        graph = await engine.aget_graph()
+        await asyncio.gather(
+            *(graph.ainvoke(_state(i), _config("async", i)) for i in range(n))
+        )
+
+    with ThreadSampler() as sampler:
+        start = time.perf_counter()
+        asyncio.run(all_turns())
+        elapsed = time.perf_counter() - start
+    return elapsed, sampler.peak - sampler.baseline
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--conversations", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.5)
+    args = parser.parse_args()
+
+    db_path = os.path.join(tempfile.mkdtemp(), "bench.db")
+    config = EngineConfig.from_env()
+    engine = get_engine(dataclasses.replace(config, db_path=db_path))
+    install_fake_llm(engine, latency=args.latency)
+
+    n = args.conversations
+    for name, runner in (("sync (threads)", run_sync), ("async (one loop)", run_async)):
+        elapsed, threads = runner(engine, n)
+        print(
+            f"{name:<18} {n} turns in {elapsed:6.2f}s  "
+            f"throughput={n / elapsed:7.1f} turns/s  extra threads held={threads}"
+        )
+
+
+if __name__ == "__main__":
+    main()
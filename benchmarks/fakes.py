@@ -0,0 +1,184 @@
+"""Offline stand-ins for the Groq chat model, used by the benchmarks."""
+
+import asyncio
+import itertools
+import random
+import time
+from typing import Any, Callable, List, Optional, Union
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+Reply = Union[AIMessage, Callable[[List[BaseMessage]], AIMessage]]
+
+
+class FakeRateLimitError(Exception):
+    """What a provider's 429 looks like to the caller."""
+
+
+class FakeChatModel(BaseChatModel):
+    """Scripted chat model with configurable latency.
+
+    `replies` is cycled; each entry is an AIMessage or a function of the
+    prompt messages returning one (e.g. to emit a tool call only on the
+    first hop). `latency` is the time before the first token, `token_delay`
+    the gap between streamed words.
+
+    To stand in for a flaky provider: `fail_rate` of the calls raise
+    FakeRateLimitError, and `slow_rate` of them take `slow_latency`
+    instead of `latency` (a latency tail). `seed` makes that repeatable.
+    """
+
+    replies: List[Any]
+    latency: float = 0.0
+    token_delay: float = 0.0
+    fail_rate: float = 0.0
+    slow_rate: float = 0.0
+    slow_latency: float = 0.0
+    seed: Optional[int] = None
+    _cycle: Any = None
+    _rng: Any = None
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+    def _delay(self) -> float:
+        """Latency of this call; raises for the injected failures."""
+        if self._rng is None:
+            self._rng = random.Random(self.seed)
+        if self._rng.random() < self.fail_rate:
+            raise FakeRateLimitError("429 Too Many Requests (fake)")
+        if self._rng.random() < self.slow_rate:
+            return self.slow_latency
+        return self.latency
+
+    def _next(self, messages: List[BaseMessage]) -> AIMessage:
+        if self._cycle is None:
+            self._cycle = itertools.cycle(self.replies)
+        reply = next(self._cycle)
+        if callable(reply):
+            reply = reply(messages)
+        return reply
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(self._delay())
+        message = self._next(messages)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        await asyncio.sleep(self._delay())
+        message = self._next(messages)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _chunks(self, message: AIMessage) -> List[ChatGenerationChunk]:
+        if message.tool_calls:
+            return [
+                ChatGenerationChunk(
+                    message=AIMessageChunk(
+                        content=message.content, tool_calls=message.tool_calls
+                    )
+                )
+            ]
+        words = message.content.split(" ")
+        return [
+            ChatGenerationChunk(
+                message=AIMessageChunk(content=word + (" " if i < len(words) - 1 else ""))
+            )
+            for i, word in enumerate(words)
+        ]
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(self._delay())
+        for i, chunk in enumerate(self._chunks(self._next(messages))):
+            if i and self.token_delay:
+                time.sleep(self.token_delay)
+            yield chunk
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        await asyncio.sleep(self._delay())
+        for i, chunk in enumerate(self._chunks(self._next(messages))):
+            if i and self.token_delay:
+                await asyncio.sleep(self.token_delay)
+            yield chunk
+
+
+def install_fake_llm(engine, replies: Optional[List[Reply]] = None, **kwargs):
+    """Swap the engine's tool-bound model (and the context summarizer) for fakes."""
+    from context import allm_summarizer, llm_summarizer
+
+    model = FakeChatModel(
+        replies=replies or [AIMessage(content="Hanji bhai, ye raha jawab.")], **kwargs
+    )
+    engine.llm_with_tools = model
+    engine.llm_final = model
+    summarizer = FakeChatModel(replies=[AIMessage(content="(fake summary)")])
+    engine.context.summarize = llm_summarizer(summarizer)
+    engine.context.asummarize = allm_summarizer(summarizer)
+    return model
+
+
+def fake_pool(hedge: bool = False, latency: float = 0.05, **kwargs):
+    """ModelPool over a flaky main backend (10% 429s, 10% one second
+    stalls) and a steady, slightly slower fallback."""
+    from model_pool import Backend, ModelPool
+
+    main = FakeChatModel(
+        replies=[tool_script],
+        latency=latency,
+        fail_rate=0.1,
+        slow_rate=0.1,
+        slow_latency=1.0,
+        seed=1,
+        **kwargs,
+    )
+    fallback = FakeChatModel(
+        replies=[tool_script], latency=latency * 2, seed=2, **kwargs
+    )
+    return ModelPool(
+        backends=[Backend("fake:main", main), Backend("fake:fallback", fallback)],
+        hedge=hedge,
+        hedge_delay=0.25,
+        hedge_min_delay=0.2,
+    )
+
+
+def tool_script(messages: List[BaseMessage]) -> AIMessage:
+    """Reply like the real model would for the tool scenarios.
+
+    First hop: "weather in X" -> get_weather(X), "weather in X, Y and Z" ->
+    get_weather_batch([X, Y, Z]), "search ..." -> web_search.
+    Once tool results are in, answer in text.
+    """
+    last = messages[-1]
+    if last.type == "tool":
+        return AIMessage(content="Ye raha result bhai, " + last.content[:40])
+    text = last.content if isinstance(last.content, str) else ""
+    calls = []
+    lowered = text.lower()
+    if "weather in " in lowered:
+        cities = lowered.split("weather in ", 1)[1].replace(" and ", ",").split(",")
+        cities = [c.strip() for c in cities if c.strip()]
+        if len(cities) > 1:
+            calls.append(
+                {"name": "get_weather_batch", "args": {"cities": cities}, "id": "w0"}
+            )
+        elif cities:
+            calls.append(
+                {"name": "get_weather", "args": {"city": cities[0]}, "id": "w0"}
+            )
+    if lowered.startswith("search "):
+        calls.append({"name": "web_search", "args": {"query": text[7:]}, "id": "s0"})
+    if calls:
+        return AIMessage(content="", tool_calls=calls)
+    return AIMessage(content="Hanji bhai, ye raha jawab.")
+
+
+def echo_reply(messages: List[BaseMessage]) -> AIMessage:
+    """Deterministic reply: repeats the last user message."""
+    last = next((m for m in reversed(messages) if m.type == "human"), None)
+    return AIMessage(content=f"echo: {last.content if last else ''}")
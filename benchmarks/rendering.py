@@ -0,0 +1,86 @@
+"""Rerun time of main.py against transcript length.
+
+Run from the repo root:
+    python -m benchmarks.rendering --lengths 10,100,500,1000 --reruns 5
+
+Each rerun is a full Streamlit script run (AppTest, no browser), like the
+one a click or keystroke triggers. Compared:
+    full, uncached   - every message drawn, HTML rebuilt (the old loop)
+    full, cached     - every message drawn, HTML from the memo
+    window (default) - only the last TRANSCRIPT_WINDOW messages drawn
+"""
+
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+os.environ.setdefault("GROQ_API_KEY", "bench-dummy-key")
+os.environ["CHAT_DB_PATH"] = os.path.join(tempfile.mkdtemp(), "bench.db")
+
+from streamlit.testing.v1 import AppTest  # noqa: E402
+
+from rendering import TRANSCRIPT_WINDOW, message_html  # noqa: E402
+
+REPLY = (
+    "Sure! Here is a **short** answer with a list:\n\n"
+    "- first point\n- second point\n\n"
+    "```python\nprint('<b>hi</b>')\n```\n"
+)
+
+
+def transcript(n):
+    messages = []
+    for i in range(n):
+        if i % 2 == 0:
+            content = f"question number {i} <please>"
+            messages.append({"role": "user", "content": content})
+        else:
+            messages.append({"role": "assistant", "content": f"{i}. {REPLY}"})
+    return messages
+
+
+def time_reruns(messages, shown, reruns, clear_cache):
+    chat = {"id": "bench", "title": "Bench chat", "created_at": "2025-01-01 00:00"}
+    at = AppTest.from_file("main.py", default_timeout=60)
+    at.session_state["current_chat"] = chat
+    at.session_state["current_chat_id"] = chat["id"]
+    at.session_state["messages"] = messages
+    at.session_state["shown_messages"] = shown
+    at.run()  # warm-up: engine, store, imports
+    samples = []
+    for _ in range(reruns):
+        if clear_cache:
+            message_html.cache_clear()
+        start = time.perf_counter()
+        at.run()
+        samples.append((time.perf_counter() - start) * 1000)
+    if at.exception:
+        raise RuntimeError(at.exception[0].value)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--lengths", default="10,100,500,1000")
+    parser.add_argument("--reruns", type=int, default=5)
+    args = parser.parse_args()
+
+    window_label = f"window ({TRANSCRIPT_WINDOW})"
+    print(
+        f"{'messages':>8}  {'full, uncached':>15}  {'full, cached':>13}  "
+        f"{window_label:>12}   (p50 ms per rerun)"
+    )
+    for n in (int(x) for x in args.lengths.split(",")):
+        messages = transcript(n)
+        full_uncached = time_reruns(messages, n, args.reruns, clear_cache=True)
+        full_cached = time_reruns(messages, n, args.reruns, clear_cache=False)
+        window = time_reruns(
+            messages, TRANSCRIPT_WINDOW, args.reruns, clear_cache=False
+        )
+        print(f"{n:>8}  {full_uncached:>15.1f}  {full_cached:>13.1f}  {window:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
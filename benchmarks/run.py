@@ -0,0 +1,293 @@
+"""Deterministic benchmark suite - no Groq, wttr.in or Google calls.
+
+Uses the scripted FakeChatModel and local fake upstreams, and prints (or
+writes) one JSON document so runs can be diffed across commits:
+
+    python -m benchmarks.run --output bench.json
+    python -m benchmarks.run --only turn_with_tools,long_history_1000
+"""
+
+import argparse
+import asyncio
+import dataclasses
+import json
+import math
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+from benchmarks.upstreams import FakeUpstreams
+
+
+def summarize(samples):
+    samples = sorted(samples)
+    ms = [s * 1000 for s in samples]
+    return {
+        "n": len(ms),
+        "mean_ms": round(statistics.mean(ms), 3),
+        "p50_ms": round(statistics.median(ms), 3),
+        "p95_ms": round(ms[math.ceil(0.95 * len(ms)) - 1], 3),
+        "min_ms": round(ms[0], 3),
+        "max_ms": round(ms[-1], 3),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Suite:
+    def __init__(self, args, workdir, upstream_url):
+        # imported late: tools reads upstream URLs from the env at import
+        from benchmarks.fakes import install_fake_llm, tool_script
+        from engine import Engine, EngineConfig, get_engine
+
+        self.args = args
+        self.upstream_url = upstream_url
+        self.Engine = Engine
+        self.config = dataclasses.replace(
+            EngineConfig.from_env(), db_path=os.path.join(workdir, "bench.db")
+        )
+        self.engine = get_engine(self.config)
+        install_fake_llm(
+            self.engine,
+            replies=[tool_script],
+            latency=args.llm_latency,
+            token_delay=1 / args.token_rate if args.token_rate else 0.0,
+        )
+
+    def _thread(self):
+        return {"configurable": {"thread_id": f"bench-{uuid.uuid4().hex[:12]}"}}
+
+    async def _turn(self, graph, prompt, config=None):
+        from langchain_core.messages import HumanMessage
+
+        config = config or self._thread()
+        start = time.perf_counter()
+        await graph.ainvoke({"messages": [HumanMessage(content=prompt)]}, config)
+        return time.perf_counter() - start
+
+    def _clear_tool_caches(self):
+        import pages
+        import tools
+
+        tools.weather_cache.clear()
+        tools.search_cache.clear()
+        pages.page_cache.clear()
+
+    # ---- scenarios ----
+
+    def compile(self):
+        samples = []
+        for _ in range(self.args.compile_runs):
+            start = time.perf_counter()
+            self.engine._build_graph(self.engine.checkpointer)
+            samples.append(time.perf_counter() - start)
+        return summarize(samples)
+
+    def engine_init(self):
+        # model client + checkpointer + compile, what a cold process pays
+        samples = []
+        for _ in range(self.args.compile_runs):
+            start = time.perf_counter()
+            self.Engine(self.config).close()
+            samples.append(time.perf_counter() - start)
+        return summarize(samples)
+
+    async def turn_no_tools(self, graph):
+        return summarize(
+            [await self._turn(graph, "hello bhai") for _ in range(self.args.turns)]
+        )
+
+    async def turn_with_tools(self, graph):
+        samples = []
+        for _ in range(self.args.turns):
+            self._clear_tool_caches()
+            samples.append(
+                await self._turn(graph, "weather in Pune, Delhi and Mumbai")
+            )
+        return summarize(samples)
+
+    async def turn_with_search(self, graph):
+        samples = []
+        for _ in range(self.args.turns):
+            self._clear_tool_caches()
+            samples.append(await self._turn(graph, "search latest AI news"))
+        return summarize(samples)
+
+    async def fetch_pages(self, graph):
+        """fetch_pages tool alone: 5 pages, cold cache."""
+        import tools
+
+        urls = [f"{self.upstream_url}/page/{i}" for i in range(5)]
+        samples = []
+        for _ in range(self.args.turns):
+            self._clear_tool_caches()
+            start = time.perf_counter()
+            await tools.fetch_pages.ainvoke({"urls": urls, "query": "monsoon mumbai"})
+            samples.append(time.perf_counter() - start)
+        return summarize(samples)
+
+    async def model_pool(self, graph):
+        """Plain turns through a ModelPool with a flaky main backend:
+        failover alone, then with hedged requests."""
+        from benchmarks.fakes import fake_pool
+
+        token_delay = 1 / self.args.token_rate if self.args.token_rate else 0.0
+        saved = self.engine.llm_with_tools
+        results = {}
+        try:
+            for hedge in (False, True):
+                self.engine.llm_with_tools = fake_pool(
+                    hedge=hedge, latency=self.args.llm_latency, token_delay=token_delay
+                )
+                samples = []
+                for _ in range(self.args.turns):
+                    samples.append(await self._turn(graph, "hello bhai"))
+                results["hedged" if hedge else "failover"] = summarize(samples)
+        finally:
+            self.engine.llm_with_tools = saved
+        return results
+
+    async def rate_limited_sessions(self, graph):
+        """Concurrent sessions behind a Groq limit of 20 requests/s (burst 5):
+        they should queue, not fail."""
+        from rate_limit import Bucket, MemoryBuckets, RateLimiter
+
+        saved = self.engine.limiter
+        self.engine.limiter = RateLimiter(
+            "groq", [Bucket("bench:requests", "requests", 5, 20.0)], MemoryBuckets(), 30
+        )
+        try:
+            result = await self.concurrent_sessions(graph)
+            result["rejected"] = self.engine.limiter.rejected
+        finally:
+            self.engine.limiter = saved
+        return result
+
+    async def _long_history(self, graph, size):
+        from langchain_core.messages import AIMessage, HumanMessage
+
+        samples = []
+        for _ in range(max(1, self.args.turns // 4)):
+            config = self._thread()
+            history = []
+            for i in range(size // 2):
+                history.append(HumanMessage(content=f"question {i} " + "lorem " * 30))
+                history.append(AIMessage(content=f"answer {i} " + "ipsum " * 60))
+            await graph.aupdate_state(config, {"messages": history})
+            samples.append(await self._turn(graph, "aur batao", config))
+        return summarize(samples)
+
+    async def long_history_100(self, graph):
+        return await self._long_history(graph, 100)
+
+    async def long_history_1000(self, graph):
+        return await self._long_history(graph, 1000)
+
+    async def concurrent_sessions(self, graph):
+        n = self.args.sessions
+        start = time.perf_counter()
+        latencies = await asyncio.gather(
+            *(self._turn(graph, "hello bhai") for _ in range(n))
+        )
+        elapsed = time.perf_counter() - start
+        result = summarize(latencies)
+        result["sessions"] = n
+        result["wall_s"] = round(elapsed, 3)
+        result["turns_per_s"] = round(n / elapsed, 2)
+        return result
+
+    async def run_async(self, names):
+        graph = await self.engine.aget_graph()
+        results = {}
+        for name in names:
+            results[name] = await getattr(self, name)(graph)
+        return results
+
+
+ASYNC_SCENARIOS = [
+    "turn_no_tools",
+    "turn_with_tools",
+    "turn_with_search",
+    "fetch_pages",
+    "model_pool",
+    "long_history_100",
+    "long_history_1000",
+    "concurrent_sessions",
+    "rate_limited_sessions",
+]
+SYNC_SCENARIOS = ["compile", "engine_init"]
+SCENARIOS = SYNC_SCENARIOS + ASYNC_SCENARIOS
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--output", help="write JSON here instead of stdout")
+    parser.add_argument("--only", help="comma separated scenarios: " + ",".join(SCENARIOS))
+    parser.add_argument("--turns", type=int, default=20)
+    parser.add_argument("--sessions", type=int, default=50)
+    parser.add_argument("--compile-runs", type=int, default=5)
+    parser.add_argument("--llm-latency", type=float, default=0.05)
+    parser.add_argument("--token-rate", type=float, default=500, help="tokens/s, 0 = instant")
+    parser.add_argument("--upstream-delay", type=float, default=0.05)
+    args = parser.parse_args(argv)
+
+    names = args.only.split(",") if args.only else SCENARIOS
+    unknown = set(names) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    workdir = tempfile.mkdtemp(prefix="bench-")
+    upstreams = FakeUpstreams(delay=args.upstream_delay).start()
+    os.environ.update(
+        GROQ_API_KEY=os.environ.get("GROQ_API_KEY", "bench-dummy-key"),
+        WTTR_URL=f"{upstreams.url}/weather",
+        GOOGLE_CSE_URL=f"{upstreams.url}/search",
+        SEARCH_CACHE_DB=os.path.join(workdir, "search.db"),
+        PAGE_ALLOW_PRIVATE="1",
+    )
+
+    suite = Suite(args, workdir, upstreams.url)
+    results = {}
+    for name in SYNC_SCENARIOS:
+        if name in names:
+            results[name] = getattr(suite, name)()
+    results.update(
+        asyncio.run(suite.run_async([n for n in names if n in ASYNC_SCENARIOS]))
+    )
+    upstreams.stop()
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "params": {
+            k: v for k, v in vars(args).items() if k not in ("output", "only")
+        },
+        "upstream_requests": upstreams.requests,
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
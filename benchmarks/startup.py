@@ -0,0 +1,58 @@
+"""Per-rerun startup overhead: building the engine every rerun vs the shared engine.
+
+Run from the repo root:
+    python -m benchmarks.startup --reruns 20
+
+No network calls are made - building the Groq client does not talk to Groq,
+so a dummy API key is enough.
+"""
+
+import argparse
+import os
+import statistics
+import time
+
+os.environ.setdefault("GROQ_API_KEY", "bench-dummy-key")
+
+from engine import Engine, EngineConfig, get_engine, reset_engine  # noqa: E402
+
+
+def _time(fn, runs):
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def _report(name, samples):
+    print(
+        f"{name:<28} mean={statistics.mean(samples):8.3f} ms  "
+        f"p50={statistics.median(samples):8.3f} ms  max={max(samples):8.3f} ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--reruns", type=int, default=20)
+    args = parser.parse_args()
+
+    config = EngineConfig.from_env()
+
+    # before: old main.py built client + tools + graph on every rerun
+    before = _time(lambda: Engine(config).close(), args.reruns)
+
+    # after: first call builds, every later rerun is a lookup
+    reset_engine()
+    cold = _time(lambda: get_engine(config), 1)
+    after = _time(lambda: get_engine(config), args.reruns)
+
+    _report("before (build per rerun)", before)
+    _report("after: first rerun", cold)
+    _report("after: warm rerun", after)
+    print(f"speedup per warm rerun: {statistics.mean(before) / max(statistics.mean(after), 1e-9):.0f}x")
+
+
+if __name__ == "__main__":
+    main()
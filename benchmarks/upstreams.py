@@ -0,0 +1,110 @@
+"""Local HTTP stand-ins for wttr.in and the Google Custom Search API."""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+
+def article(path: str) -> str:
+    """~50 KB HTML page with chrome, a script and 400 paragraphs; one
+    mentions the monsoon so relevance ranking has something to find."""
+    paragraphs = [
+        f"<p>Paragraph {i} of {path} talks about cricket, trains and "
+        f"street food in some detail, just like a normal news page does.</p>"
+        for i in range(400)
+    ]
+    paragraphs[237] = (
+        "<p>The monsoon reached Kerala on 1 June this year, and heavy rain "
+        "is expected across Mumbai by the second week.</p>"
+    )
+    return (
+        f"<html><head><title>Article {path}</title>"
+        "<script>var x = '<p>not text</p>';</script></head><body>"
+        "<nav><a href='/'>Home</a> | <a href='/news'>News</a></nav>"
+        + "".join(paragraphs)
+        + "<footer>Copyright 2025 Example News</footer></body></html>"
+    )
+
+
+class FakeUpstreams:
+    """One local server answering both upstreams with a fixed delay.
+
+        /weather/<city>?format=...   -> "Sunny +25°C (<city>)" (wttr.in style)
+        /search?q=...                -> Custom Search JSON with 5 items
+        /page/<n>                    -> ~40 KB article, ETag "page-<n>"
+                                        (304 on a matching If-None-Match)
+
+    Point the tools at it with WTTR_URL=<url>/weather and
+    GOOGLE_CSE_URL=<url>/search (set before importing tools).
+    """
+
+    def __init__(self, delay: float = 0.05, port: int = 0):
+        self.delay = delay
+        self.requests = 0
+        upstreams = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                upstreams.requests += 1
+                time.sleep(upstreams.delay)
+                url = urlsplit(self.path)
+                if url.path.startswith("/weather/"):
+                    city = unquote(url.path[len("/weather/"):])
+                    body = f"Sunny +25°C ({city})".encode("utf-8")
+                    content_type = "text/plain; charset=utf-8"
+                elif url.path == "/search":
+                    query = parse_qs(url.query).get("q", [""])[0]
+                    items = [
+                        {
+                            "title": f"Result {i} for {query}",
+                            "link": f"https://example.com/{i}",
+                            "snippet": f"Snippet {i} about {query}.",
+                        }
+                        for i in range(1, 6)
+                    ]
+                    body = json.dumps({"items": items}).encode("utf-8")
+                    content_type = "application/json"
+                elif url.path.startswith("/page/"):
+                    etag = f'"page-{url.path[len("/page/"):]}"'
+                    if self.headers.get("If-None-Match") == etag:
+                        self.send_response(304)
+                        self.send_header("ETag", etag)
+                        self.send_header("Content-Length", "0")
+                        self.end_headers()
+                        return
+                    body = article(url.path).encode("utf-8")
+                    content_type = "text/html; charset=utf-8"
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                if url.path.startswith("/page/"):
+                    self.send_header("ETag", etag)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,115 @@
+"""Per-turn budget for the chatbot <-> tools loop.
+
+Without a cap a model that keeps calling web_search can hold a worker
+for minutes. Every turn gets a budget in graph state:
+
+    {"deadline": epoch seconds, "tool_rounds": rounds used,
+     "tokens": LLM tokens used, "exhausted": reason or None}
+
+The chatbot node starts it on the first hop of a turn and checks it
+before each model call. Once any limit is hit the model is asked for a
+best-effort answer from what it has, with tool calls switched off. The
+tools node passes the time left down to every tool call and, through a
+context variable, to the HTTP client's timeouts.
+"""
+
+import contextvars
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+from langchain_core.messages import HumanMessage, SystemMessage
+
+from metrics import metrics
+
+# deadline of the turn whose tools are running (epoch seconds)
+_deadline: contextvars.ContextVar = contextvars.ContextVar(
+    "turn_deadline", default=None
+)
+
+WRAP_UP_PROMPT = (
+    "Is turn ka tool budget khatam ho gaya ({reason}). Ab koi tool call mat "
+    "karo - jo data upar mil chuka hai usi se best possible answer do, aur "
+    "agar kuch missing hai to user ko short me bata do."
+)
+
+# wrap-up reply when the model still asks for a tool and writes nothing
+FALLBACK_REPLY = (
+    "Maaf karna, is sawal ke liye mera time / tool budget khatam ho gaya. "
+    "Thoda specific karke dobara poochoge to jaldi bata dunga!"
+)
+
+REASONS = {
+    "tool_rounds": "tool rounds limit",
+    "time": "time limit",
+    "tokens": "token limit",
+}
+
+
+@dataclass(frozen=True)
+class TurnLimits:
+    max_tool_rounds: int = 4
+    max_seconds: float = 60.0
+    max_tokens: int = 20000
+
+    def start(self) -> Dict:
+        return {
+            "deadline": time.time() + self.max_seconds,
+            "tool_rounds": 0,
+            "tokens": 0,
+            "exhausted": None,
+        }
+
+
+def current(state, limits: TurnLimits) -> Dict:
+    """This turn's budget: a fresh one on the first hop (last message is
+    the user's), else the one carried in state from the earlier hops."""
+    budget = state.get("budget")
+    if budget is None or isinstance(state["messages"][-1], HumanMessage):
+        return limits.start()
+    return dict(budget)
+
+
+def check(budget: Dict, limits: TurnLimits) -> Optional[str]:
+    """Name of the first limit this turn has hit, or None."""
+    if budget["exhausted"]:
+        return budget["exhausted"]
+    if budget["tool_rounds"] >= limits.max_tool_rounds:
+        return "tool_rounds"
+    if remaining(budget["deadline"]) <= 0:
+        return "time"
+    if budget["tokens"] >= limits.max_tokens:
+        return "tokens"
+    return None
+
+
+def exhaust(budget: Dict, reason: str):
+    """Mark the budget used up; counted once per turn."""
+    if budget["exhausted"]:
+        return
+    budget["exhausted"] = reason
+    metrics.inc("turn_budget_exhausted_total", reason=reason)
+
+
+def wrap_up_message(reason: str) -> SystemMessage:
+    return SystemMessage(content=WRAP_UP_PROMPT.format(reason=REASONS[reason]))
+
+
+def remaining(deadline: Optional[float] = None) -> Optional[float]:
+    """Seconds left until `deadline` (default: the running turn's), or None."""
+    if deadline is None:
+        deadline = _deadline.get()
+        if deadline is None:
+            return None
+    return deadline - time.time()
+
+
+@contextmanager
+def deadline_scope(deadline: Optional[float]):
+    """Make `deadline` the one remaining() and the HTTP client see."""
+    token = _deadline.set(deadline)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
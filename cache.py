@@ -0,0 +1,473 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from storage import open_sqlite
+
+
+def cache_path(name: str) -> str:
+    """Default spot for an on-disk cache: the user's cache directory
+    ($XDG_CACHE_HOME or ~/.cache), never the source tree or the cwd."""
+    base = os.getenv("XDG_CACHE_HOME") or os.path.join(
+        os.path.expanduser("~"), ".cache"
+    )
+    return os.path.join(base, "gpt-burrito", name)
+
+
+class SharedStore:
+    """Tiny key/value table in a local SQLite file, shared by server workers.
+
+    Values are JSON; each row carries its own expiry time (wall clock, so
+    every process agrees on it).
+    """
+
+    def __init__(self, path: str, namespace: str):
+        self.path = path
+        self.namespace = namespace
+        self._conn = open_sqlite(path)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS kv_cache (
+                    namespace TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    expires_at REAL NOT NULL,
+                    PRIMARY KEY (namespace, key)
+                )
+                """
+            )
+
+    def get(self, key: str) -> Optional[Tuple[Any, float]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM kv_cache WHERE namespace = ? AND key = ?",
+                (self.namespace, key),
+            ).fetchone()
+        if row is None or row[1] <= time.time():
+            return None
+        return json.loads(row[0]), row[1]
+
+    def set(self, key: str, value: Any, expires_at: float):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO kv_cache (namespace, key, value, expires_at) "
+                "VALUES (?, ?, ?, ?)",
+                (self.namespace, key, json.dumps(value), expires_at),
+            )
+
+    def purge_expired(self):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "DELETE FROM kv_cache WHERE namespace = ? AND expires_at <= ?",
+                (self.namespace, time.time()),
+            )
+
+
+class _Flight:
+    """One in-progress load that other callers can wait on."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value: Any = None
+        self.error: Optional[BaseException] = None
+
+
+def _retrieve(task: asyncio.Task):
+    if not task.cancelled():
+        task.exception()
+
+
+class TTLCache:
+    """Bounded LRU cache where every entry also expires after `ttl` seconds.
+
+    get_or_load() coalesces concurrent misses for the same key into one
+    call of the loader (single-flight). Loader exceptions are not cached.
+    With a SharedStore, a local miss checks the shared table before
+    loading, so several worker processes share one upstream fetch.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 256,
+        ttl: float = 600.0,
+        shared: Optional[SharedStore] = None,
+    ):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.shared = shared
+        # key -> (value, expires_at as time.time())
+        self._data: "OrderedDict[str, Tuple[Any, float]]" = OrderedDict()
+        self._flights: Dict[str, _Flight] = {}
+        # (loop, key) -> load task, for async callers on the same event loop
+        self._aflights: Dict[Tuple[int, str], asyncio.Task] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.coalesced = 0
+        self.shared_hits = 0
+
+    def _get_local(self, key: str):
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        if entry[1] <= time.time():
+            del self._data[key]
+            self.expirations += 1
+            return None
+        self._data.move_to_end(key)
+        return entry
+
+    def _put_local(self, key: str, value: Any, expires_at: float):
+        self._data[key] = (value, expires_at)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._get_local(key)
+        return None if entry is None else entry[0]
+
+    def set(self, key: str, value: Any):
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            self._put_local(key, value, expires_at)
+        if self.shared is not None:
+            self.shared.set(key, value, expires_at)
+
+    def get_many(self, keys: List[str]) -> Dict[str, Any]:
+        """Cached values for `keys` (local, then shared); misses are left out
+        so the caller can load them together."""
+        found = {}
+        for key in dict.fromkeys(keys):
+            with self._lock:
+                entry = self._get_local(key)
+            value = entry[0] if entry is not None else self._get_shared(key)
+            with self._lock:
+                if value is None:
+                    self.misses += 1
+                else:
+                    self.hits += 1
+            if value is not None:
+                found[key] = value
+        return found
+
+    def get_or_load(self, key: str, loader: Callable[[str], Any]) -> Any:
+        with self._lock:
+            entry = self._get_local(key)
+            if entry is not None:
+                self.hits += 1
+                return entry[0]
+            flight = self._flights.get(key)
+            if flight is not None:
+                self.coalesced += 1
+                leader = False
+            else:
+                self.misses += 1
+                flight = self._flights[key] = _Flight()
+                leader = True
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            value = self._load(key, loader)
+            flight.value = value
+            return value
+        except BaseException as exc:
+            flight.error = exc
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+            flight.done.set()
+
+    async def aget_or_load(
+        self, key: str, loader: Callable[[str], Awaitable[Any]]
+    ) -> Any:
+        """Async get_or_load(); coalesces concurrent misses on one event loop.
+
+        The load runs as its own task, so a caller that is cancelled (a tool
+        timeout, the turn's deadline) leaves it running for everyone else.
+        """
+        loop = asyncio.get_running_loop()
+        flight_key = (id(loop), key)
+        with self._lock:
+            entry = self._get_local(key)
+            if entry is not None:
+                self.hits += 1
+                return entry[0]
+            flight = self._aflights.get(flight_key)
+            if flight is not None:
+                self.coalesced += 1
+            else:
+                self.misses += 1
+                flight = self._aflights[flight_key] = loop.create_task(
+                    self._aload(flight_key, key, loader)
+                )
+                # every caller may be gone by the time it fails
+                flight.add_done_callback(_retrieve)
+        # shield: a cancelled caller must not cancel the shared load
+        return await asyncio.shield(flight)
+
+    async def _aload(
+        self, flight_key, key: str, loader: Callable[[str], Awaitable[Any]]
+    ) -> Any:
+        try:
+            if self.shared is None:
+                value = await loader(key)
+                self.set(key, value)
+                return value
+            # the shared table is SQLite: keep it off the event loop
+            value = await asyncio.to_thread(self._get_shared, key)
+            if value is None:
+                value = await loader(key)
+                await asyncio.to_thread(self.set, key, value)
+            return value
+        finally:
+            with self._lock:
+                self._aflights.pop(flight_key, None)
+
+    def _get_shared(self, key: str) -> Optional[Any]:
+        if self.shared is None:
+            return None
+        entry = self.shared.get(key)
+        if entry is None:
+            return None
+        with self._lock:
+            self.shared_hits += 1
+            self._put_local(key, entry[0], entry[1])
+        return entry[0]
+
+    def _load(self, key: str, loader: Callable[[str], Any]) -> Any:
+        value = self._get_shared(key)
+        if value is not None:
+            return value
+        value = loader(key)
+        self.set(key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "size": len(self._data),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "coalesced": self.coalesced,
+                "shared_hits": self.shared_hits,
+            }
+
+
+class DiskCache:
+    """Persistent SQLite cache with TTL, size-based LRU eviction and
+    stale-while-revalidate.
+
+    A fresh hit returns straight from disk. An entry past its TTL but
+    still inside the `stale` window is returned right away too, and a
+    background refresh replaces it. Only entries older than ttl + stale
+    block on the loader.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        namespace: str,
+        ttl: float = 3600.0,
+        stale: float = 86400.0,
+        max_bytes: int = 50 * 1024 * 1024,
+        refresh_workers: int = 2,
+    ):
+        self.path = path
+        self.namespace = namespace
+        self.ttl = ttl
+        self.stale = stale
+        self.max_bytes = max_bytes
+        # opened on first use, so importing the tools touches no disk
+        self._db: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._refreshing = set()
+        self._refresher = ThreadPoolExecutor(
+            max_workers=refresh_workers, thread_name_prefix=f"{namespace}-refresh"
+        )
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.refresh_errors = 0
+
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        # caller holds the lock
+        if self._db is None:
+            conn = open_sqlite(self.path)
+            with conn:
+                conn.executescript(
+                    """
+                    CREATE TABLE IF NOT EXISTS disk_cache (
+                        namespace TEXT NOT NULL,
+                        key TEXT NOT NULL,
+                        value TEXT NOT NULL,
+                        size INTEGER NOT NULL,
+                        expires_at REAL NOT NULL,
+                        accessed_at REAL NOT NULL,
+                        PRIMARY KEY (namespace, key)
+                    );
+                    CREATE INDEX IF NOT EXISTS disk_cache_lru
+                        ON disk_cache (namespace, accessed_at);
+                    """
+                )
+            self._db = conn
+        return self._db
+
+    def _read(self, key: str) -> Optional[Tuple[str, float]]:
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM disk_cache WHERE namespace = ? AND key = ?",
+                (self.namespace, key),
+            ).fetchone()
+            if row is not None:
+                self._conn.execute(
+                    "UPDATE disk_cache SET accessed_at = ? WHERE namespace = ? AND key = ?",
+                    (time.time(), self.namespace, key),
+                )
+        return row
+
+    def peek(self, key: str) -> Optional[Tuple[str, float]]:
+        """(value, expires_at) even if expired, for callers that revalidate
+        entries themselves (e.g. with an ETag). Not counted in stats()."""
+        return self._read(key)
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None):
+        now = time.time()
+        expires_at = now + (self.ttl if ttl is None else ttl)
+        size = len(value.encode("utf-8"))
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO disk_cache "
+                "(namespace, key, value, size, expires_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (self.namespace, key, value, size, expires_at, now),
+            )
+            self._evict()
+
+    def _evict(self):
+        # caller holds the lock and the transaction
+        total = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM disk_cache WHERE namespace = ?",
+            (self.namespace,),
+        ).fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = self._conn.execute(
+            "SELECT key, size FROM disk_cache WHERE namespace = ? ORDER BY accessed_at",
+            (self.namespace,),
+        ).fetchall()
+        doomed = []
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            doomed.append((self.namespace, key))
+            total -= size
+        self._conn.executemany(
+            "DELETE FROM disk_cache WHERE namespace = ? AND key = ?", doomed
+        )
+        self.evictions += len(doomed)
+
+    def _refresh(self, key: str, loader: Callable[[str], str]):
+        try:
+            self.set(key, loader(key))
+        except Exception:
+            with self._lock:
+                self.refresh_errors += 1
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def _lookup(self, key: str, loader: Callable[[str], str]) -> Optional[str]:
+        """Fresh or stale value (scheduling a refresh for stale), None on miss."""
+        row = self._read(key)
+        now = time.time()
+        if row is not None:
+            value, expires_at = row
+            if expires_at > now:
+                with self._lock:
+                    self.hits += 1
+                return value
+            if expires_at + self.stale > now:
+                with self._lock:
+                    self.stale_hits += 1
+                    refresh = key not in self._refreshing
+                    self._refreshing.add(key)
+                if refresh:
+                    self._refresher.submit(self._refresh, key, loader)
+                return value
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def get_or_load(self, key: str, loader: Callable[[str], str]) -> str:
+        value = self._lookup(key, loader)
+        if value is not None:
+            return value
+        value = loader(key)
+        self.set(key, value)
+        return value
+
+    async def aget_or_load(
+        self,
+        key: str,
+        aloader: Callable[[str], Awaitable[str]],
+        loader: Callable[[str], str],
+    ) -> str:
+        """Async variant; the SQLite work runs on a worker thread, off the
+        event loop. The background refresh still uses the sync `loader` so
+        it does not depend on the caller's event loop staying alive."""
+        value = await asyncio.to_thread(self._lookup, key, loader)
+        if value is not None:
+            return value
+        value = await aloader(key)
+        await asyncio.to_thread(self.set, key, value)
+        return value
+
+    def clear(self):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "DELETE FROM disk_cache WHERE namespace = ?", (self.namespace,)
+            )
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            size, count = self._conn.execute(
+                "SELECT COALESCE(SUM(size), 0), COUNT(*) FROM disk_cache WHERE namespace = ?",
+                (self.namespace,),
+            ).fetchone()
+            return {
+                "entries": count,
+                "bytes": size,
+                "hits": self.hits,
+                "stale_hits": self.stale_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "refresh_errors": self.refresh_errors,
+            }
@@ -0,0 +1,287 @@
+import json
+import logging
+import threading
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from langchain_core.messages import (
+    AIMessage,
+    BaseMessage,
+    HumanMessage,
+    SystemMessage,
+)
+from langgraph.constants import TAG_NOSTREAM
+
+from rate_limit import llm_costs
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_PROMPT = """Neeche ek conversation ka purana hissa hai. Isko short summary me likho
+(max ~150 words) - user kaun hai, kya pooch raha tha, kya answers / tool results mile,
+aur koi pending kaam. Sirf facts, koi greeting nahi.
+
+Previous summary (agar hai):
+{previous}
+
+New messages:
+{messages}
+"""
+
+
+def count_tokens(text: str) -> int:
+    """Cheap token estimate (~4 chars per token), good enough for budgeting."""
+    return (len(text) + 3) // 4
+
+
+def _message_text(message: BaseMessage) -> str:
+    content = message.content
+    if not isinstance(content, str):
+        content = json.dumps(content, ensure_ascii=False)
+    if isinstance(message, AIMessage) and message.tool_calls:
+        content += json.dumps(message.tool_calls, ensure_ascii=False)
+    return content
+
+
+def estimate_tokens(messages: List[BaseMessage]) -> int:
+    """count_tokens() of a whole request, role/format overhead included."""
+    return sum(count_tokens(_message_text(m)) + 4 for m in messages)
+
+
+class ContextWindow:
+    """Keeps the prompt sent to the model inside a token budget.
+
+    The system prompt and the most recent turns are sent as-is. Turns that
+    no longer fit are folded into a rolling summary, a few bounded chunks
+    per call. The summary and how many messages it covers are returned to
+    the caller, which keeps them in graph state (State["context"]), so they
+    survive restarts and every worker sees the same ones.
+    """
+
+    def __init__(
+        self,
+        max_tokens: int = 8000,
+        summarize: Optional[Callable[[str, List[BaseMessage]], str]] = None,
+        asummarize: Optional[
+            Callable[[str, List[BaseMessage]], Awaitable[str]]
+        ] = None,
+        summary_tokens: int = 300,
+        slack: float = 0.25,
+        fold_tokens: int = 4000,
+        max_folds: int = 3,
+    ):
+        self.max_tokens = max_tokens
+        self.summarize = summarize
+        self.asummarize = asummarize
+        self.summary_tokens = summary_tokens
+        # when trimming, drop a bit more than needed so the window (and the
+        # summary) does not move on every single turn
+        self.slack = slack
+        # most history one summarizer call sees, and calls per build(); a
+        # long backlog (e.g. an old chat with no summary yet) is caught up
+        # over several turns
+        self.fold_tokens = fold_tokens
+        self.max_folds = max_folds
+        self._token_cache: "OrderedDict[str, int]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def message_tokens(self, message: BaseMessage) -> int:
+        key = message.id or str(hash((message.type, _message_text(message))))
+        with self._lock:
+            tokens = self._token_cache.get(key)
+            if tokens is not None:
+                self._token_cache.move_to_end(key)
+                return tokens
+        tokens = estimate_tokens([message])
+        with self._lock:
+            self._token_cache[key] = tokens
+            while len(self._token_cache) > 50_000:
+                self._token_cache.popitem(last=False)
+        return tokens
+
+    def _turn_starts(self, messages: List[BaseMessage]) -> List[int]:
+        # only cut in front of a HumanMessage, so a tool call is never
+        # separated from its result
+        return [i for i, m in enumerate(messages) if isinstance(m, HumanMessage)]
+
+    def _find_cut(self, messages: List[BaseMessage], budget: int, cut: int) -> int:
+        """Smallest turn start >= cut whose tail fits in budget."""
+        base = cut
+        tokens = [self.message_tokens(m) for m in messages[base:]]
+        tail = sum(tokens)
+        if tail <= budget:
+            return cut
+
+        target = int(budget * (1 - self.slack))
+        starts = [i for i in self._turn_starts(messages) if i > cut]
+        for start in starts:
+            tail -= sum(tokens[cut - base : start - base])
+            cut = start
+            if tail <= target:
+                return cut
+        # even the last turn alone is too big - keep it anyway
+        return starts[-1] if starts else cut
+
+    def _plan(
+        self,
+        saved: Optional[Dict],
+        system: SystemMessage,
+        messages: List[BaseMessage],
+    ) -> Tuple[int, str, int]:
+        """Return (folded so far, summary, new cut) for this turn."""
+        budget = self.max_tokens - self.message_tokens(system)
+
+        saved = saved or {}
+        folded, summary = saved.get("folded", 0), saved.get("summary", "")
+        if folded > len(messages):
+            # history was rewritten (e.g. chat reset) - start over
+            folded, summary = 0, ""
+
+        if summary:
+            budget -= self.summary_tokens
+        cut = self._find_cut(messages, budget, folded)
+        if cut > folded and not summary:
+            budget -= self.summary_tokens
+            cut = self._find_cut(messages, budget, cut)
+        return folded, summary, cut
+
+    def _chunks(
+        self, messages: List[BaseMessage], folded: int, cut: int
+    ) -> List[Tuple[int, int]]:
+        """Up to max_folds (start, end) pieces of messages[folded:cut], split
+        at turn starts, each within fold_tokens unless one turn is bigger."""
+        chunks: List[Tuple[int, int]] = []
+        start = end = folded
+        tokens = 0
+        bounds = [i for i in self._turn_starts(messages) if folded < i < cut]
+        for bound in bounds + [cut]:
+            size = sum(self.message_tokens(m) for m in messages[end:bound])
+            if end > start and tokens + size > self.fold_tokens:
+                chunks.append((start, end))
+                start, tokens = end, 0
+            tokens += size
+            end = bound
+        if start < end:
+            chunks.append((start, end))
+        return chunks[: self.max_folds]
+
+    def _assemble(
+        self, system: SystemMessage, summary: str, messages: List[BaseMessage]
+    ) -> List[BaseMessage]:
+        result: List[BaseMessage] = [system]
+        if summary:
+            result.append(
+                SystemMessage(content=f"Earlier conversation summary:\n{summary}")
+            )
+        return result + list(messages)
+
+    def build(
+        self,
+        system_prompt: str,
+        messages: List[BaseMessage],
+        saved: Optional[Dict] = None,
+    ) -> Tuple[List[BaseMessage], Dict]:
+        """Return the messages to send (system prompt, summary, recent turns)
+        and the context to save: {"folded": n, "summary": text}."""
+        system = SystemMessage(content=system_prompt)
+        folded, summary, cut = self._plan(saved, system, messages)
+        for start, end in self._chunks(messages, folded, cut):
+            try:
+                summary = self._fold(summary, messages[start:end])
+            except Exception:
+                # folded stays put: these turns are retried on the next call
+                logger.exception("context summary failed, will retry next turn")
+                break
+            folded = end
+        # turns still not folded are left out of this call, not forgotten
+        return self._assemble(system, summary, messages[cut:]), {
+            "folded": folded,
+            "summary": summary,
+        }
+
+    async def abuild(
+        self,
+        system_prompt: str,
+        messages: List[BaseMessage],
+        saved: Optional[Dict] = None,
+    ) -> Tuple[List[BaseMessage], Dict]:
+        """Async build(); the summary calls do not block the event loop."""
+        system = SystemMessage(content=system_prompt)
+        folded, summary, cut = self._plan(saved, system, messages)
+        for start, end in self._chunks(messages, folded, cut):
+            try:
+                summary = await self._afold(summary, messages[start:end])
+            except Exception:
+                logger.exception("context summary failed, will retry next turn")
+                break
+            folded = end
+        return self._assemble(system, summary, messages[cut:]), {
+            "folded": folded,
+            "summary": summary,
+        }
+
+    def _fold(self, previous: str, messages: List[BaseMessage]) -> str:
+        if self.summarize is None:
+            # no summarizer: old turns are just dropped
+            return previous
+        return self.summarize(previous, messages)
+
+    async def _afold(self, previous: str, messages: List[BaseMessage]) -> str:
+        if self.asummarize is None:
+            return self._fold(previous, messages)
+        return await self.asummarize(previous, messages)
+
+
+def _summary_request(previous: str, messages: List[BaseMessage]) -> List[BaseMessage]:
+    lines = [f"{m.type}: {_message_text(m)}" for m in messages]
+    prompt = SUMMARY_PROMPT.format(
+        previous=previous or "(none)", messages="\n".join(lines)
+    )
+    return [HumanMessage(content=prompt)]
+
+
+# nostream: keep summary tokens out of the live reply bubble
+_SUMMARY_CONFIG = {"tags": [TAG_NOSTREAM]}
+
+
+def _usage(message: AIMessage) -> int:
+    usage = getattr(message, "usage_metadata", None) or {}
+    return usage.get("input_tokens", 0) + usage.get("output_tokens", 0)
+
+
+def llm_summarizer(llm, limiter=None) -> Callable[[str, List[BaseMessage]], str]:
+    """Summarizer that asks `llm` (no tools bound) to extend the summary;
+    with a RateLimiter each call waits its turn like a chatbot call."""
+
+    def summarize(previous: str, messages: List[BaseMessage]) -> str:
+        request = _summary_request(previous, messages)
+        if limiter is None:
+            return llm.invoke(request, config=_SUMMARY_CONFIG).content
+        costs = llm_costs(estimate_tokens(request))
+        limiter.acquire(costs)
+        result = llm.invoke(request, config=_SUMMARY_CONFIG)
+        used = _usage(result)
+        if used:
+            limiter.settle("tokens", used - costs["tokens"])
+        return result.content
+
+    return summarize
+
+
+def allm_summarizer(
+    llm, limiter=None
+) -> Callable[[str, List[BaseMessage]], Awaitable[str]]:
+    """Async llm_summarizer()."""
+
+    async def asummarize(previous: str, messages: List[BaseMessage]) -> str:
+        request = _summary_request(previous, messages)
+        if limiter is None:
+            return (await llm.ainvoke(request, config=_SUMMARY_CONFIG)).content
+        costs = llm_costs(estimate_tokens(request))
+        await limiter.aacquire(costs)
+        result = await llm.ainvoke(request, config=_SUMMARY_CONFIG)
+        used = _usage(result)
+        if used:
+            limiter.settle("tokens", used - costs["tokens"])
+        return result.content
+
+    return asummarize
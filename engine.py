@@ -0,0 +1,581 @@
+import asyncio
+import logging
+import os
+import threading
+import weakref
+from concurrent.futures import Future
+from dataclasses import dataclass
+from typing import Annotated, Any, Awaitable, Dict, List, Optional, Tuple
+
+import aiosqlite
+from dotenv import load_dotenv
+from langchain.chat_models import init_chat_model
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.runnables import RunnableConfig, RunnableLambda
+from langgraph.checkpoint.sqlite import SqliteSaver
+from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+from langgraph.graph import StateGraph, START, END
+from langgraph.graph.message import add_messages
+from langgraph.prebuilt import tools_condition
+from typing_extensions import TypedDict
+
+import budget
+from budget import TurnLimits
+from context import ContextWindow, allm_summarizer, llm_summarizer
+from metrics import metrics
+from model_pool import Backend, ModelPool
+from rate_limit import BUSY_REPLY, RateLimited, chat_scope, get_limiter, llm_costs
+from response_cache import ResponseCache
+from router import PreRouter, route_after_router
+from storage import open_sqlite
+from tool_history import compact_history, history_messages
+from tool_runner import ToolRunner
+from tools import fetch_pages, get_weather, get_weather_batch, web_search
+from system_prompt import PROFILES, choose_profile, compile_prompt
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+
+class State(TypedDict):
+    messages: Annotated[List, add_messages]
+    # this turn's tool rounds / deadline / tokens, see budget.py
+    budget: Dict
+    # rolling summary of old turns and how many messages it covers, see
+    # ContextWindow; kept in the checkpoint so restarts don't lose it
+    context: Dict
+
+
+@dataclass(frozen=True)
+class EngineConfig:
+    """Everything that decides how the engine is built.
+
+    Two configs that compare equal share one engine; change any field and
+    the engine is rebuilt on the next get_engine() call.
+    """
+
+    model_provider: str = "groq"
+    model: str = "moonshotai/kimi-k2-instruct"
+    api_key: Optional[str] = None
+    # "provider:model" backends tried after the main one (MODEL_FALLBACKS)
+    model_fallbacks: Tuple[str, ...] = ()
+    # second request when the first is slower than its p95 to first token
+    model_hedge: bool = False
+    model_hedge_delay: float = 2.0
+    model_timeout: float = 30.0
+    db_path: str = "chats.db"
+    context_max_tokens: int = 8000
+    tool_concurrency: int = 4
+    tool_timeout: float = 15.0
+    # cap per tool result of earlier turns, when replayed to the model
+    tool_result_tokens: int = 300
+    # per-turn budget for the chatbot <-> tools loop
+    max_tool_rounds: int = 4
+    turn_timeout: float = 60.0
+    turn_max_tokens: int = 20000
+    # exact-match reply cache, off unless RESPONSE_CACHE=1
+    response_cache: bool = False
+    response_cache_size: int = 512
+    response_cache_ttl: float = 3600.0
+    # rule-based fast path for obvious tool queries, off unless ROUTER=1
+    router: bool = False
+    router_min_confidence: float = 0.8
+    # system prompt profile: "full", "slim", or "auto" (slim for chit-chat)
+    prompt_profile: str = "full"
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            model_provider=os.getenv("MODEL_PROVIDER", cls.model_provider),
+            model=os.getenv("MODEL_NAME", cls.model),
+            api_key=os.getenv("GROQ_API_KEY"),
+            model_fallbacks=tuple(
+                spec.strip()
+                for spec in os.getenv("MODEL_FALLBACKS", "").split(",")
+                if spec.strip()
+            ),
+            model_hedge=os.getenv("MODEL_HEDGE", "").lower() in ("1", "true", "yes"),
+            model_hedge_delay=float(
+                os.getenv("MODEL_HEDGE_DELAY", cls.model_hedge_delay)
+            ),
+            model_timeout=float(os.getenv("MODEL_TIMEOUT", cls.model_timeout)),
+            db_path=os.getenv("CHAT_DB_PATH", cls.db_path),
+            context_max_tokens=int(
+                os.getenv("CONTEXT_MAX_TOKENS", cls.context_max_tokens)
+            ),
+            tool_concurrency=int(os.getenv("TOOL_CONCURRENCY", cls.tool_concurrency)),
+            tool_timeout=float(os.getenv("TOOL_TIMEOUT", cls.tool_timeout)),
+            tool_result_tokens=int(
+                os.getenv("TOOL_RESULT_TOKENS", cls.tool_result_tokens)
+            ),
+            max_tool_rounds=int(os.getenv("MAX_TOOL_ROUNDS", cls.max_tool_rounds)),
+            turn_timeout=float(os.getenv("TURN_TIMEOUT", cls.turn_timeout)),
+            turn_max_tokens=int(os.getenv("TURN_MAX_TOKENS", cls.turn_max_tokens)),
+            response_cache=os.getenv("RESPONSE_CACHE", "").lower()
+            in ("1", "true", "yes"),
+            response_cache_size=int(
+                os.getenv("RESPONSE_CACHE_SIZE", cls.response_cache_size)
+            ),
+            response_cache_ttl=float(
+                os.getenv("RESPONSE_CACHE_TTL", cls.response_cache_ttl)
+            ),
+            router=os.getenv("ROUTER", "").lower() in ("1", "true", "yes"),
+            router_min_confidence=float(
+                os.getenv("ROUTER_MIN_CONFIDENCE", cls.router_min_confidence)
+            ),
+            prompt_profile=os.getenv("PROMPT_PROFILE", cls.prompt_profile),
+        )
+
+
+def _record_usage(span, message: AIMessage) -> int:
+    """Record the call's token usage; returns prompt + completion tokens."""
+    backend = message.response_metadata.get("backend")
+    if backend:
+        # ModelPool: which backend answered
+        span.set(backend=backend)
+    usage = getattr(message, "usage_metadata", None)
+    if not usage:
+        return 0
+    prompt, completion = usage.get("input_tokens", 0), usage.get("output_tokens", 0)
+    # prompt tokens the provider served from its prefix cache, if it says
+    cached = (usage.get("input_token_details") or {}).get("cache_read", 0)
+    span.set(prompt_tokens=prompt, completion_tokens=completion, cached_tokens=cached)
+    metrics.inc("llm_tokens_total", prompt, type="prompt")
+    metrics.inc("llm_tokens_total", completion, type="completion")
+    if cached:
+        metrics.inc("llm_tokens_total", cached, type="cached")
+    return prompt + completion
+
+
+def _chat_model(config: EngineConfig):
+    """The configured model, or a ModelPool when fallbacks / hedging are on."""
+    main = init_chat_model(
+        model_provider=config.model_provider,
+        model=config.model,
+        api_key=config.api_key,
+    )
+    if not config.model_fallbacks and not config.model_hedge:
+        return main
+    # each backend queues on its own provider's limits, per attempt
+    backends = [
+        Backend(
+            f"{config.model_provider}:{config.model}",
+            main,
+            limiter=get_limiter(config.model_provider),
+        )
+    ]
+    for spec in config.model_fallbacks:
+        provider, _, model = spec.partition(":")
+        # GROQ_API_KEY is only for groq, other providers read their own env
+        kwargs = {"api_key": config.api_key} if provider == "groq" else {}
+        backends.append(
+            Backend(
+                spec,
+                init_chat_model(model_provider=provider, model=model, **kwargs),
+                limiter=get_limiter(provider),
+            )
+        )
+    return ModelPool(
+        backends=backends,
+        hedge=config.model_hedge,
+        hedge_delay=config.model_hedge_delay,
+        first_token_timeout=config.model_timeout,
+    )
+
+
+def _thread_id(config: RunnableConfig) -> Optional[str]:
+    return config.get("configurable", {}).get("thread_id")
+
+
+@dataclass
+class _Call:
+    """What one chatbot node run carries from the budget check to its reply."""
+
+    thread_id: Optional[str]
+    budget: Dict
+    reason: Optional[str]
+    prompt: str
+    context: Optional[Dict]
+    llm: Any = None
+    messages: Optional[list] = None
+    cache_key: Optional[str] = None
+
+    @property
+    def deadline(self) -> Optional[float]:
+        return self.budget["deadline"]
+
+
+class BackgroundLoop:
+    """One asyncio event loop on a daemon thread.
+
+    Sync callers (Streamlit script threads) hand coroutines to it, so all
+    in-flight turns share one loop instead of each holding a thread.
+    """
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(
+            target=self.loop.run_forever, name="engine-loop", daemon=True
+        )
+        self.thread.start()
+
+    def submit(self, coro: Awaitable) -> Future:
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+
+class Engine:
+    """Chat model, tool binding and compiled graphs, built once.
+
+    `graph` is the sync graph (SqliteSaver). aget_graph() returns the async
+    graph (AsyncSqliteSaver on the same DB) for the running event loop;
+    `loop` is a shared background loop for sync callers that want the
+    async path.
+    """
+
+    def __init__(self, config: EngineConfig):
+        self.config = config
+        self.llm = _chat_model(config)
+        self.tools = [get_weather, get_weather_batch, web_search, fetch_pages]
+        self.llm_with_tools = self.llm.bind_tools(self.tools)
+        # same tools in the request (history has tool calls) but none allowed
+        self.llm_final = self.llm.bind_tools(self.tools, tool_choice="none")
+        self.limits = TurnLimits(
+            max_tool_rounds=config.max_tool_rounds,
+            max_seconds=config.turn_timeout,
+            max_tokens=config.turn_max_tokens,
+        )
+        # compile every profile this config can use now, not on the first turn
+        if config.prompt_profile == "auto":
+            profiles = list(PROFILES)
+        else:
+            profiles = [config.prompt_profile]
+        for prompt in map(compile_prompt, profiles):
+            logger.info(
+                "system prompt %s v%s: ~%d tokens",
+                prompt.profile,
+                prompt.version,
+                prompt.tokens,
+            )
+        # client-side Groq RPM / TPM limits, None unless configured; a
+        # ModelPool takes them per attempt itself
+        self.limiter = None
+        if not isinstance(self.llm, ModelPool):
+            self.limiter = get_limiter(config.model_provider)
+        self.context = ContextWindow(
+            max_tokens=config.context_max_tokens,
+            summarize=llm_summarizer(self.llm, self.limiter),
+            asummarize=allm_summarizer(self.llm, self.limiter),
+        )
+        self.response_cache: Optional[ResponseCache] = None
+        if config.response_cache:
+            self.response_cache = ResponseCache(
+                f"{config.model_provider}:{config.model}",
+                self.tools,
+                maxsize=config.response_cache_size,
+                ttl=config.response_cache_ttl,
+            )
+        self.router: Optional[PreRouter] = None
+        if config.router:
+            self.router = PreRouter(
+                [t.name for t in self.tools],
+                min_confidence=config.router_min_confidence,
+            )
+        # graph state (incl. tool calls / results) lives here, keyed by thread_id
+        self.checkpointer = SqliteSaver(open_sqlite(config.db_path))
+        self.graph = self._build_graph(self.checkpointer)
+        # event loop -> task opening that loop's async graph
+        self._agraphs: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+        self._loop: Optional[BackgroundLoop] = None
+        self._loop_lock = threading.Lock()
+
+    def chatbot(self, state: State, config: RunnableConfig):
+        with metrics.span("chatbot", "node", thread_id=_thread_id(config)) as span:
+            call = self._begin(state, config, span)
+            # summary and pool calls queue under this chat and deadline
+            with chat_scope(call.thread_id), budget.deadline_scope(call.deadline):
+                with metrics.span("context", "context") as span:
+                    messages, call.context = self.context.build(
+                        call.prompt, self._history(state["messages"]), call.context
+                    )
+                    cached = self._prepare(call, messages, span)
+                if cached is not None:
+                    return self._update(call, cached)
+                with metrics.span(self.config.model, "llm") as span:
+                    try:
+                        costs = self._admit(span, call)
+                        result = call.llm.invoke(call.messages)
+                    except RateLimited:
+                        return self._update(call, self._busy(span))
+                    self._settle(span, call, costs, result)
+            return self._update(call, self._finish(call, result))
+
+    async def achatbot(self, state: State, config: RunnableConfig):
+        with metrics.span("chatbot", "node", thread_id=_thread_id(config)) as span:
+            call = self._begin(state, config, span)
+            with chat_scope(call.thread_id), budget.deadline_scope(call.deadline):
+                with metrics.span("context", "context") as span:
+                    messages, call.context = await self.context.abuild(
+                        call.prompt, self._history(state["messages"]), call.context
+                    )
+                    cached = self._prepare(call, messages, span)
+                if cached is not None:
+                    return self._update(call, cached)
+                with metrics.span(self.config.model, "llm") as span:
+                    try:
+                        costs = await self._aadmit(span, call)
+                        result = await call.llm.ainvoke(call.messages)
+                    except RateLimited:
+                        return self._update(call, self._busy(span))
+                    self._settle(span, call, costs, result)
+            return self._update(call, self._finish(call, result))
+
+    def _begin(self, state: State, config: RunnableConfig, span) -> "_Call":
+        """Budget check and system prompt, before anything is sent."""
+        turn_budget, reason = self._budget(state, span)
+        return _Call(
+            thread_id=_thread_id(config),
+            budget=turn_budget,
+            reason=reason,
+            prompt=self._prompt(state, span),
+            context=state.get("context"),
+        )
+
+    def _prepare(self, call: "_Call", messages, span) -> Optional[AIMessage]:
+        """Pick the model for the built context; returns a cached reply if any."""
+        if metrics.enabled:
+            span.set(tokens=self._tokens(messages))
+        call.cache_key, cached = self._cached_reply(messages, call.reason)
+        if cached is None:
+            call.llm, call.messages = self._model_for(call.reason, messages)
+        return cached
+
+    def _busy(self, span) -> AIMessage:
+        # queue too long to wait out - say so instead of failing
+        span.set(status="rate_limited")
+        return AIMessage(content=BUSY_REPLY)
+
+    def _finish(self, call: "_Call", result: AIMessage) -> AIMessage:
+        if call.cache_key is not None:
+            self.response_cache.put(call.cache_key, result)
+        return self._spend(call.budget, call.reason, result)
+
+    def _update(self, call: "_Call", message: AIMessage) -> Dict:
+        return {"messages": message, "budget": call.budget, "context": call.context}
+
+    def _prompt(self, state: State, span) -> str:
+        """Compiled system prompt for this call; its size goes on the span."""
+        prompt = compile_prompt(
+            choose_profile(state["messages"], self.config.prompt_profile)
+        )
+        span.set(
+            prompt_profile=prompt.profile,
+            prompt_version=prompt.version,
+            system_tokens=prompt.tokens,
+        )
+        metrics.inc(
+            "system_prompt_tokens_total", prompt.tokens, profile=prompt.profile
+        )
+        return prompt.text
+
+    def _tokens(self, messages) -> int:
+        # estimate of what this call sends, system prompt included
+        return sum(self.context.message_tokens(m) for m in messages)
+
+    def _llm_costs(self, messages) -> Optional[Dict]:
+        if self.limiter is None:
+            return None
+        return llm_costs(self._tokens(messages))
+
+    def _admit(self, span, call: "_Call") -> Optional[Dict]:
+        """Wait in the rate limiter's line (if any); returns what was taken."""
+        costs = self._llm_costs(call.messages)
+        if costs is not None:
+            waited = self.limiter.acquire(costs, call.thread_id, call.deadline)
+            if waited:
+                span.set(queued_ms=round(waited * 1000, 1))
+        return costs
+
+    async def _aadmit(self, span, call: "_Call") -> Optional[Dict]:
+        costs = self._llm_costs(call.messages)
+        if costs is not None:
+            waited = await self.limiter.aacquire(costs, call.thread_id, call.deadline)
+            if waited:
+                span.set(queued_ms=round(waited * 1000, 1))
+        return costs
+
+    def _settle(self, span, call: "_Call", costs: Optional[Dict], result: AIMessage):
+        """Count the call's tokens and swap the limiter's estimate for them."""
+        used = _record_usage(span, result)
+        call.budget["tokens"] += used
+        if costs is not None and used:
+            self.limiter.settle("tokens", used - costs["tokens"])
+
+    def _budget(self, state: State, span):
+        """(this turn's budget, reason it is used up or None)."""
+        turn_budget = budget.current(state, self.limits)
+        reason = budget.check(turn_budget, self.limits)
+        if reason is not None:
+            budget.exhaust(turn_budget, reason)
+            span.set(budget_exhausted=reason)
+        return turn_budget, reason
+
+    def _model_for(self, reason: Optional[str], messages):
+        """Tool-bound model normally; once the budget is used up, a model that
+        can't call tools, told to answer from what it already has."""
+        if reason is None:
+            return self.llm_with_tools, messages
+        return self.llm_final, messages + [budget.wrap_up_message(reason)]
+
+    def _spend(self, turn_budget, reason: Optional[str], result: AIMessage):
+        if reason is not None and result.tool_calls:
+            # tool calls are off at this point - never loop back to tools
+            return AIMessage(
+                content=result.content or budget.FALLBACK_REPLY, id=result.id
+            )
+        if result.tool_calls:
+            turn_budget["tool_rounds"] += 1
+        return result
+
+    def route(self, state: State, config: RunnableConfig):
+        """Router node; a fast path starts the turn's budget with one round used."""
+        update = self.router.run(state, config)
+        if update:
+            turn_budget = self.limits.start()
+            turn_budget["tool_rounds"] = 1
+            update["budget"] = turn_budget
+        return update
+
+    def _history(self, messages):
+        # earlier turns' tool results go in compacted, the current turn's in full
+        return compact_history(messages, self.config.tool_result_tokens)
+
+    def _cached_reply(self, messages, reason: Optional[str] = None):
+        """(cache key or None, cached AIMessage or None) for this LLM call."""
+        if self.response_cache is None or reason is not None:
+            return None, None
+        key = self.response_cache.lookup(messages)
+        if key is None:
+            return None, None
+        return key, self.response_cache.get(key)
+
+    def _build_graph(self, checkpointer):
+        graph_builder = StateGraph(State)
+        tool_runner = ToolRunner(
+            self.tools,
+            max_concurrency=self.config.tool_concurrency,
+            timeout=self.config.tool_timeout,
+        )
+        # sync path for graph.stream, async path for graph.astream
+        tool_node = RunnableLambda(tool_runner.run, afunc=tool_runner.arun)
+
+        # Add nodes
+        graph_builder.add_node(
+            "chatbot", RunnableLambda(self.chatbot, afunc=self.achatbot)
+        )
+        graph_builder.add_node("tools", tool_node)
+        if self.router is not None:
+            graph_builder.add_node("router", RunnableLambda(self.route))
+
+        # Add edges
+        if self.router is not None:
+            # obvious tool queries skip the first chatbot hop
+            graph_builder.add_edge(START, "router")
+            graph_builder.add_conditional_edges(
+                "router", route_after_router, ["tools", "chatbot"]
+            )
+        else:
+            graph_builder.add_edge(START, "chatbot")
+        graph_builder.add_conditional_edges("chatbot", tools_condition)
+        graph_builder.add_edge("tools", "chatbot")
+        graph_builder.add_edge("chatbot", END)
+
+        return graph_builder.compile(checkpointer=checkpointer)
+
+    async def _open_agraph(self):
+        conn = aiosqlite.connect(self.config.db_path)
+        # aiosqlite runs each connection on its own thread; don't let a
+        # graph opened by a short-lived loop keep the process alive
+        conn.daemon = True
+        conn = await conn
+        await conn.execute("PRAGMA journal_mode=WAL")
+        await conn.execute("PRAGMA synchronous=NORMAL")
+        return self._build_graph(AsyncSqliteSaver(conn))
+
+    async def aget_graph(self):
+        """Async graph for the running loop (checkpointer connections are per loop)."""
+        loop = asyncio.get_running_loop()
+        task = self._agraphs.get(loop)
+        if task is None or (task.done() and task.exception() is not None):
+            task = self._agraphs[loop] = loop.create_task(self._open_agraph())
+        return await asyncio.shield(task)
+
+    @property
+    def loop(self) -> BackgroundLoop:
+        with self._loop_lock:
+            if self._loop is None:
+                self._loop = BackgroundLoop()
+            return self._loop
+
+    def turn_state(self, thread_id: str, history: List[dict], prompt: str) -> State:
+        """Graph input for a new user message.
+
+        The checkpointer already has the earlier turns, so normally only the
+        new message is sent. A chat with no stored thread yet (e.g. old DB
+        wiped) is seeded once from its stored transcript, tool rows included.
+        """
+        if self.has_thread(thread_id):
+            return State(messages=[HumanMessage(content=prompt)])
+
+        messages = history_messages(history)
+        if not history or history[-1] != {"role": "user", "content": prompt}:
+            messages.append(HumanMessage(content=prompt))
+        return State(messages=messages)
+
+    def has_thread(self, thread_id: str) -> bool:
+        config = {"configurable": {"thread_id": thread_id}}
+        return self.checkpointer.get_tuple(config) is not None
+
+    def delete_thread(self, thread_id: str):
+        self.checkpointer.delete_thread(thread_id)
+
+    def close(self):
+        self.checkpointer.conn.close()
+        if self._loop is not None:
+            self._loop.stop()
+
+
+# process-wide engine, shared by every Streamlit session / thread
+_engine: Optional[Engine] = None
+_engine_lock = threading.Lock()
+
+
+def get_engine(config: Optional[EngineConfig] = None) -> Engine:
+    """Return the shared engine, building it only on first use or config change."""
+    global _engine
+    if config is None:
+        config = EngineConfig.from_env()
+
+    # fast path: no lock once the engine exists
+    engine = _engine
+    if engine is not None and engine.config == config:
+        return engine
+
+    with _engine_lock:
+        if _engine is None or _engine.config != config:
+            if _engine is not None:
+                _engine.close()
+            _engine = Engine(config)
+        return _engine
+
+
+def reset_engine():
+    """Drop the shared engine so the next get_engine() builds a fresh one."""
+    global _engine
+    with _engine_lock:
+        if _engine is not None:
+            _engine.close()
+        _engine = None
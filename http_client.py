@@ -0,0 +1,331 @@
+import asyncio
+import os
+import random
+import threading
+import time
+import weakref
+from contextlib import asynccontextmanager, contextmanager
+from typing import Dict, Optional, Tuple, Union
+from urllib.parse import urlsplit
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+from budget import remaining
+from metrics import metrics
+
+# (connect, read) seconds
+Timeout = Union[float, Tuple[float, float]]
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a host whose circuit breaker is open."""
+
+
+class DeadlineExceeded(Exception):
+    """Raised instead of calling (or retrying) once the turn's time is up."""
+
+
+class CircuitBreaker:
+    """Per-host breaker: opens after N consecutive failures, probes after a cooldown."""
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures: Dict[str, int] = {}
+        self._opened_at: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def check(self, host: str):
+        with self._lock:
+            opened_at = self._opened_at.get(host)
+            if opened_at is None:
+                return
+            if time.monotonic() - opened_at < self.reset_timeout:
+                raise CircuitOpenError(f"{host} is failing, skipping call for now")
+            # half-open: let this one request through as a probe
+            self._opened_at[host] = time.monotonic()
+
+    def success(self, host: str):
+        with self._lock:
+            self._failures.pop(host, None)
+            self._opened_at.pop(host, None)
+
+    def failure(self, host: str):
+        with self._lock:
+            failures = self._failures.get(host, 0) + 1
+            self._failures[host] = failures
+            if failures >= self.failure_threshold:
+                self._opened_at[host] = time.monotonic()
+
+    def is_open(self, host: str) -> bool:
+        with self._lock:
+            return host in self._opened_at
+
+
+class HttpClient:
+    """Shared HTTP transport for tools.
+
+    One keep-alive pool per host (requests.Session for sync, httpx for
+    async), connect/read timeouts on every call, bounded retries with
+    jittered exponential backoff and a per-host circuit breaker. Inside
+    a turn, timeouts and retries are cut to the time the turn has left.
+
+    Metrics are labelled by `upstream` (a fixed name the caller passes, e.g.
+    "wttr"), never by host: fetch_pages reads any host the model picks, and
+    each would become a new series. The host only goes on the span.
+    """
+
+    def __init__(
+        self,
+        timeout: Timeout = (3.05, 10.0),
+        retries: int = 2,
+        backoff: float = 0.3,
+        pool_size: int = 10,
+        breaker: Optional[CircuitBreaker] = None,
+    ):
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.pool_size = pool_size
+        self.breaker = breaker or CircuitBreaker()
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        # httpx clients are bound to the loop they were first used on
+        self._async_clients: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+
+    def _sleep_for(self, attempt: int) -> float:
+        # full jitter so retries from many sessions do not line up
+        return random.uniform(0, self.backoff * (2**attempt))
+
+    def _timeout_tuple(self, timeout: Optional[Timeout]) -> Tuple[float, float]:
+        timeout = self.timeout if timeout is None else timeout
+        if isinstance(timeout, (int, float)):
+            return (timeout, timeout)
+        return timeout
+
+    def _within_deadline(self, timeout: Tuple[float, float]) -> Tuple[float, float]:
+        left = remaining()
+        if left is None:
+            return timeout
+        if left <= 0:
+            raise DeadlineExceeded("turn time budget used up")
+        return (min(timeout[0], left), min(timeout[1], left))
+
+    def _retry_sleep(self, attempt: int) -> float:
+        left = remaining()
+        sleep = self._sleep_for(attempt)
+        if left is not None and sleep >= left:
+            raise DeadlineExceeded("no time left to retry")
+        return sleep
+
+    def _record(self, span, upstream: str, response, attempt: int, streamed=False):
+        if not metrics.enabled:
+            # don't touch .content when off (it would read a stream=True body)
+            return
+        if streamed:
+            # body not read yet - the caller may stop early
+            size = int(response.headers.get("content-length") or 0)
+        else:
+            size = len(response.content)
+        span.set(
+            status="ok" if response.status_code < 400 else "error",
+            http_status=response.status_code,
+            bytes=size,
+            attempts=attempt + 1,
+        )
+        metrics.inc(
+            "http_requests_total", upstream=upstream, status=response.status_code
+        )
+        metrics.inc("http_response_bytes_total", size, upstream=upstream)
+
+    def get(
+        self,
+        url: str,
+        params=None,
+        timeout: Optional[Timeout] = None,
+        upstream: str = "other",
+        **kwargs,
+    ):
+        host = urlsplit(url).netloc
+        timeout = self._timeout_tuple(timeout)
+        with metrics.span(upstream, "http", host=host) as span:
+            for attempt in range(self.retries + 1):
+                self.breaker.check(host)
+                try:
+                    response = self.session.get(
+                        url,
+                        params=params,
+                        timeout=self._within_deadline(timeout),
+                        **kwargs,
+                    )
+                except (requests.ConnectionError, requests.Timeout):
+                    self.breaker.failure(host)
+                    if attempt == self.retries:
+                        raise
+                else:
+                    if response.status_code not in RETRY_STATUS:
+                        self.breaker.success(host)
+                        self._record(span, upstream, response, attempt)
+                        return response
+                    self.breaker.failure(host)
+                    if attempt == self.retries:
+                        self._record(span, upstream, response, attempt)
+                        return response
+                time.sleep(self._retry_sleep(attempt))
+
+    def _async_client(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=self.pool_size * 4,
+                    max_keepalive_connections=self.pool_size,
+                ),
+                follow_redirects=True,
+            )
+            self._async_clients[loop] = client
+        return client
+
+    async def aget(
+        self,
+        url: str,
+        params=None,
+        timeout: Optional[Timeout] = None,
+        upstream: str = "other",
+        **kwargs,
+    ):
+        host = urlsplit(url).netloc
+        timeout = self._timeout_tuple(timeout)
+        client = self._async_client()
+        with metrics.span(upstream, "http", host=host) as span:
+            for attempt in range(self.retries + 1):
+                self.breaker.check(host)
+                connect, read = self._within_deadline(timeout)
+                try:
+                    response = await client.get(
+                        url,
+                        params=params,
+                        timeout=httpx.Timeout(read, connect=connect),
+                        **kwargs,
+                    )
+                except (httpx.TransportError, httpx.TimeoutException):
+                    self.breaker.failure(host)
+                    if attempt == self.retries:
+                        raise
+                else:
+                    if response.status_code not in RETRY_STATUS:
+                        self.breaker.success(host)
+                        self._record(span, upstream, response, attempt)
+                        return response
+                    self.breaker.failure(host)
+                    if attempt == self.retries:
+                        self._record(span, upstream, response, attempt)
+                        return response
+                await asyncio.sleep(self._retry_sleep(attempt))
+
+    @contextmanager
+    def stream(
+        self,
+        url: str,
+        timeout: Optional[Timeout] = None,
+        upstream: str = "other",
+        **kwargs,
+    ):
+        """GET with the body left unread, for callers that read it in chunks
+        and may stop early. One attempt, no retries, redirects are returned
+        rather than followed (the caller vets each Location); breaker and
+        turn deadline apply as in get()."""
+        host = urlsplit(url).netloc
+        timeout = self._within_deadline(self._timeout_tuple(timeout))
+        with metrics.span(upstream, "http", host=host, streamed=True) as span:
+            self.breaker.check(host)
+            try:
+                response = self.session.get(
+                    url, timeout=timeout, stream=True, allow_redirects=False, **kwargs
+                )
+            except (requests.ConnectionError, requests.Timeout):
+                self.breaker.failure(host)
+                raise
+            with response:
+                if response.status_code in RETRY_STATUS:
+                    self.breaker.failure(host)
+                else:
+                    self.breaker.success(host)
+                self._record(span, upstream, response, 0, streamed=True)
+                yield response
+
+    @asynccontextmanager
+    async def astream(
+        self,
+        url: str,
+        timeout: Optional[Timeout] = None,
+        upstream: str = "other",
+        **kwargs,
+    ):
+        """Async stream(); read the body with response.aiter_bytes()."""
+        host = urlsplit(url).netloc
+        connect, read = self._within_deadline(self._timeout_tuple(timeout))
+        client = self._async_client()
+        with metrics.span(upstream, "http", host=host, streamed=True) as span:
+            self.breaker.check(host)
+            request = client.build_request(
+                "GET", url, timeout=httpx.Timeout(read, connect=connect), **kwargs
+            )
+            try:
+                response = await client.send(
+                    request, stream=True, follow_redirects=False
+                )
+            except (httpx.TransportError, httpx.TimeoutException):
+                self.breaker.failure(host)
+                raise
+            try:
+                if response.status_code in RETRY_STATUS:
+                    self.breaker.failure(host)
+                else:
+                    self.breaker.success(host)
+                self._record(span, upstream, response, 0, streamed=True)
+                yield response
+            finally:
+                await response.aclose()
+
+    def close(self):
+        self.session.close()
+
+
+# process-wide client shared by all tools
+_client: Optional[HttpClient] = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> HttpClient:
+    global _client
+    client = _client
+    if client is not None:
+        return client
+    with _client_lock:
+        if _client is None:
+            _client = HttpClient(
+                timeout=(
+                    float(os.getenv("HTTP_CONNECT_TIMEOUT", "3.05")),
+                    float(os.getenv("HTTP_READ_TIMEOUT", "10")),
+                ),
+                retries=int(os.getenv("HTTP_RETRIES", "2")),
+            )
+        return _client
+
+
+def set_client(client: Optional[HttpClient]):
+    """Swap the shared client (e.g. one pointed at a local fake server)."""
+    global _client
+    with _client_lock:
+        _client = client
@@ -1,22 +1,30 @@
 import os
+import time
+import requests
 import streamlit as st
 from langchain_core.runnables import RunnableConfig
-from langgraph.graph.message import add_messages
-from langchain.chat_models import init_chat_model
-from langgraph.graph import StateGraph, START, END
-from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
-from langgraph.prebuilt import ToolNode, tools_condition
-from typing_extensions import TypedDict
-from typing import Annotated, List
-from dotenv import load_dotenv
 import uuid
 from datetime import datetime
-from tools import get_weather, web_search
-from system_prompt import system_prompt
-
-load_dotenv()
-
-GROQ_API_KEY = os.getenv("GROQ_API_KEY")
+from engine import get_engine
+from metrics import metrics
+from model_pool import ModelPool
+from rate_limit import get_limiter
+from rendering import (
+    TRANSCRIPT_WINDOW,
+    build_message_html,
+    escape_user,
+    message_html,
+    visible_window,
+)
+from storage import CHAT_SHARED, SHARED_OWNER, RemoteChatStore, get_store
+from streaming import (
+    REMOTE_ERRORS,
+    astream_engine_turn,
+    iter_on_loop,
+    stream_remote_turn,
+)
+from tool_history import ToolTranscript
+from styles import CUSTOM_CSS
 
 # Page config
 st.set_page_config(
@@ -27,140 +35,53 @@ st.set_page_config(
 )
 
 
-# Custom CSS for modern styling with custom color scheme
-st.markdown(
-    """
-<style>
-    
-    /* Header styling */
-    .main-header {
-        background: linear-gradient(135deg, #3E3F29 0%, #7D8D86 100%);
-        padding: 1.5rem;
-        border-radius: 15px;
-        margin-bottom: 2rem;
-        color: #F1F0E4;
-        text-align: center;
-        box-shadow: 0 4px 15px rgba(62, 63, 41, 0.3);
-    }
-    
-    .main-header h1 {
-        margin: 0;
-        font-size: 2.5rem;
-        font-weight: 600;
-        color: #F1F0E4;
-    }
-    
-    .main-header p {
-        margin: 0.5rem 0 0 0;
-        opacity: 0.9;
-        font-size: 1.1rem;
-        color: #F1F0E4;
-    }
-
-    
-    /* Chat message styling */
-    .user-message {
-        background: linear-gradient(135deg, #7D8D86 0%, #BCA88D 100%);
-        color: black;
-        padding: 1rem 1.5rem;
-        border-radius: 20px 20px 5px 20px;
-        margin: 0.5rem 0;
-        margin-left: 20%;
-        box-shadow: 0 3px 12px rgba(125, 141, 134, 0.4);
-        border: 2px solid #BCA88D;
-    }
-    
-    .assistant-message {
-        background: linear-gradient(135deg, #BCA88D 0%, #F1F0E4 100%);
-        color:black;
-        padding: 1rem 1.5rem;
-        border-radius: 20px 20px 20px 5px;
-        margin: 0.5rem 0;
-        margin-right: 20%;
-        box-shadow: 0 3px 12px rgba(188, 168, 141, 0.3);
-        border-left: 4px solid #7D8D86;
-    }
-    
-    /* Button styling */
-    .stButton > button {
-        background: linear-gradient(135deg, #3E3F29 0%, #7D8D86 100%);
-        color: #F1F0E4;
-        border: none;
-        border-radius: 8px;
-        padding: 0.5rem 1.5rem;
-        font-weight: 500;
-        transition: all 0.3s ease;
-        box-shadow: 0 3px 10px rgba(62, 63, 41, 0.3);
-    }
-    
-    .stButton > button:hover {
-        transform: translateY(-2px);
-        box-shadow: 0 5px 15px rgba(62, 63, 41, 0.4);
-        background: linear-gradient(135deg, #7D8D86 0%, #BCA88D 100%);
-    }
-
-    /* Current chat title */
-    .current-chat-title {
-        color: white;
-    }
-
-    /* Loading spinner styling */
-    .stSpinner {
-        color: #7D8D86;
-    }
-</style>
-""",
-    unsafe_allow_html=True,
-)
-
-
-class State(TypedDict):
-    messages: Annotated[List, add_messages]
-
-
-# chat model
-llm = init_chat_model(
-    model_provider="groq",
-    model="moonshotai/kimi-k2-instruct",
-    api_key=GROQ_API_KEY,
-)
-
-tools = [get_weather, web_search]
-llm_with_tools = llm.bind_tools(tools)
-
+# Streamlit har rerun pe page fresh banata hai, isliye CSS har baar inject
+# karna padta hai - bas string ab styles.py me ek hi baar banti hai
+st.markdown(CUSTOM_CSS, unsafe_allow_html=True)
 
-def chatbot(state: State):
-    PROMPT = system_prompt()
-    messages_with_prompt = [SystemMessage(content=PROMPT)] + state["messages"]
-    result = llm_with_tools.invoke(messages_with_prompt)
-    return {"messages": result}
 
+CHATS_PER_PAGE = 20
+# set to a server.py URL to run turns there instead of in this process
+CHAT_API_URL = os.getenv("CHAT_API_URL")
 
-graph_builder = StateGraph(State)
-tool_node = ToolNode(tools=tools)
 
-# Add nodes
-graph_builder.add_node("chatbot", chatbot)
-graph_builder.add_node("tools", tool_node)
+def chat_store():
+    """The server's chats when CHAT_API_URL is set, else the local store."""
+    if CHAT_API_URL:
+        return RemoteChatStore(CHAT_API_URL)
+    return get_store()
 
-# Add edges
-graph_builder.add_edge(START, "chatbot")
-graph_builder.add_conditional_edges("chatbot", tools_condition)
-graph_builder.add_edge("tools", "chatbot")
-graph_builder.add_edge("chatbot", END)
 
-
-graph = graph_builder.compile()
+def chat_owner() -> str:
+    """This visitor's owner key: chats saved under it are only listed for
+    them. Kept in the URL (?owner=...) so a reload finds the same chats."""
+    if CHAT_SHARED:
+        return SHARED_OWNER
+    owner = st.query_params.get("owner", "")
+    if len(owner) != 32 or not owner.isalnum():
+        owner = uuid.uuid4().hex
+        st.query_params["owner"] = owner
+    return owner
 
 
 # Initialize session state
 def init_session_state():
-    if "chat_history" not in st.session_state:
-        st.session_state.chat_history = {}
+    if "owner" not in st.session_state:
+        st.session_state.owner = chat_owner()
+    if "current_chat" not in st.session_state:
+        st.session_state.current_chat = None
     if "current_chat_id" not in st.session_state:
         st.session_state.current_chat_id = None
     if "messages" not in st.session_state:
         st.session_state.messages = []
+    if "chat_page" not in st.session_state:
+        st.session_state.chat_page = 0
+    if "last_ttft" not in st.session_state:
+        st.session_state.last_ttft = None
+    if "shown_messages" not in st.session_state:
+        st.session_state.shown_messages = TRANSCRIPT_WINDOW
+    if "turn_error" not in st.session_state:
+        st.session_state.turn_error = None
 
 
 def create_new_chat():
@@ -168,30 +89,200 @@ def create_new_chat():
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M")
     chat_title = f"Chat {timestamp}"
 
-    st.session_state.chat_history[chat_id] = {
+    # chat row is written on first save, so empty chats never hit the store
+    st.session_state.current_chat = {
+        "id": chat_id,
         "title": chat_title,
-        "messages": [],
         "created_at": timestamp,
     }
     st.session_state.current_chat_id = chat_id
     st.session_state.messages = []
+    st.session_state.shown_messages = TRANSCRIPT_WINDOW
 
 
 def load_chat(chat_id):
-    if chat_id in st.session_state.chat_history:
+    store = chat_store()
+    owner = st.session_state.owner
+    chat = store.get_chat(owner, chat_id)
+    if chat is not None:
+        st.session_state.current_chat = chat
         st.session_state.current_chat_id = chat_id
-        st.session_state.messages = st.session_state.chat_history[chat_id]["messages"]
+        st.session_state.messages = store.load_messages(owner, chat_id)
+        st.session_state.shown_messages = TRANSCRIPT_WINDOW
 
 
 def save_current_chat():
     if st.session_state.current_chat_id:
-        st.session_state.chat_history[st.session_state.current_chat_id][
-            "messages"
-        ] = st.session_state.messages
+        chat_store().save_messages(
+            st.session_state.owner,
+            st.session_state.current_chat,
+            st.session_state.messages,
+        )
+
+
+def delete_chat(chat_id):
+    deleted = chat_store().delete_chat(st.session_state.owner, chat_id)
+    if deleted and not CHAT_API_URL:
+        # the server drops its own graph state
+        get_engine().delete_thread(chat_id)
+    if chat_id == st.session_state.current_chat_id:
+        st.session_state.current_chat = None
+        st.session_state.current_chat_id = None
+        st.session_state.messages = []
+
+
+def render_search_results(query):
+    results = chat_store().search(
+        st.session_state.owner, query, limit=CHATS_PER_PAGE
+    )
+    if not results:
+        st.caption("No matching messages.")
+        return
+    for chat_data in results:
+        chat_id = chat_data["id"]
+        is_current = chat_id == st.session_state.current_chat_id
+        if st.button(
+            f"💭 {chat_data['title']}",
+            key=f"search_{chat_id}",
+            use_container_width=True,
+            type="primary" if is_current else "secondary",
+        ):
+            load_chat(chat_id)
+            st.rerun()
+        st.caption(chat_data["snippet"])
+
+
+def render_debug_panel(chat_id):
+    """Span timeline of this chat's last turn (METRICS_ENABLED=1 only)."""
+    with st.expander("🔍 Debug: last turn"):
+        spans = metrics.last_turn(chat_id)
+        if not spans:
+            st.caption("No spans recorded for this chat yet.")
+            return
+        base = spans[0].start
+        st.dataframe(
+            [
+                {
+                    "span": f"{span.kind}: {span.name}",
+                    "at ms": round((span.start - base) * 1000),
+                    "ms": round(span.duration * 1000, 1),
+                    "status": span.status,
+                    "details": ", ".join(f"{k}={v}" for k, v in span.attrs.items()),
+                }
+                for span in spans
+            ],
+            hide_index=True,
+            use_container_width=True,
+        )
+        tokens = [
+            metrics.counter_value("llm_tokens_total", type=kind)
+            for kind in ("prompt", "completion", "cached")
+        ]
+        st.caption(
+            f"Process totals: {tokens[0]:.0f} prompt ({tokens[2]:.0f} cached) / "
+            f"{tokens[1]:.0f} completion tokens"
+        )
+        if CHAT_API_URL:
+            # the engine runs on the server, see its /metrics
+            return
+        engine = get_engine()
+        if engine.router is not None:
+            stats = engine.router.stats()
+            st.caption(
+                f"Router fast path: {stats['fast_path_rate']:.0%} of turns "
+                f"({stats['fast_path']} fast, {stats['low_confidence']} low "
+                f"confidence, {stats['no_match']} no match)"
+            )
+        response_cache = engine.response_cache
+        if response_cache is not None:
+            stats = response_cache.stats()
+            st.caption(
+                f"Reply cache: {stats['hit_rate']:.0%} hit rate "
+                f"({stats['hits']} hits, {stats['misses']} misses, "
+                f"{stats['bypassed']} bypassed, {stats['size']} stored)"
+            )
+        for upstream in ("groq", "google_cse"):
+            limiter = get_limiter(upstream)
+            if limiter is None:
+                continue
+            stats = limiter.stats()
+            st.caption(
+                f"Rate limit {upstream}: {stats['queue_depth']} waiting in "
+                f"{stats['chats_waiting']} chats, mean wait "
+                f"{stats['mean_wait']:.2f}s, {stats['rejected']} rejected"
+            )
+        if isinstance(engine.llm, ModelPool):
+            for stats in engine.llm.stats():
+                p95 = stats["p95_first_token"]
+                st.caption(
+                    f"Model {stats['backend']}: {stats['ok']} ok, "
+                    f"{stats['errors']} errors, p95 first token "
+                    f"{'n/a' if p95 is None else f'{p95:.2f}s'}"
+                    f"{' (failing, tried last)' if stats['failing'] else ''}"
+                )
+
+
+def render_chat_list():
+    """Chat history with enhanced styling - only metadata, one page."""
+    store = chat_store()
+    owner = st.session_state.owner
+    total_chats = store.count_chats(owner)
+    if total_chats:
+        st.markdown("### Recent Conversations")
+        page_count = (total_chats + CHATS_PER_PAGE - 1) // CHATS_PER_PAGE
+        page = min(st.session_state.chat_page, page_count - 1)
+        chats = store.list_chats(
+            owner, limit=CHATS_PER_PAGE, offset=page * CHATS_PER_PAGE
+        )
+        for chat_data in chats:
+            chat_id = chat_data["id"]
+            is_current = chat_id == st.session_state.current_chat_id
+
+            st.markdown('<div class="chat-item">', unsafe_allow_html=True)
+            col1, col2 = st.columns([4, 1])
+
+            with col1:
+                if st.button(
+                    f"💭 {chat_data['title']}",
+                    key=f"chat_{chat_id}",
+                    use_container_width=True,
+                    type="primary" if is_current else "secondary",
+                ):
+                    load_chat(chat_id)
+                    st.rerun()
+
+            with col2:
+                st.markdown('<div class="delete-btn">', unsafe_allow_html=True)
+                if st.button("🧹", key=f"delete_{chat_id}", help="Delete chat"):
+                    delete_chat(chat_id)
+                    st.rerun()
+                st.markdown("</div>", unsafe_allow_html=True)
+
+            st.markdown("</div>", unsafe_allow_html=True)
+
+        if page_count > 1:
+            prev_col, info_col, next_col = st.columns([1, 2, 1])
+            with prev_col:
+                if st.button("⬅️", key="chat_page_prev", disabled=page == 0):
+                    st.session_state.chat_page = page - 1
+                    st.rerun()
+            with info_col:
+                st.caption(f"Page {page + 1} / {page_count}")
+            with next_col:
+                if st.button(
+                    "➡️", key="chat_page_next", disabled=page >= page_count - 1
+                ):
+                    st.session_state.chat_page = page + 1
+                    st.rerun()
+    else:
+        st.info("🎯 No chat history yet. Start a new conversation!")
 
 
 def main():
     init_session_state()
+    # shared across all sessions, built only once per process; a thin
+    # client (CHAT_API_URL) has no engine of its own
+    engine = None if CHAT_API_URL else get_engine()
 
     # Enhanced sidebar for chat history
     with st.sidebar:
@@ -213,40 +304,24 @@ def main():
 
         st.markdown("<hr>", unsafe_allow_html=True)
 
-        # Display chat history with enhanced styling
-        if st.session_state.chat_history:
-            st.markdown("### Recent Conversations")
-            for chat_id, chat_data in reversed(
-                list(st.session_state.chat_history.items())
-            ):
-                is_current = chat_id == st.session_state.current_chat_id
-
-                st.markdown('<div class="chat-item">', unsafe_allow_html=True)
-                col1, col2 = st.columns([4, 1])
-
-                with col1:
-                    if st.button(
-                        f"💭 {chat_data['title']}",
-                        key=f"chat_{chat_id}",
-                        use_container_width=True,
-                        type="primary" if is_current else "secondary",
-                    ):
-                        load_chat(chat_id)
-                        st.rerun()
-
-                with col2:
-                    st.markdown('<div class="delete-btn">', unsafe_allow_html=True)
-                    if st.button("🧹", key=f"delete_{chat_id}", help="Delete chat"):
-                        del st.session_state.chat_history[chat_id]
-                        if chat_id == st.session_state.current_chat_id:
-                            st.session_state.current_chat_id = None
-                            st.session_state.messages = []
-                        st.rerun()
-                    st.markdown("</div>", unsafe_allow_html=True)
+        # Search box: FTS over every stored message, results replace the list
+        query = st.text_input(
+            "🔎 Search chats",
+            key="chat_search",
+            placeholder="Search messages…",
+            label_visibility="collapsed",
+        )
+        try:
+            if query.strip():
+                render_search_results(query)
+            else:
+                render_chat_list()
+        except requests.RequestException:
+            # thin client and the server is down
+            st.warning(REMOTE_ERRORS["unreachable"])
 
-                st.markdown("</div>", unsafe_allow_html=True)
-        else:
-            st.info("🎯 No chat history yet. Start a new conversation!")
+        if metrics.enabled and st.session_state.current_chat_id:
+            render_debug_panel(st.session_state.current_chat_id)
 
         # Sidebar footer
         st.markdown("<hr>", unsafe_allow_html=True)
@@ -277,81 +352,122 @@ def main():
 
     # Display current chat title with enhanced styling
     if st.session_state.current_chat_id:
-        current_chat = st.session_state.chat_history[st.session_state.current_chat_id]
+        current_chat = st.session_state.current_chat
         st.markdown(
             f"""
         <div class="current-chat-title">
-            <h3>📝 {current_chat['title']}</h3>
-            <small>Created: {current_chat['created_at']}</small>
+            <h3>📝 {escape_user(current_chat['title'])}</h3>
+            <small>Created: {escape_user(current_chat['created_at'])}</small>
         </div>
         """,
             unsafe_allow_html=True,
         )
 
-    # Display chat messages with enhanced styling
+    # Display chat messages - only the latest window, each bubble's HTML
+    # is cached so a rerun doesn't rebuild the whole transcript
+    hidden, visible = visible_window(
+        st.session_state.messages, st.session_state.shown_messages
+    )
+    if hidden:
+        if st.button(
+            f"⬆️ Load earlier messages ({hidden} hidden)", key="load_earlier"
+        ):
+            st.session_state.shown_messages += TRANSCRIPT_WINDOW
+            st.rerun()
     chat_container = st.container()
-    with chat_container:
-        for message in st.session_state.messages:
-            if message["role"] == "user":
-                st.markdown(
-                    f"""
-                <div class="user-message">
-                    <strong>You:</strong><br>
-                    {message["content"]}
-                </div>
-                """,
-                    unsafe_allow_html=True,
-                )
-            else:
-                st.markdown(
-                    f"""
-                <div class="assistant-message">
-                    <strong>🤖 Assistant:</strong><br>
-                    {message["content"]}
-                </div>
-                """,
-                    unsafe_allow_html=True,
-                )
+    with chat_container, metrics.span(
+        "transcript",
+        "ui",
+        thread_id=st.session_state.current_chat_id,
+        messages=len(visible),
+    ):
+        for message in visible:
+            st.markdown(
+                message_html(message["role"], message["content"]),
+                unsafe_allow_html=True,
+            )
+
+    if st.session_state.last_ttft is not None:
+        st.caption(f"⚡ First token in {st.session_state.last_ttft * 1000:.0f} ms")
+    if st.session_state.turn_error:
+        st.warning(st.session_state.turn_error)
+        st.session_state.turn_error = None
 
     # Chat input
     if prompt := st.chat_input("💬 Type your message here..."):
         # Add user message
         st.session_state.messages.append({"role": "user", "content": prompt})
 
-        # Get bot response
-        with st.spinner("🤔 Thinking..."):
-            # Create state with conversation history
-            langchain_messages = []
-            for msg in st.session_state.messages:
-                if msg["role"] == "user":
-                    langchain_messages.append(HumanMessage(content=msg["content"]))
-                else:
-                    langchain_messages.append(AIMessage(content=msg["content"]))
+        with chat_container:
+            st.markdown(message_html("user", prompt), unsafe_allow_html=True)
+            status_placeholder = st.empty()
+            reply_placeholder = st.empty()
+        status_placeholder.caption("🤔 Thinking...")
 
-            state = State(messages=langchain_messages)
+        config = RunnableConfig(
+            configurable={"thread_id": st.session_state.current_chat_id}
+        )
 
-            config = RunnableConfig(
-                configurable={"thread_id": st.session_state.current_chat_id}
+        # Stream tokens into a live bubble, tool progress into the status line
+        partial = ""
+        assistant_response = None
+        # tool calls + compacted results, saved so follow-ups can reuse them
+        tool_rows = ToolTranscript()
+        if CHAT_API_URL:
+            # thin client: a server.py worker runs the turn
+            events = stream_remote_turn(
+                CHAT_API_URL,
+                st.session_state.owner,
+                st.session_state.current_chat,
+                prompt,
+            )
+        else:
+            state = engine.turn_state(
+                st.session_state.current_chat_id, st.session_state.messages, prompt
+            )
+            # turn runs on the engine's shared event loop; this script thread
+            # only renders the events
+            events = iter_on_loop(
+                engine.loop, astream_engine_turn(engine, state, config)
+            )
+        # UI side of the turn: wall time, and how much of it went to drawing
+        with metrics.span(
+            "stream", "ui", thread_id=st.session_state.current_chat_id
+        ) as ui_span:
+            draw = 0.0
+            for event in events:
+                drawn = time.perf_counter()
+                tool_rows.feed(event)
+                if event.kind == "token":
+                    partial += event.text
+                    # partial replies change every token - not worth caching
+                    reply_placeholder.markdown(
+                        build_message_html("assistant", partial + "▌"),
+                        unsafe_allow_html=True,
+                    )
+                elif event.kind == "tool_start":
+                    # text before a tool call is just "ek second..." - next
+                    # chatbot pass writes the real answer
+                    partial = ""
+                    status_placeholder.caption(event.label)
+                elif event.kind == "tool_end":
+                    status_placeholder.caption("🤔 Thinking...")
+                elif event.kind == "done":
+                    assistant_response = event.text
+                    st.session_state.last_ttft = event.ttft
+                elif event.kind == "error":
+                    # shown after the rerun; the unanswered message is dropped
+                    st.session_state.turn_error = event.text
+                    st.session_state.messages.pop()
+                draw += time.perf_counter() - drawn
+            ui_span.set(draw_ms=round(draw * 1000, 1))
+
+        # Add the assistant response only once at the end
+        if assistant_response:
+            st.session_state.messages.extend(tool_rows.rows)
+            st.session_state.messages.append(
+                {"role": "assistant", "content": assistant_response}
             )
-
-            assistant_response = None
-
-            for event in graph.stream(state, config=config, stream_mode="values"):
-                if "messages" in event and event["messages"]:
-                    last_message = event["messages"][-1]
-                    # Only capture the final AIMessage response
-                    if (
-                        hasattr(last_message, "content")
-                        and hasattr(last_message, "type")
-                        and last_message.type == "ai"
-                    ):
-                        assistant_response = last_message.content
-
-            # Add the assistant response only once at the end
-            if assistant_response:
-                st.session_state.messages.append(
-                    {"role": "assistant", "content": assistant_response}
-                )
 
         # Save current chat
         save_current_chat()
@@ -0,0 +1,332 @@
+"""Per-turn spans and Prometheus-style metrics.
+
+Off by default. Set METRICS_ENABLED=1 to record:
+  - a span per graph node, LLM call, tool call and upstream HTTP request,
+    tagged with the chat's thread_id (kept in memory, last few per thread)
+  - counters / histograms aggregated over all threads, exposed as
+    Prometheus text by server.py's /metrics or written to METRICS_FILE
+    after each turn (for node_exporter's textfile collector)
+
+When off, span() hands back one shared no-op object and the counters
+return before taking the lock.
+"""
+
+import contextvars
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+PREFIX = "gptb_"
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# thread_id of the turn the current code runs for; set by node spans so
+# tool and HTTP spans underneath pick it up without passing it around
+_current_thread: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar(
+    "metrics_thread_id", default=None
+)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+@dataclass
+class SpanRecord:
+    name: str
+    kind: str
+    thread_id: Optional[str]
+    start: float
+    duration: float
+    status: str = "ok"
+    attrs: Dict[str, Any] = field(default_factory=dict)
+
+
+class Span:
+    """Times a block; `with metrics.span("chatbot", "node", thread_id=...) as s`.
+
+    Passing thread_id binds it for spans opened inside the block. An
+    exception marks the span "error" unless set(status=...) said otherwise.
+    """
+
+    __slots__ = (
+        "_metrics", "name", "kind", "thread_id", "attrs", "status",
+        "_start", "_t0", "_token",
+    )
+
+    def __init__(self, metrics, name: str, kind: str, thread_id: Optional[str], attrs):
+        self._metrics = metrics
+        self.name = name
+        self.kind = kind
+        self.thread_id = thread_id
+        self.attrs = attrs
+        self.status = None
+        self._token = None
+
+    def set(self, status: Optional[str] = None, **attrs):
+        if status is not None:
+            self.status = status
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        if self.thread_id is None:
+            self.thread_id = _current_thread.get()
+        else:
+            self._token = _current_thread.set(self.thread_id)
+        self._start = time.time()
+        self._t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self._t0
+        if self._token is not None:
+            _current_thread.reset(self._token)
+        if self.status is None:
+            self.status = "error" if exc_type is not None else "ok"
+        self._metrics.record(
+            self.name,
+            self.kind,
+            self.thread_id,
+            self._start,
+            duration,
+            self.status,
+            self.attrs,
+        )
+        return False
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def set(self, status=None, **attrs):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP = _NoopSpan()
+
+
+class Metrics:
+    """Span ring buffers per thread_id plus labelled counters / histograms.
+
+    Prometheus labels never include thread_id (one series per chat would
+    explode); per-thread detail lives in the span buffers only.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = False,
+        max_threads: int = 128,
+        max_spans: int = 200,
+        textfile: Optional[str] = None,
+    ):
+        self.enabled = enabled
+        self.max_threads = max_threads
+        self.max_spans = max_spans
+        self.textfile = textfile
+        self._lock = threading.Lock()
+        self._spans: "OrderedDict[str, deque]" = OrderedDict()
+        self._counters: Dict[str, Dict[Labels, float]] = {}
+        self._histograms: Dict[str, Dict[Labels, List[float]]] = {}
+        self._gauges: Dict[str, Dict[Labels, float]] = {}
+        self._help: Dict[str, str] = {}
+
+    # ---- recording ----
+
+    def span(self, name: str, kind: str, thread_id: Optional[str] = None, **attrs):
+        if not self.enabled:
+            return _NOOP
+        return Span(self, name, kind, thread_id, attrs)
+
+    def record(
+        self,
+        name: str,
+        kind: str,
+        thread_id: Optional[str],
+        start: float,
+        duration: float,
+        status: str = "ok",
+        attrs: Optional[Dict] = None,
+    ):
+        """Store a finished span (also usable for spans timed elsewhere)."""
+        if not self.enabled:
+            return
+        span = SpanRecord(name, kind, thread_id, start, duration, status, attrs or {})
+        key = thread_id or "-"
+        with self._lock:
+            spans = self._spans.get(key)
+            if spans is None:
+                spans = self._spans[key] = deque(maxlen=self.max_spans)
+                while len(self._spans) > self.max_threads:
+                    self._spans.popitem(last=False)
+            else:
+                self._spans.move_to_end(key)
+            spans.append(span)
+            self._observe_locked(
+                "span_seconds",
+                duration,
+                (("kind", kind), ("name", name), ("status", status)),
+            )
+
+    def inc(self, name: str, value: float = 1.0, **labels):
+        if not self.enabled:
+            return
+        key = tuple(sorted((k, str(v)) for k, v in labels.items()))
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0.0) + value
+
+    def gauge(self, name: str, value: float, **labels):
+        if not self.enabled:
+            return
+        key = tuple(sorted((k, str(v)) for k, v in labels.items()))
+        with self._lock:
+            self._gauges.setdefault(name, {})[key] = value
+
+    def observe(self, name: str, value: float, **labels):
+        if not self.enabled:
+            return
+        key = tuple(sorted((k, str(v)) for k, v in labels.items()))
+        with self._lock:
+            self._observe_locked(name, value, key)
+
+    def _observe_locked(self, name: str, value: float, key: Labels):
+        series = self._histograms.setdefault(name, {})
+        row = series.get(key)
+        if row is None:
+            # one count per bucket, then sum, then count
+            row = series[key] = [0.0] * (len(BUCKETS) + 2)
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                row[i] += 1
+        row[-2] += value
+        row[-1] += 1
+
+    def describe(self, name: str, text: str):
+        self._help[name] = text
+
+    # ---- reading ----
+
+    def recent_spans(self, thread_id: str) -> List[SpanRecord]:
+        with self._lock:
+            return list(self._spans.get(thread_id, ()))
+
+    def last_turn(self, thread_id: str) -> List[SpanRecord]:
+        """Spans overlapping the most recent finished turn, in start order."""
+        spans = self.recent_spans(thread_id)
+        turn = next((s for s in reversed(spans) if s.kind == "turn"), None)
+        if turn is None:
+            return sorted(spans, key=lambda s: s.start)
+        end = turn.start + turn.duration
+        return sorted(
+            (s for s in spans if s.start <= end and s.start + s.duration >= turn.start),
+            key=lambda s: s.start,
+        )
+
+    def counter_value(self, name: str, **labels) -> float:
+        key = tuple(sorted((k, str(v)) for k, v in labels.items()))
+        with self._lock:
+            return self._counters.get(name, {}).get(key, 0.0)
+
+    def prometheus(self) -> str:
+        lines = []
+        with self._lock:
+            for kind, table in (("counter", self._counters), ("gauge", self._gauges)):
+                for name, series in sorted(table.items()):
+                    full = PREFIX + name
+                    if name in self._help:
+                        lines.append(f"# HELP {full} {self._help[name]}")
+                    lines.append(f"# TYPE {full} {kind}")
+                    for key, value in series.items():
+                        lines.append(f"{full}{_labels(key)} {value:g}")
+            for name, series in sorted(self._histograms.items()):
+                full = PREFIX + name
+                if name in self._help:
+                    lines.append(f"# HELP {full} {self._help[name]}")
+                lines.append(f"# TYPE {full} histogram")
+                for key, row in series.items():
+                    for bound, count in zip(BUCKETS, row):
+                        le = _labels(key + (("le", f"{bound:g}"),))
+                        lines.append(f"{full}_bucket{le} {count:g}")
+                    le = _labels(key + (("le", "+Inf"),))
+                    lines.append(f"{full}_bucket{le} {row[-1]:g}")
+                    lines.append(f"{full}_sum{_labels(key)} {row[-2]:.6f}")
+                    lines.append(f"{full}_count{_labels(key)} {row[-1]:g}")
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self):
+        """Atomically rewrite METRICS_FILE, if one is configured."""
+        if not (self.enabled and self.textfile):
+            return
+        directory = os.path.dirname(os.path.abspath(self.textfile))
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(self.prometheus())
+        os.replace(tmp, self.textfile)
+
+    def reset(self):
+        with self._lock:
+            self._spans.clear()
+            self._counters.clear()
+            self._histograms.clear()
+            self._gauges.clear()
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(key: Labels) -> str:
+    if not key:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in key) + "}"
+
+
+# process-wide registry, shared by the UI, server and tools
+metrics = Metrics(
+    enabled=os.getenv("METRICS_ENABLED", "").lower() in ("1", "true", "yes"),
+    textfile=os.getenv("METRICS_FILE") or None,
+)
+metrics.describe(
+    "span_seconds", "Duration of turns, graph nodes, LLM, tool and HTTP calls"
+)
+metrics.describe(
+    "llm_tokens_total", "LLM tokens by type (prompt / completion / cached)"
+)
+metrics.describe(
+    "system_prompt_tokens_total", "Estimated system prompt tokens sent, by profile"
+)
+metrics.describe(
+    "http_requests_total", "Upstream HTTP responses by upstream and status"
+)
+metrics.describe(
+    "http_response_bytes_total", "Upstream HTTP response body bytes by upstream"
+)
+metrics.describe("tool_calls_total", "Tool calls by tool and status")
+metrics.describe("ttft_seconds", "Time from turn start to the first reply token")
+metrics.describe("response_cache_total", "Reply cache lookups by result")
+metrics.describe("router_total", "Pre-router decisions by result and intent")
+metrics.describe(
+    "turn_budget_exhausted_total", "Turns that hit a budget limit, by limit"
+)
+metrics.describe(
+    "page_fetch_total", "fetch_pages results (fetched, cached, revalidated, ...)"
+)
+metrics.describe(
+    "llm_backend_total", "Model pool calls by backend and result (ok, error, ...)"
+)
+metrics.describe("llm_hedges_total", "Hedged model requests: started, won, lost")
+metrics.describe(
+    "llm_first_token_seconds", "Model pool time to first token, by backend"
+)
+metrics.describe(
+    "rate_limit_total", "Rate limited calls by upstream: immediate, queued, rejected"
+)
+metrics.describe("rate_limit_wait_seconds", "Time spent in a rate limiter's line")
+metrics.describe("rate_limit_queue_depth", "Calls waiting in a rate limiter's line")
@@ -0,0 +1,444 @@
+"""Chat model pool: ordered provider/model backends with failover and hedging.
+
+ModelPool stands in for the single chat model. A call goes to the first
+backend in order; if it fails before its first token (429, 5xx, timeout,
+connection error) the next backend takes over, so a turn only fails when
+all of them do. Backends that keep failing go to the back of the line for
+a while (the same CircuitBreaker the HTTP tools use).
+
+With hedging on, a second request is sent to the next backend (or the
+same one, if there is only one) when the first has not produced a token
+after its recent p95 time to first token. Whichever streams first wins,
+the other is cancelled, and only the winner's tokens reach the user.
+
+A backend with a RateLimiter (its provider's, see rate_limit.py) waits
+in that line before each attempt, hedges and failovers included; its
+hedge and first-token clocks start once it is let through.
+"""
+
+import asyncio
+import contextvars
+import math
+import queue
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field, replace
+from typing import Any, Callable, Dict, List, Optional
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.language_models.chat_models import (
+    agenerate_from_stream,
+    generate_from_stream,
+)
+from langchain_core.outputs import ChatGenerationChunk
+
+from context import estimate_tokens
+from http_client import CircuitBreaker, CircuitOpenError
+from metrics import metrics
+from rate_limit import RateLimited, llm_costs
+
+# inner calls must not report to the graph's callbacks: the pool itself
+# streams the winner's tokens, a loser's would show up twice
+_QUIET = {"callbacks": []}
+
+
+class BackendsExhausted(Exception):
+    """Every backend failed before producing a token."""
+
+
+class BackendStats:
+    """Recent time-to-first-token samples and ok / error counts."""
+
+    def __init__(self, window: int = 200, min_samples: int = 20):
+        self.min_samples = min_samples
+        self._first_token: "deque[float]" = deque(maxlen=window)
+        self.ok = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def success(self, first_token: float):
+        with self._lock:
+            self.ok += 1
+            self._first_token.append(first_token)
+
+    def failure(self):
+        with self._lock:
+            self.errors += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        """None until there are enough samples to trust it."""
+        with self._lock:
+            samples = sorted(self._first_token)
+        if len(samples) < self.min_samples:
+            return None
+        return samples[max(0, math.ceil(q * len(samples)) - 1)]
+
+
+@dataclass
+class Backend:
+    """One provider/model, e.g. name "groq:moonshotai/kimi-k2-instruct"."""
+
+    name: str
+    model: Any
+    # shared by the tool-bound copies of this backend
+    stats: BackendStats = field(default_factory=BackendStats)
+    # the provider's RateLimiter, None when its limits are not set
+    limiter: Any = None
+
+
+class _Attempt:
+    """One backend call, streamed on a worker thread into a shared queue.
+
+    Cancelling stops it at its next chunk (a blocking read can't be
+    interrupted); its later events are ignored.
+    """
+
+    def __init__(
+        self, backend: Backend, events: "queue.Queue", stream, costs, hedge: bool
+    ):
+        self.backend = backend
+        self.hedge = hedge
+        self.started = time.monotonic()
+        self.admitted = backend.limiter is None
+        self._cancelled = threading.Event()
+        # copied context: the chat and deadline reach the rate limiter
+        threading.Thread(
+            target=contextvars.copy_context().run,
+            args=(self._pump, events, stream, costs),
+            name=f"llm-{backend.name}",
+            daemon=True,
+        ).start()
+
+    def _pump(self, events, stream, costs):
+        limiter = self.backend.limiter
+        try:
+            if limiter is not None:
+                limiter.acquire(costs)
+                if self._cancelled.is_set():
+                    limiter.release(costs)
+                    return
+                events.put((self, "admitted", None))
+            chunks = stream()
+            try:
+                for chunk in chunks:
+                    if self._cancelled.is_set():
+                        return
+                    events.put((self, "chunk", chunk))
+            finally:
+                chunks.close()
+        except Exception as exc:
+            events.put((self, "error", exc))
+            return
+        events.put((self, "end", None))
+
+    def cancel(self):
+        self._cancelled.set()
+
+
+class _AsyncAttempt:
+    """_Attempt for the event loop; cancelling cancels the request."""
+
+    def __init__(
+        self, backend: Backend, events: asyncio.Queue, stream, costs, hedge: bool
+    ):
+        self.backend = backend
+        self.hedge = hedge
+        self.started = time.monotonic()
+        self.admitted = backend.limiter is None
+        self._task = asyncio.ensure_future(self._pump(events, stream, costs))
+
+    async def _pump(self, events, stream, costs):
+        try:
+            if self.backend.limiter is not None:
+                await self.backend.limiter.aacquire(costs)
+                events.put_nowait((self, "admitted", None))
+            async for chunk in stream():
+                events.put_nowait((self, "chunk", chunk))
+        except Exception as exc:
+            events.put_nowait((self, "error", exc))
+            return
+        events.put_nowait((self, "end", None))
+
+    def cancel(self):
+        self._task.cancel()
+
+
+class _Race:
+    """Which backends to start, hedge, drop or keep for one call.
+
+    Shared by the sync and async paths; they only differ in how attempts
+    run and how the next event is awaited.
+    """
+
+    def __init__(
+        self, pool: "ModelPool", launch: Callable[[Backend, bool], Any], costs: Dict
+    ):
+        self.pool = pool
+        self.launch = launch
+        self.costs = costs
+        self.pending = pool.order()
+        self.running: List[Any] = []
+        self.winner = None
+        self.hedged = False
+        self.errors: List[str] = []
+        self.limited = 0
+        self.used = 0
+        self._start_next()
+
+    def _start_next(self, hedge: bool = False):
+        if hedge and not self.pending:
+            # one backend only: hedge against a second request to it
+            backend = self.running[0].backend
+        else:
+            backend = self.pending.pop(0)
+        self.running.append(self.launch(backend, hedge))
+
+    def _hedge_at(self) -> Optional[float]:
+        if not self.pool.hedge or self.hedged or len(self.running) != 1:
+            return None
+        first = self.running[0]
+        if not first.admitted:
+            return None
+        return first.started + self.pool.hedge_after(first.backend)
+
+    def wait(self) -> Optional[float]:
+        """Seconds until the next hedge or first-token timeout, None to block
+        (a rate limiter bounds its own wait)."""
+        if self.winner is not None:
+            return None
+        deadlines = [
+            a.started + self.pool.first_token_timeout
+            for a in self.running
+            if a.admitted
+        ]
+        hedge_at = self._hedge_at()
+        if hedge_at is not None:
+            deadlines.append(hedge_at)
+        if not deadlines:
+            return None
+        return max(0.0, min(deadlines) - time.monotonic())
+
+    def timeout(self):
+        now = time.monotonic()
+        hedge_at = self._hedge_at()
+        if hedge_at is not None and now >= hedge_at:
+            self.hedged = True
+            metrics.inc("llm_hedges_total", result="started")
+            self._start_next(hedge=True)
+            return
+        for attempt in list(self.running):
+            if not attempt.admitted:
+                continue
+            if now >= attempt.started + self.pool.first_token_timeout:
+                self._fail(
+                    attempt,
+                    TimeoutError(
+                        f"no token after {self.pool.first_token_timeout:g}s"
+                    ),
+                )
+
+    def _fail(self, attempt, exc: BaseException):
+        attempt.cancel()
+        self.running.remove(attempt)
+        name = attempt.backend.name
+        if isinstance(exc, RateLimited):
+            # our own queue was too long - not the backend's fault
+            self.limited += 1
+            metrics.inc("llm_backend_total", backend=name, result="rate_limited")
+        else:
+            attempt.backend.stats.failure()
+            self.pool.breaker.failure(name)
+            metrics.inc("llm_backend_total", backend=name, result="error")
+        self.errors.append(f"{name}: {type(exc).__name__}: {exc}")
+        if self.running:
+            return
+        if not self.pending:
+            if self.limited == len(self.errors):
+                # every backend was only queued out: the caller's busy reply
+                raise RateLimited("; ".join(self.errors)) from exc
+            raise BackendsExhausted(
+                "all chat model backends failed - " + "; ".join(self.errors)
+            ) from exc
+        self._start_next()
+
+    def _win(self, attempt):
+        self.winner = attempt
+        name = attempt.backend.name
+        attempt.backend.stats.success(time.monotonic() - attempt.started)
+        self.pool.breaker.success(name)
+        metrics.inc("llm_backend_total", backend=name, result="ok")
+        metrics.observe(
+            "llm_first_token_seconds", time.monotonic() - attempt.started, backend=name
+        )
+        if self.hedged:
+            metrics.inc("llm_hedges_total", result="won" if attempt.hedge else "lost")
+        for other in self.running:
+            if other is not attempt:
+                other.cancel()
+                metrics.inc(
+                    "llm_backend_total", backend=other.backend.name, result="cancelled"
+                )
+        self.running = [attempt]
+
+    def feed(self, attempt, kind: str, value) -> Optional[ChatGenerationChunk]:
+        """The chunk to pass on for this event, if any."""
+        if kind == "admitted":
+            # through the rate limiter: the request goes out now
+            attempt.admitted = True
+            attempt.started = time.monotonic()
+            return None
+        if self.winner is None:
+            if attempt not in self.running:
+                return None  # leftovers of a dropped attempt
+            if kind == "error":
+                self._fail(attempt, value)
+                return None
+            # the first chunk (or an empty finished reply) decides the race
+            self._win(attempt)
+            if kind == "chunk":
+                # tell the caller (e.g. the llm span) who answered
+                value.response_metadata["backend"] = attempt.backend.name
+        elif attempt is not self.winner:
+            return None
+        if kind == "error":
+            # mid-reply: tokens already went out, nothing to fail over to
+            raise value
+        if kind == "chunk":
+            usage = value.usage_metadata or {}
+            self.used += usage.get("input_tokens", 0) + usage.get("output_tokens", 0)
+            return ChatGenerationChunk(message=value)
+        return None
+
+    def finished(self, attempt, kind: str) -> bool:
+        if attempt is not self.winner or kind != "end":
+            return False
+        limiter = attempt.backend.limiter
+        if limiter is not None and self.used:
+            # swap the winner's token estimate for its real usage
+            limiter.settle("tokens", self.used - self.costs["tokens"])
+        return True
+
+
+class ModelPool(BaseChatModel):
+    """Chat model over ordered backends; see the module docstring."""
+
+    backends: List[Any]
+    breaker: Any = None
+    hedge: bool = False
+    # hedge delay until a backend has enough first-token samples for a p95
+    hedge_delay: float = 2.0
+    hedge_min_delay: float = 0.5
+    first_token_timeout: float = 30.0
+
+    def model_post_init(self, __context):
+        if self.breaker is None:
+            self.breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30.0)
+
+    @property
+    def _llm_type(self) -> str:
+        return "model-pool"
+
+    def bind_tools(self, tools, **kwargs):
+        # same pool (stats, breaker), each backend bound on its own
+        return self.model_copy(
+            update={
+                "backends": [
+                    replace(b, model=b.model.bind_tools(tools, **kwargs))
+                    for b in self.backends
+                ]
+            }
+        )
+
+    def _cooling_down(self, backend: Backend) -> bool:
+        try:
+            # past the cooldown this lets the backend back in as a probe
+            self.breaker.check(backend.name)
+        except CircuitOpenError:
+            return True
+        return False
+
+    def order(self) -> List[Backend]:
+        """Backends to try: in configured order, failing ones last."""
+        return sorted(self.backends, key=self._cooling_down)
+
+    def hedge_after(self, backend: Backend) -> float:
+        p95 = backend.stats.quantile(0.95)
+        if p95 is None:
+            return self.hedge_delay
+        return max(self.hedge_min_delay, p95)
+
+    def stats(self) -> List[Dict]:
+        return [
+            {
+                "backend": b.name,
+                "ok": b.stats.ok,
+                "errors": b.stats.errors,
+                "p50_first_token": b.stats.quantile(0.5),
+                "p95_first_token": b.stats.quantile(0.95),
+                "failing": self.breaker.is_open(b.name),
+            }
+            for b in self.backends
+        ]
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        events: "queue.Queue" = queue.Queue()
+        costs = llm_costs(estimate_tokens(messages))
+
+        def launch(backend: Backend, hedge: bool):
+            def stream():
+                return backend.model.stream(messages, _QUIET, stop=stop, **kwargs)
+
+            return _Attempt(backend, events, stream, costs, hedge)
+
+        race = _Race(self, launch, costs)
+        try:
+            while True:
+                try:
+                    attempt, kind, value = events.get(timeout=race.wait())
+                except queue.Empty:
+                    race.timeout()
+                    continue
+                chunk = race.feed(attempt, kind, value)
+                if chunk is not None:
+                    yield chunk
+                elif race.finished(attempt, kind):
+                    return
+        finally:
+            for attempt in race.running:
+                attempt.cancel()
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        events: asyncio.Queue = asyncio.Queue()
+        costs = llm_costs(estimate_tokens(messages))
+
+        def launch(backend: Backend, hedge: bool):
+            def stream():
+                return backend.model.astream(messages, _QUIET, stop=stop, **kwargs)
+
+            return _AsyncAttempt(backend, events, stream, costs, hedge)
+
+        race = _Race(self, launch, costs)
+        try:
+            while True:
+                try:
+                    attempt, kind, value = await asyncio.wait_for(
+                        events.get(), race.wait()
+                    )
+                except asyncio.TimeoutError:
+                    race.timeout()
+                    continue
+                chunk = race.feed(attempt, kind, value)
+                if chunk is not None:
+                    yield chunk
+                elif race.finished(attempt, kind):
+                    return
+        finally:
+            for attempt in race.running:
+                attempt.cancel()
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        return generate_from_stream(self._stream(messages, stop, **kwargs))
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        return await agenerate_from_stream(self._astream(messages, stop, **kwargs))
@@ -0,0 +1,568 @@
+"""Fetch search result pages and pull out the passages relevant to a query.
+
+web_search only returns titles, links and snippets, so the model used to
+search again and again to get real content. fetch_pages (tools.py) reads
+the top result pages instead:
+
+- pages are fetched concurrently (PAGE_CONCURRENCY), each with a byte cap
+  (PAGE_MAX_BYTES) and a time cap (PAGE_TIMEOUT)
+- the body is streamed through an incremental HTMLParser, so a page is
+  never held in memory as a whole, only its extracted text (bounded too)
+- paragraphs from all pages are ranked against the query (BM25) and the
+  best ones are returned per page, under PAGE_TOKENS in total
+- extracted pages are cached on disk by URL; once stale they are
+  revalidated with If-None-Match / If-Modified-Since, and a 304 only
+  renews the entry
+"""
+
+import asyncio
+import codecs
+import contextvars
+import ipaddress
+import json
+import math
+import os
+import re
+import socket
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from html.parser import HTMLParser
+from typing import Dict, List, Optional
+from urllib.parse import urljoin, urlsplit
+
+from cache import DiskCache, cache_path
+from context import count_tokens
+from http_client import get_client
+from metrics import metrics
+
+PAGE_MAX_URLS = int(os.getenv("PAGE_MAX_URLS", "5"))
+PAGE_CONCURRENCY = int(os.getenv("PAGE_CONCURRENCY", "4"))
+PAGE_MAX_BYTES = int(os.getenv("PAGE_MAX_BYTES", str(512 * 1024)))
+PAGE_TIMEOUT = float(os.getenv("PAGE_TIMEOUT", "6"))
+PAGE_TOKENS = int(os.getenv("PAGE_TOKENS", "1500"))
+# links (and redirects) to localhost / private networks are refused unless
+# this is set
+PAGE_ALLOW_PRIVATE = os.getenv("PAGE_ALLOW_PRIVATE", "").lower() in ("1", "true")
+
+# extracted text kept per page, whatever the size of the HTML
+MAX_TEXT_CHARS = 60_000
+# long paragraphs are ranked in pieces of about this size
+PASSAGE_CHARS = 600
+CHUNK_BYTES = 16 * 1024
+RELEVANCE_FLOOR = 0.3
+MAX_REDIRECTS = 5
+REDIRECT_STATUS = {301, 302, 303, 307, 308}
+
+page_cache = DiskCache(
+    os.getenv("PAGE_CACHE_DB")
+    or os.getenv("SEARCH_CACHE_DB")
+    or cache_path("search_cache.db"),
+    "pages",
+    ttl=float(os.getenv("PAGE_CACHE_TTL", "3600")),
+    stale=float(os.getenv("PAGE_CACHE_STALE", str(7 * 86400))),
+    max_bytes=int(os.getenv("PAGE_CACHE_MAX_BYTES", str(50 * 1024 * 1024))),
+)
+
+SKIP_TAGS = {
+    "script", "style", "noscript", "svg", "template", "iframe", "canvas",
+    "nav", "footer", "aside", "button", "select",
+}
+BLOCK_TAGS = {
+    "p", "div", "li", "br", "tr", "td", "th", "dd", "dt", "pre", "blockquote",
+    "section", "article", "main", "header", "table", "ul", "ol",
+    "h1", "h2", "h3", "h4", "h5", "h6",
+}
+HTML_TYPES = ("text/html", "application/xhtml+xml", "text/plain")
+
+_SENTENCE_END = re.compile(r"(?<=[.!?।])\s+")
+_WORDS = re.compile(r"\w+")
+
+
+class PageError(Exception):
+    pass
+
+
+class TextExtractor(HTMLParser):
+    """Incremental HTML -> paragraphs. Feed it chunks as they arrive;
+    scripts, styles and page chrome (nav, footer, asides) are skipped."""
+
+    def __init__(self, max_chars: int = MAX_TEXT_CHARS):
+        super().__init__(convert_charrefs=True)
+        self.max_chars = max_chars
+        self.title = ""
+        self.paragraphs: List[str] = []
+        self.chars = 0
+        self._parts: List[str] = []
+        self._pending = 0
+        self._skip = 0
+        self._in_title = False
+        self._title: List[str] = []
+
+    @property
+    def full(self) -> bool:
+        return self.chars >= self.max_chars
+
+    def handle_starttag(self, tag, attrs):
+        if tag in SKIP_TAGS:
+            self._skip += 1
+        elif tag == "title" and not self.title:
+            self._in_title = True
+        elif tag in BLOCK_TAGS:
+            self._flush()
+
+    def handle_endtag(self, tag):
+        if tag in SKIP_TAGS:
+            self._skip = max(0, self._skip - 1)
+        elif tag == "title" and self._in_title:
+            self._in_title = False
+            # first <title> only (svg and bad markup can carry more)
+            self.title = " ".join("".join(self._title).split())[:200]
+        elif tag in BLOCK_TAGS:
+            self._flush()
+
+    def handle_data(self, data):
+        if self._in_title:
+            self._title.append(data)
+            return
+        if self._skip or self.full:
+            return
+        self._parts.append(data)
+        self._pending += len(data)
+        if self._pending > PASSAGE_CHARS * 4:
+            # a page without block tags must not pile up in _parts
+            self._flush()
+
+    def _flush(self):
+        text = " ".join("".join(self._parts).split())
+        self._parts, self._pending = [], 0
+        if len(text) < 25 or self.full:
+            return
+        for passage in _passages(text):
+            self.paragraphs.append(passage)
+            self.chars += len(passage)
+
+    def close(self):
+        super().close()
+        self._flush()
+
+
+def _passages(text: str) -> List[str]:
+    if len(text) <= PASSAGE_CHARS:
+        return [text]
+    passages, current = [], ""
+    for sentence in _SENTENCE_END.split(text):
+        if current and len(current) + len(sentence) > PASSAGE_CHARS:
+            passages.append(current)
+            current = ""
+        current = f"{current} {sentence}".strip()[: PASSAGE_CHARS * 2]
+    if current:
+        passages.append(current)
+    return passages
+
+
+class _PageReader:
+    """Decodes and parses body chunks until the byte or time cap."""
+
+    def __init__(self, url: str, headers):
+        content_type = headers.get("content-type", "text/html").lower()
+        if not content_type.startswith(HTML_TYPES):
+            raise PageError(f"not a web page ({content_type.split(';')[0]})")
+        charset = re.search(r"charset=([\w-]+)", content_type)
+        try:
+            decoder = codecs.getincrementaldecoder(
+                charset.group(1) if charset else "utf-8"
+            )
+        except LookupError:
+            decoder = codecs.getincrementaldecoder("utf-8")
+        self.url = url
+        self.headers = headers
+        self.decoder = decoder(errors="replace")
+        self.extractor = TextExtractor()
+        self.bytes = 0
+        self.truncated = False
+        self.started = time.monotonic()
+
+    def feed(self, chunk: bytes) -> bool:
+        """Parse one chunk; True once the page should not be read further."""
+        chunk = chunk[: PAGE_MAX_BYTES - self.bytes]
+        self.bytes += len(chunk)
+        self.extractor.feed(self.decoder.decode(chunk))
+        if (
+            self.bytes >= PAGE_MAX_BYTES
+            or self.extractor.full
+            or time.monotonic() - self.started > PAGE_TIMEOUT
+        ):
+            self.truncated = True
+        return self.truncated
+
+    def page(self) -> Dict:
+        self.extractor.feed(self.decoder.decode(b"", final=True))
+        self.extractor.close()
+        if not self.extractor.paragraphs:
+            raise PageError("no readable text")
+        return {
+            "url": self.url,
+            "title": self.extractor.title,
+            "paragraphs": self.extractor.paragraphs,
+            "etag": self.headers.get("etag"),
+            "last_modified": self.headers.get("last-modified"),
+            "truncated": self.truncated,
+        }
+
+
+def _refused(url: str) -> Optional[str]:
+    """Why `url` may not be read, judged on the URL alone."""
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        return "only http(s) links can be read"
+    if PAGE_ALLOW_PRIVATE:
+        return None
+    host = parts.hostname
+    if host == "localhost" or host.endswith(".localhost"):
+        return "private address"
+    return None
+
+
+def _private(addresses) -> bool:
+    for info in addresses:
+        # IPv6 may carry a scope ("fe80::1%eth0")
+        ip = ipaddress.ip_address(info[4][0].split("%")[0])
+        if getattr(ip, "ipv4_mapped", None):
+            ip = ip.ipv4_mapped
+        # loopback, private, link-local (cloud metadata), unspecified, ...
+        if not ip.is_global or ip.is_multicast:
+            return True
+    return False
+
+
+def _check(url: str):
+    """Raise PageError unless `url` and every address its host resolves to
+    are fine to read. Called again for each redirect hop."""
+    refused = _refused(url)
+    if refused:
+        raise PageError(refused)
+    if PAGE_ALLOW_PRIVATE:
+        return
+    try:
+        addresses = socket.getaddrinfo(urlsplit(url).hostname, None)
+    except socket.gaierror:
+        raise PageError("unknown host") from None
+    if _private(addresses):
+        raise PageError("private address")
+
+
+async def _acheck(url: str):
+    """Async _check(); the lookup does not block the event loop."""
+    refused = _refused(url)
+    if refused:
+        raise PageError(refused)
+    if PAGE_ALLOW_PRIVATE:
+        return
+    try:
+        addresses = await asyncio.get_running_loop().getaddrinfo(
+            urlsplit(url).hostname, None
+        )
+    except socket.gaierror:
+        raise PageError("unknown host") from None
+    if _private(addresses):
+        raise PageError("private address")
+
+
+def _redirect(url: str, response) -> str:
+    location = response.headers.get("location")
+    if not location:
+        raise PageError(f"HTTP {response.status_code} without Location")
+    return urljoin(url, location)
+
+
+def _cached(url: str):
+    """(cached page or None, is it still fresh)."""
+    entry = page_cache.peek(url)
+    if entry is None:
+        return None, False
+    value, expires_at = entry
+    return json.loads(value), expires_at > time.time()
+
+
+def _validators(page: Optional[Dict]) -> Dict[str, str]:
+    headers = {}
+    if page and page.get("etag"):
+        headers["If-None-Match"] = page["etag"]
+    if page and page.get("last_modified"):
+        headers["If-Modified-Since"] = page["last_modified"]
+    return headers
+
+
+def _count(result: str):
+    metrics.inc("page_fetch_total", result=result)
+
+
+def _store(page: Dict, result: str) -> Dict:
+    page_cache.set(page["url"], json.dumps(page, ensure_ascii=False))
+    _count(result)
+    return page
+
+
+class _Fetch:
+    """One page fetch minus the I/O, shared by fetch_page / afetch_page:
+    the cache, redirect hops, revalidation and the stale fallback.
+
+        fetch = _Fetch(url)             # reads the page cache
+        with fetch:
+            for target in fetch.hops():
+                ... check target, open response ...
+                reader = fetch.open(response)
+                if reader is not None:
+                    ... feed it the body ...
+                    fetch.read(reader)
+            fetch.save()                # writes the page cache
+        return fetch.result
+    """
+
+    def __init__(self, url: str):
+        self.url = url
+        self.target = url
+        self.page, self.fresh = _cached(url)
+        self.headers = _validators(self.page)
+        self.result: Optional[Dict] = None
+        # "fetched" / "revalidated" once the result is to be stored
+        self.outcome: Optional[str] = None
+
+    def hops(self):
+        """URLs to request, starting with `url`, until there is a result."""
+        if self.fresh:
+            _count("cached")
+            self.result = self.page
+            return
+        for _ in range(MAX_REDIRECTS + 1):
+            yield self.target
+            if self.result is not None:
+                return
+        raise PageError("too many redirects")
+
+    def open(self, response) -> Optional[_PageReader]:
+        """Reader for the body, or None after a redirect or a 304."""
+        if response.status_code in REDIRECT_STATUS:
+            self.target = _redirect(self.target, response)
+            return None
+        if response.status_code == 304 and self.page is not None:
+            self.result, self.outcome = self.page, "revalidated"
+            return None
+        if response.status_code != 200:
+            raise PageError(f"HTTP {response.status_code}")
+        # cached under the link the model asked for
+        return _PageReader(self.url, response.headers)
+
+    def read(self, reader: _PageReader):
+        self.result, self.outcome = reader.page(), "fetched"
+
+    def save(self):
+        if self.outcome is not None:
+            _store(self.result, self.outcome)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None or not issubclass(exc_type, Exception):
+            return False
+        if self.page is not None:
+            # stale text beats no text
+            _count("stale")
+            self.result = self.page
+            return True
+        _count("error")
+        return False
+
+
+def fetch_page(url: str) -> Dict:
+    fetch = _Fetch(url)
+    with fetch:
+        for target in fetch.hops():
+            _check(target)
+            with get_client().stream(
+                target,
+                timeout=(3.05, PAGE_TIMEOUT),
+                upstream="pages",
+                headers=fetch.headers,
+            ) as response:
+                reader = fetch.open(response)
+                if reader is not None:
+                    for chunk in response.iter_content(CHUNK_BYTES):
+                        if reader.feed(chunk):
+                            break
+                    fetch.read(reader)
+        fetch.save()
+    return fetch.result
+
+
+async def afetch_page(url: str) -> Dict:
+    # the page cache is SQLite: keep it off the event loop
+    fetch = await asyncio.to_thread(_Fetch, url)
+    with fetch:
+        for target in fetch.hops():
+            await _acheck(target)
+            async with get_client().astream(
+                target,
+                timeout=(3.05, PAGE_TIMEOUT),
+                upstream="pages",
+                headers=fetch.headers,
+            ) as response:
+                reader = fetch.open(response)
+                if reader is not None:
+                    async for chunk in response.aiter_bytes(CHUNK_BYTES):
+                        if reader.feed(chunk):
+                            break
+                    fetch.read(reader)
+        await asyncio.to_thread(fetch.save)
+    return fetch.result
+
+
+def _error_text(error: Exception) -> str:
+    if isinstance(error, PageError):
+        return str(error)
+    # class name only - a full requests error is a paragraph
+    return type(error).__name__
+
+
+def _urls(urls: List[str]) -> List[str]:
+    urls = dict.fromkeys(u.strip() for u in urls if u and u.strip())
+    return list(urls)[:PAGE_MAX_URLS]
+
+
+def read_pages(urls: List[str], terms: List[str]) -> str:
+    urls = _urls(urls)
+    results: Dict[str, object] = {}
+    # a link with no chance is refused without a thread or a DNS lookup
+    todo = []
+    for url in urls:
+        refused = _refused(url)
+        if refused:
+            results[url] = PageError(refused)
+        else:
+            todo.append(url)
+    if todo:
+        pool = ThreadPoolExecutor(max_workers=min(PAGE_CONCURRENCY, len(todo)))
+        try:
+            # copied context: the turn's deadline reaches the HTTP client
+            futures = {
+                url: pool.submit(contextvars.copy_context().run, fetch_page, url)
+                for url in todo
+            }
+            for url, future in futures.items():
+                try:
+                    results[url] = future.result()
+                except Exception as e:
+                    results[url] = e
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+    return excerpts(urls, results, terms)
+
+
+async def aread_pages(urls: List[str], terms: List[str]) -> str:
+    urls = _urls(urls)
+    semaphore = asyncio.Semaphore(PAGE_CONCURRENCY)
+
+    async def one(url):
+        refused = _refused(url)
+        if refused:
+            return PageError(refused)
+        async with semaphore:
+            try:
+                return await asyncio.wait_for(
+                    afetch_page(url), timeout=PAGE_TIMEOUT + 3.05
+                )
+            except asyncio.TimeoutError:
+                _count("error")
+                return PageError("timed out")
+            except Exception as e:
+                return e
+
+    pages = await asyncio.gather(*(one(url) for url in urls))
+    return excerpts(urls, dict(zip(urls, pages)), terms)
+
+
+def _bm25(passages: List[List[str]], terms: List[str]) -> List[float]:
+    """BM25 score of each tokenized passage for the query terms."""
+    if not passages or not terms:
+        return [0.0] * len(passages)
+    n = len(passages)
+    avg = sum(len(p) for p in passages) / n or 1.0
+    df = Counter(t for p in passages for t in set(p) & set(terms))
+    scores = []
+    for words in passages:
+        tf = Counter(w for w in words if w in df)
+        score = 0.0
+        for term, count in tf.items():
+            idf = math.log(1 + (n - df[term] + 0.5) / (df[term] + 0.5))
+            norm = 1.2 * (0.25 + 0.75 * len(words) / avg)
+            score += idf * count * 2.2 / (count + norm)
+        scores.append(score)
+    return scores
+
+
+def excerpts(
+    urls: List[str],
+    results: Dict[str, object],
+    terms: List[str],
+    max_tokens: int = PAGE_TOKENS,
+) -> str:
+    """Best passages per page for `terms`, under max_tokens in total.
+
+    Pages come in order of their best passage; passages of a page keep
+    page order. One page gets at most 60% of the budget so the others
+    get a say. Passages scoring under RELEVANCE_FLOOR x the best one are
+    dropped. With no term matches, each page's opening is used.
+    """
+    pages = [(url, results[url]) for url in urls if isinstance(results[url], dict)]
+    terms = [t.lower() for t in terms]
+    candidates = [
+        (page_no, para_no, text)
+        for page_no, (_, page) in enumerate(pages)
+        for para_no, text in enumerate(page["paragraphs"])
+    ]
+    scores = _bm25([_WORDS.findall(c[2].lower()) for c in candidates], terms)
+    # passages far below the best one are filler that shares a common word
+    floor = max(scores, default=0.0) * RELEVANCE_FLOOR
+    ranked = [
+        candidate
+        for score, candidate in sorted(
+            zip(scores, candidates), key=lambda pair: -pair[0]
+        )
+        if score > 0 and score >= floor
+    ]
+    if not ranked:
+        # nothing matched: openings first, round robin over pages
+        ranked = sorted(candidates, key=lambda c: (c[1], c[0]))
+
+    page_cap = max(int(max_tokens * 0.6), 1)
+    used, per_page, seen = 0, Counter(), set()
+    chosen: Dict[int, List[tuple]] = {}
+    for page_no, para_no, text in ranked:
+        if text in seen:
+            # mirrors and boilerplate repeat across (and within) pages
+            continue
+        seen.add(text)
+        tokens = count_tokens(text) + 2
+        if used + tokens > max_tokens or per_page[page_no] + tokens > page_cap:
+            continue
+        used += tokens
+        per_page[page_no] += tokens
+        chosen.setdefault(page_no, []).append((para_no, text))
+
+    blocks = []
+    for page_no in chosen:  # insertion order = best passage first
+        url, page = pages[page_no]
+        lines = [f"[{len(blocks) + 1}] {page['title'] or url} - {url}"]
+        lines += [f"… {text}" for _, text in sorted(chosen[page_no])]
+        blocks.append("\n".join(lines))
+    for page_no, (url, page) in enumerate(pages):
+        if page_no not in chosen:
+            title = page["title"] or url
+            blocks.append(f"[{len(blocks) + 1}] {title} - {url} - nothing relevant")
+    for url in urls:
+        if not isinstance(results[url], dict):
+            error = _error_text(results[url])
+            blocks.append(f"[{len(blocks) + 1}] {url} - ❌ {error}")
+    return "\n\n".join(blocks) if blocks else "No readable content in these pages."
@@ -0,0 +1,425 @@
+"""Client-side rate limits for Groq and Google CSE, with fair queueing.
+
+Each upstream gets token buckets: Groq requests and tokens per minute
+(GROQ_RPM, GROQ_TPM), Google CSE queries per second and per day
+(GOOGLE_CSE_QPS, GOOGLE_CSE_QPD). A limit that is not set is not
+enforced. Callers acquire before the request; when a bucket is empty they
+wait in line instead of sending a request that comes back 429 and then
+retries into the same wall.
+
+Waiting callers are served round-robin across chats (thread_id) and FIFO
+within a chat, so one chat firing many searches can't starve the rest.
+Bucket levels live in memory, or with RATE_LIMIT_DB in a SQLite table
+shared by every worker process on the host.
+
+Nobody waits longer than RATE_LIMIT_MAX_WAIT or past the turn's deadline:
+such a caller gets RateLimited, which the tools report like any other
+error and the chatbot turns into a "busy, try again" reply.
+"""
+
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from budget import remaining
+from metrics import metrics
+from storage import open_sqlite
+
+RATE_LIMIT_DB = os.getenv("RATE_LIMIT_DB")
+RATE_LIMIT_MAX_WAIT = float(os.getenv("RATE_LIMIT_MAX_WAIT", "30"))
+# completion tokens held back per LLM call until the real usage is known
+LLM_TOKEN_RESERVE = 512
+
+# reply when the chat model's queue is too long to wait out
+BUSY_REPLY = (
+    "Abhi bahut saare log ek saath pooch rahe hain, isliye main line me hi "
+    "atka reh gaya. Thodi der baad dobara poochoge to turant bata dunga!"
+)
+
+# chat the running tool call is for; set by ToolRunner like the deadline
+_chat: ContextVar[Optional[str]] = ContextVar("rate_limit_chat", default=None)
+
+
+class RateLimited(Exception):
+    """The wait for a rate limit would run past the allowed time."""
+
+
+@dataclass(frozen=True)
+class Bucket:
+    """`capacity` tokens of `resource`, refilled at `rate` per second."""
+
+    name: str
+    resource: str
+    capacity: float
+    rate: float
+
+    def level(self, state: Optional[Tuple[float, float]], now: float) -> float:
+        if state is None:
+            return self.capacity
+        level, updated = state
+        return min(self.capacity, level + (now - updated) * self.rate)
+
+
+Items = List[Tuple[Bucket, float]]
+
+
+def _shortfall(items: Items, levels: Dict[str, float]) -> float:
+    """Seconds until every bucket holds its cost (0 = take now)."""
+    wait = 0.0
+    for bucket, cost in items:
+        # a cost above capacity waits for a full bucket and leaves a debt
+        need = min(cost, bucket.capacity) - levels[bucket.name]
+        if need > 0:
+            wait = max(wait, need / bucket.rate)
+    return wait
+
+
+class MemoryBuckets:
+    """Bucket levels for this process only."""
+
+    def __init__(self):
+        self._state: Dict[str, Tuple[float, float]] = {}
+        self._lock = threading.Lock()
+
+    def take(self, items: Items, force: bool = False) -> float:
+        """Take every cost and return 0, or take nothing and return the wait.
+        force=True always takes (levels may go negative)."""
+        now = time.time()
+        with self._lock:
+            levels = {b.name: b.level(self._state.get(b.name), now) for b, _ in items}
+            wait = 0.0 if force else _shortfall(items, levels)
+            if wait == 0:
+                for bucket, cost in items:
+                    self._state[bucket.name] = (levels[bucket.name] - cost, now)
+        return wait
+
+
+class SqliteBuckets:
+    """Bucket levels in a SQLite table, so worker processes share them."""
+
+    def __init__(self, path: str):
+        self._conn = open_sqlite(path)
+        # explicit BEGIN IMMEDIATE below, so the read-modify-write holds the
+        # write lock across processes
+        self._conn.isolation_level = None
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS rate_buckets (
+                    name TEXT PRIMARY KEY,
+                    level REAL NOT NULL,
+                    updated REAL NOT NULL
+                )
+                """
+            )
+
+    def take(self, items: Items, force: bool = False) -> float:
+        """See MemoryBuckets.take()."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                levels = {}
+                for bucket, _ in items:
+                    row = self._conn.execute(
+                        "SELECT level, updated FROM rate_buckets WHERE name = ?",
+                        (bucket.name,),
+                    ).fetchone()
+                    levels[bucket.name] = bucket.level(row, now)
+                wait = 0.0 if force else _shortfall(items, levels)
+                if wait == 0:
+                    self._conn.executemany(
+                        "INSERT OR REPLACE INTO rate_buckets (name, level, updated) "
+                        "VALUES (?, ?, ?)",
+                        [(b.name, levels[b.name] - cost, now) for b, cost in items],
+                    )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return wait
+
+
+class _Waiter:
+    __slots__ = ("thread_id", "items", "wake", "granted")
+
+    def __init__(self, thread_id: str, items: Items, wake):
+        self.thread_id = thread_id
+        self.items = items
+        self.wake = wake
+        self.granted = False
+
+
+def _wake(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
+
+
+class RateLimiter:
+    """Token buckets of one upstream plus the line of callers waiting on them.
+
+    Only the head of the line polls the buckets; when it has to wait, a
+    timer wakes the line once enough has refilled.
+    """
+
+    def __init__(self, upstream: str, buckets: List[Bucket], store, max_wait: float):
+        self.upstream = upstream
+        self.buckets = buckets
+        self.store = store
+        self.max_wait = max_wait
+        # thread_id -> its waiters; dict order is the order chats are served
+        self._line: "OrderedDict[str, deque]" = OrderedDict()
+        self._timer: Optional[threading.Timer] = None
+        self._lock = threading.Lock()
+        self.granted = 0
+        self.rejected = 0
+        self.waited = 0.0
+
+    def _items(self, costs: Dict[str, float]) -> Items:
+        return [(b, costs[b.resource]) for b in self.buckets if costs.get(b.resource)]
+
+    def _max_wait(self, deadline: Optional[float]) -> float:
+        left = remaining(deadline)
+        return self.max_wait if left is None else max(0.0, min(self.max_wait, left))
+
+    def depth(self) -> int:
+        return sum(len(waiters) for waiters in self._line.values())
+
+    def _enqueue_locked(self, waiter: _Waiter):
+        self._line.setdefault(waiter.thread_id, deque()).append(waiter)
+        metrics.gauge("rate_limit_queue_depth", self.depth(), upstream=self.upstream)
+        self._dispatch_locked()
+
+    def _dispatch_locked(self):
+        while self._line:
+            thread_id, waiters = next(iter(self._line.items()))
+            wait = self.store.take(waiters[0].items)
+            if wait > 0:
+                self._schedule_locked(wait)
+                break
+            waiter = waiters.popleft()
+            # round robin: this chat goes to the back of the line
+            del self._line[thread_id]
+            if waiters:
+                self._line[thread_id] = waiters
+            waiter.granted = True
+            waiter.wake()
+        metrics.gauge("rate_limit_queue_depth", self.depth(), upstream=self.upstream)
+
+    def _schedule_locked(self, wait: float):
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = threading.Timer(wait, self._on_timer)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _on_timer(self):
+        with self._lock:
+            self._timer = None
+            self._dispatch_locked()
+
+    def _give_up_locked(self, waiter: _Waiter) -> bool:
+        """Drop a waiter that timed out; False if it was granted meanwhile."""
+        if waiter.granted:
+            return False
+        waiters = self._line.get(waiter.thread_id)
+        if waiters is not None:
+            waiters.remove(waiter)
+            if not waiters:
+                del self._line[waiter.thread_id]
+        # the head may have changed
+        self._dispatch_locked()
+        return True
+
+    def _try_now_locked(self, items: Items, max_wait: float) -> Optional[float]:
+        """0 if taken right away, None to queue; raises if the wait is hopeless."""
+        if self._line:
+            return None
+        wait = self.store.take(items)
+        if wait == 0:
+            return 0.0
+        if wait > max_wait:
+            # e.g. the daily quota is gone - no point holding the caller
+            self._reject(wait)
+        return None
+
+    def _reject(self, wait: float):
+        self.rejected += 1
+        metrics.inc("rate_limit_total", upstream=self.upstream, result="rejected")
+        raise RateLimited(
+            f"{self.upstream} rate limit: would have to wait {wait:.0f}s, "
+            "try again later"
+        )
+
+    def _done(self, waited: float) -> float:
+        self.granted += 1
+        self.waited += waited
+        metrics.inc(
+            "rate_limit_total",
+            upstream=self.upstream,
+            result="queued" if waited > 0 else "immediate",
+        )
+        metrics.observe("rate_limit_wait_seconds", waited, upstream=self.upstream)
+        return waited
+
+    def acquire(
+        self,
+        costs: Dict[str, float],
+        thread_id: Optional[str] = None,
+        deadline: Optional[float] = None,
+    ) -> float:
+        """Block until `costs` (resource -> amount) are taken; returns the wait."""
+        items = self._items(costs)
+        if not items:
+            return 0.0
+        max_wait = self._max_wait(deadline)
+        start = time.monotonic()
+        event = threading.Event()
+        waiter = _Waiter(thread_id or _chat.get() or "", items, event.set)
+        with self._lock:
+            if self._try_now_locked(items, max_wait) == 0:
+                return self._done(0.0)
+            self._enqueue_locked(waiter)
+        if not event.wait(max_wait):
+            with self._lock:
+                if self._give_up_locked(waiter):
+                    self._reject(max_wait)
+        return self._done(time.monotonic() - start)
+
+    async def aacquire(
+        self,
+        costs: Dict[str, float],
+        thread_id: Optional[str] = None,
+        deadline: Optional[float] = None,
+    ) -> float:
+        """acquire() that waits on the event loop instead of blocking it."""
+        items = self._items(costs)
+        if not items:
+            return 0.0
+        max_wait = self._max_wait(deadline)
+        start = time.monotonic()
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        waiter = _Waiter(
+            thread_id or _chat.get() or "",
+            items,
+            lambda: loop.call_soon_threadsafe(_wake, future),
+        )
+        with self._lock:
+            if self._try_now_locked(items, max_wait) == 0:
+                return self._done(0.0)
+            self._enqueue_locked(waiter)
+        try:
+            await asyncio.wait_for(future, max_wait)
+        except asyncio.TimeoutError:
+            with self._lock:
+                if self._give_up_locked(waiter):
+                    self._reject(max_wait)
+        except asyncio.CancelledError:
+            # turn cancelled while queued - leave the line, or hand back
+            # what was granted just before
+            with self._lock:
+                if not self._give_up_locked(waiter):
+                    self.release(costs)
+            raise
+        return self._done(time.monotonic() - start)
+
+    def release(self, costs: Dict[str, float]):
+        """Give back costs that were taken but not used."""
+        items = [(b, -cost) for b, cost in self._items(costs)]
+        if items:
+            self.store.take(items, force=True)
+
+    def settle(self, resource: str, amount: float):
+        """Correct an estimate once the real cost is known (negative = refund)."""
+        items = [(b, amount) for b in self.buckets if b.resource == resource]
+        if items and amount:
+            self.store.take(items, force=True)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "upstream": self.upstream,
+                "queue_depth": self.depth(),
+                "chats_waiting": len(self._line),
+                "granted": self.granted,
+                "rejected": self.rejected,
+                "mean_wait": self.waited / self.granted if self.granted else 0.0,
+            }
+
+
+def llm_costs(prompt_tokens: int) -> Dict[str, float]:
+    """What one chat model call takes: a request, and its prompt plus a
+    reserve for the reply until settle() swaps in the real usage."""
+    return {"requests": 1, "tokens": prompt_tokens + LLM_TOKEN_RESERVE}
+
+
+@contextmanager
+def chat_scope(thread_id: Optional[str]):
+    """Queue calls made inside the block under `thread_id`."""
+    token = _chat.set(thread_id)
+    try:
+        yield
+    finally:
+        _chat.reset(token)
+
+
+def _env(name: str) -> float:
+    return float(os.getenv(name, "0") or 0)
+
+
+def _buckets(upstream: str) -> List[Bucket]:
+    # (resource, limit, period in seconds); 0 = not enforced
+    limits = {
+        "groq": [
+            ("requests", _env("GROQ_RPM"), 60.0),
+            ("tokens", _env("GROQ_TPM"), 60.0),
+        ],
+        "google_cse": [
+            ("queries", _env("GOOGLE_CSE_QPS"), 1.0),
+            ("queries", _env("GOOGLE_CSE_QPD"), 86400.0),
+        ],
+    }.get(upstream, [])
+    return [
+        Bucket(f"{upstream}:{resource}/{period:g}s", resource, limit, limit / period)
+        for resource, limit, period in limits
+        if limit > 0
+    ]
+
+
+# process-wide limiters, shared by every session and tool call
+_limiters: Dict[str, Optional[RateLimiter]] = {}
+_store = None
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(upstream: str) -> Optional[RateLimiter]:
+    """The upstream's limiter, or None when none of its limits are set."""
+    global _store
+    if upstream in _limiters:
+        return _limiters[upstream]
+    with _limiters_lock:
+        if upstream not in _limiters:
+            buckets = _buckets(upstream)
+            limiter = None
+            if buckets:
+                if _store is None and RATE_LIMIT_DB:
+                    _store = SqliteBuckets(RATE_LIMIT_DB)
+                elif _store is None:
+                    _store = MemoryBuckets()
+                limiter = RateLimiter(upstream, buckets, _store, RATE_LIMIT_MAX_WAIT)
+            _limiters[upstream] = limiter
+        return _limiters[upstream]
+
+
+def reset_limiters():
+    """Forget the limiters so the next get_limiter() reads the env again."""
+    with _limiters_lock:
+        _limiters.clear()
@@ -0,0 +1,72 @@
+"""HTML for chat bubbles, memoized per message.
+
+Streamlit reruns the whole script on every interaction, so the transcript
+is rebuilt each time. The HTML for a message only depends on its role and
+content, so it is built once and cached by (role, content); only the
+visible window of the transcript is drawn (see main.py).
+"""
+
+import html
+import os
+import re
+from functools import lru_cache
+from typing import Dict, List, Tuple
+
+RENDER_CACHE_SIZE = int(os.getenv("RENDER_CACHE_SIZE", "2048"))
+# messages shown on first load of a chat; "load earlier" adds this many more
+TRANSCRIPT_WINDOW = int(os.getenv("TRANSCRIPT_WINDOW", "30"))
+
+# fenced ``` blocks and inline `code` - markdown shows these literally
+_CODE = re.compile(r"(```.*?(?:```|\Z)|`[^`\n]+`)", re.DOTALL)
+
+LABELS = {"user": "You:", "assistant": "🤖 Assistant:"}
+
+
+def escape_user(text: str) -> str:
+    """User text is shown as typed: no HTML, no markdown."""
+    return html.escape(text).replace("\n", "<br>")
+
+
+def escape_markdown_html(text: str) -> str:
+    """Keep the reply's markdown but neutralise raw HTML tags in it.
+
+    Only `<` is escaped (`>` and `&` are harmless and `>` starts quotes);
+    code spans and fences are left alone since markdown already shows
+    them as text.
+    """
+    parts = _CODE.split(text)
+    for i in range(0, len(parts), 2):
+        parts[i] = parts[i].replace("<", "&lt;")
+    return "".join(parts)
+
+
+def build_message_html(role: str, content: str) -> str:
+    if role == "user":
+        return (
+            '<div class="user-message">'
+            f"<strong>{LABELS['user']}</strong><br>{escape_user(content)}</div>"
+        )
+    # blank lines around the body so it is parsed as markdown, not as part
+    # of the surrounding HTML block
+    return (
+        '<div class="assistant-message">\n'
+        f"<strong>{LABELS['assistant']}</strong>\n\n"
+        f"{escape_markdown_html(content)}\n\n"
+        "</div>"
+    )
+
+
+@lru_cache(maxsize=RENDER_CACHE_SIZE)
+def message_html(role: str, content: str) -> str:
+    """Cached build_message_html(); use for finished messages only."""
+    return build_message_html(role, content)
+
+
+def visible_window(messages: List[Dict], shown: int) -> Tuple[int, List[Dict]]:
+    """(number of hidden earlier messages, the last `shown` messages).
+
+    Tool rows are history for the model, not bubbles, so they are skipped.
+    """
+    bubbles = [m for m in messages if m["role"] in LABELS]
+    hidden = max(0, len(bubbles) - shown)
+    return hidden, bubbles[hidden:]
@@ -0,0 +1,134 @@
+"""Exact-match cache for chatbot replies (opt-in, RESPONSE_CACHE=1).
+
+Lots of chats open with the same question ("what can you do", "tumhe
+kisne banaya") and no history, so the model sees the exact same input
+every time. The key is a hash of everything the model sees: system
+prompt, model, bound tool schemas and the (normalized) message history.
+
+Only plain text replies are stored. Turns that want fresh data are never
+looked up or stored: the last message is a tool result, or the user text
+mentions weather / news / "aaj" etc. (the model would call a tool, and
+yesterday's answer would be wrong).
+"""
+
+import hashlib
+import json
+import re
+import threading
+from typing import Dict, List, Optional
+
+from langchain_core.messages import AIMessage, BaseMessage, ToolMessage
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+from cache import TTLCache
+from metrics import metrics
+
+# English + Hinglish hints that the answer depends on when it is asked
+TIME_SENSITIVE = re.compile(
+    r"\b("
+    r"weather|mausam|temperature|temp|forecast|rain|barish|baarish|garmi|sardi|"
+    r"news|khabar|latest|today|tonight|tomorrow|yesterday|now|current|currently|"
+    r"aaj|abhi|kal|live|score|price|stock|rate|search|google|internet|"
+    r"\d{4}"
+    r")\b",
+    re.IGNORECASE,
+)
+
+_SPACES = re.compile(r"\s+")
+
+
+def _normalize(message: BaseMessage) -> Dict:
+    content = message.content
+    if not isinstance(content, str):
+        content = json.dumps(content, sort_keys=True)
+    content = _SPACES.sub(" ", content).strip()
+    if message.type == "human":
+        # "What can you do?" and "what can you do" are the same question
+        content = content.casefold().rstrip("?!. ")
+    entry = {"type": message.type, "content": content}
+    if isinstance(message, AIMessage) and message.tool_calls:
+        entry["tool_calls"] = [
+            {"name": c["name"], "args": c["args"]} for c in message.tool_calls
+        ]
+    return entry
+
+
+class ResponseCache:
+    """TTL + LRU bounded reply cache with hit / miss / bypass counts."""
+
+    def __init__(
+        self, model: str, tools: List, maxsize: int = 512, ttl: float = 3600.0
+    ):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        schemas = [convert_to_openai_tool(t) for t in tools]
+        # model and tool schemas are fixed per engine, hash them once
+        self._base = hashlib.sha256(
+            json.dumps({"model": model, "tools": schemas}, sort_keys=True).encode()
+        ).hexdigest()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+
+    def bypass(self, messages: List[BaseMessage]) -> bool:
+        last = messages[-1] if messages else None
+        if last is None or isinstance(last, ToolMessage):
+            return True
+        if last.type == "human" and isinstance(last.content, str):
+            return bool(TIME_SENSITIVE.search(last.content))
+        return False
+
+    def key(self, messages: List[BaseMessage]) -> str:
+        """messages = exactly what goes to the model, system prompt first."""
+        digest = hashlib.sha256(self._base.encode())
+        for message in messages:
+            digest.update(
+                json.dumps(_normalize(message), sort_keys=True).encode("utf-8")
+            )
+            digest.update(b"\x00")
+        return digest.hexdigest()
+
+    def lookup(self, messages: List[BaseMessage]) -> Optional[str]:
+        """Cache key for this call, or None when the turn must not be cached."""
+        if self.bypass(messages):
+            self._count("bypass")
+            return None
+        return self.key(messages)
+
+    def get(self, key: str) -> Optional[AIMessage]:
+        content = self._cache.get(key)
+        self._count("miss" if content is None else "hit")
+        if content is None:
+            return None
+        return AIMessage(content=content, response_metadata={"cache": "hit"})
+
+    def put(self, key: str, message: AIMessage):
+        if message.tool_calls or not isinstance(message.content, str):
+            return
+        if not message.content.strip():
+            return
+        self._cache.set(key, message.content)
+
+    def _count(self, result: str):
+        with self._lock:
+            if result == "hit":
+                self.hits += 1
+            elif result == "miss":
+                self.misses += 1
+            else:
+                self.bypassed += 1
+        metrics.inc("response_cache_total", result=result)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": self._cache.stats()["size"],
+                "hits": self.hits,
+                "misses": self.misses,
+                "bypassed": self.bypassed,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            }
+
+    def clear(self):
+        self._cache.clear()
@@ -0,0 +1,241 @@
+"""Rule-based pre-router: skip the first LLM hop for obvious tool queries.
+
+"weather in London" normally costs two model calls: one that only decides
+to call get_weather, and one that phrases the result. The router node
+runs first and matches the new user message against a few anchored
+patterns (English + Hinglish, like system_prompt.py). A confident match
+emits the tool call itself, so the model is only asked to phrase the
+answer; anything else goes to the chatbot node as before.
+
+Opt-in with ROUTER=1; ROUTER_MIN_CONFIDENCE (default 0.8) sets how sure a
+match must be.
+"""
+
+import re
+import threading
+import uuid
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.runnables import RunnableConfig
+
+from metrics import metrics
+
+_PLACE = r"(?P<place>[^\W\d_][\w .,'&-]{0,80}?)"
+_QUERY = r"(?P<query>.{2,200}?)"
+_NOW = r"(?:\s+(?:today|tonight|now|right now|currently|aaj|abhi))?"
+_HINDI_TAIL = (
+    r"(?:\s+(?:kaisa|kaise|kya|kitna|kitni))?"
+    r"(?:\s+(?:hai|he|h|hoga|rahega|chal raha hai))?"
+    r"(?:\s+(?:batao|bata do|bataiye|btao))?"
+)
+
+# (intent, tool, base confidence, pattern) - matched against the whole
+# message, lowercased, single spaced, without trailing ?!.
+PATTERNS = [
+    (
+        "weather",
+        "get_weather",
+        0.95,
+        r"(?:(?:what's|whats|what is|how's|hows|how is)\s+)?(?:the\s+)?"
+        r"(?:(?:weather|forecast)(?:\s+like)?\s+(?:in|at|of|for)"
+        # "temperature of water" is not a city
+        r"|(?:temperature|temp)\s+(?:in|for))"
+        r"\s+" + _PLACE + _NOW,
+    ),
+    (
+        "weather",
+        "get_weather",
+        0.95,
+        _PLACE + r"\s+(?:ka|ki|ke|me|mein|main|mai)\s+(?:aaj\s+|abhi\s+)?"
+        r"(?:ka\s+)?(?:mausam|weather|temperature|temp)" + _HINDI_TAIL,
+    ),
+    (
+        "weather",
+        "get_weather",
+        0.85,
+        _PLACE + r"\s+(?:weather|mausam|temperature|forecast)" + _NOW + _HINDI_TAIL,
+    ),
+    (
+        "weather",
+        "get_weather",
+        0.85,
+        r"(?:weather|mausam|temperature)" + _NOW + r"\s+" + _PLACE,
+    ),
+    (
+        "search",
+        "web_search",
+        0.95,
+        r"(?:search|google|look up|lookup)"
+        r"(?:\s+(?:for|about|the web for|online for|on google))?\s+" + _QUERY,
+    ),
+    (
+        "search",
+        "web_search",
+        0.9,
+        _QUERY + r"\s+(?:search|google)\s+(?:karo|kar do|kariye|karke batao)",
+    ),
+    (
+        "news",
+        "web_search",
+        0.85,
+        r"(?:latest|today's|todays|aaj ki|taza)\s+(?:news|khabar)"
+        r"(?:\s+(?:about|on|of|for|par|pe|ke baare me|ke bare me))?\s+" + _QUERY,
+    ),
+]
+PATTERNS = [
+    (intent, tool, confidence, re.compile(pattern + r"$"))
+    for intent, tool, confidence, pattern in PATTERNS
+]
+
+# a place that points back into the chat needs the model to resolve it
+_REFERENCES = re.compile(
+    r"\b(there|here|that|it|this|my|our|your|wahan|waha|yahan|yaha|udhar|idhar|"
+    r"uska|iska|mere|hamare)\b"
+)
+# the user asked for more than just the tool result
+_EXTRA = re.compile(
+    r"\b(and (?:tell|explain|also|suggest|what|how|why)|also|then|why|explain|"
+    r"compare|should i|aur batao|aur bata|kyun|kyu|samjhao|plan)\b"
+)
+# get_weather only knows the current weather in its own units: a forecast
+# day or a unit conversion is left to the model
+_QUALIFIERS = re.compile(
+    r"\b(tomorrow|tmrw|yesterday|tonight|week|weekend|month|next|later|morning|"
+    r"afternoon|evening|night|hourly|kal|parso|monday|tuesday|wednesday|thursday|"
+    r"friday|saturday|sunday|celsius|centigrade|fahrenheit|kelvin|degrees?|metric|"
+    r"imperial|units?)\b"
+)
+# words that don't make a search query on their own ("search karo")
+_FILLER = {
+    "kya", "hai", "he", "h", "karo", "kar", "do", "kariye", "batao", "bata",
+    "please", "pls", "plz", "it", "this", "that", "something", "anything",
+    "me", "mujhe", "for", "about", "the", "a", "an", "ye", "yeh", "woh", "wo",
+}
+_SPLIT_PLACES = re.compile(r"\s*(?:,|&|\band\b|\baur\b)\s*", re.IGNORECASE)
+_SPACES = re.compile(r"\s+")
+
+
+def _call_id() -> str:
+    return f"route_{uuid.uuid4().hex[:12]}"
+
+
+@dataclass
+class Route:
+    intent: str
+    confidence: float
+    tool_calls: List[Dict] = field(default_factory=list)
+
+
+def _places(raw: str) -> Optional[List[str]]:
+    places = [p.strip(" .,'-") for p in _SPLIT_PLACES.split(raw)]
+    places = [p for p in places if p]
+    if not places or len(places) > 5:
+        return None
+    for place in places:
+        if len(place.split()) > 4:
+            return None
+        lowered = place.lower()
+        if _REFERENCES.search(lowered) or _QUALIFIERS.search(lowered):
+            return None
+    return places
+
+
+def _query(raw: str) -> Optional[str]:
+    query = raw.strip()
+    if all(word in _FILLER for word in query.lower().split()):
+        return None
+    return query
+
+
+class PreRouter:
+    """Graph node: emits tool calls for confident matches, else nothing."""
+
+    def __init__(self, tool_names: List[str], min_confidence: float = 0.8):
+        self.tool_names = set(tool_names)
+        self.min_confidence = min_confidence
+        self._lock = threading.Lock()
+        self.counts = {"fast_path": 0, "low_confidence": 0, "no_match": 0}
+
+    def classify(self, text: str) -> Optional[Route]:
+        original = _SPACES.sub(" ", text).strip().rstrip("?!. ")
+        text = original.lower()
+        # entities keep the user's casing when lowercasing kept the length
+        source = original if len(original) == len(text) else text
+        for intent, tool, confidence, pattern in PATTERNS:
+            if tool not in self.tool_names:
+                continue
+            match = pattern.match(text)
+            if match is None:
+                continue
+            if len(text.split()) > 12:
+                confidence -= 0.2
+            if _EXTRA.search(text):
+                confidence -= 0.3
+            if intent == "weather":
+                places = _places(source[match.start("place") : match.end("place")])
+                if places is None:
+                    continue
+                if len(places) > 1 and "get_weather_batch" in self.tool_names:
+                    calls = [("get_weather_batch", {"cities": places})]
+                else:
+                    calls = [(tool, {"city": place}) for place in places]
+            else:
+                query = _query(source[match.start("query") : match.end("query")])
+                if query is None:
+                    continue
+                if intent == "news":
+                    query = f"latest news {query}"
+                calls = [(tool, {"query": query})]
+            return Route(
+                intent,
+                round(confidence, 2),
+                [
+                    {"name": name, "args": args, "id": _call_id()}
+                    for name, args in calls
+                ],
+            )
+        return None
+
+    def run(self, state, config: RunnableConfig = None):
+        last = state["messages"][-1]
+        if not isinstance(last, HumanMessage) or not isinstance(last.content, str):
+            return {}
+        thread_id = (config or {}).get("configurable", {}).get("thread_id")
+        with metrics.span("router", "node", thread_id=thread_id) as span:
+            route = self.classify(last.content)
+            if route is None:
+                result = "no_match"
+            elif route.confidence < self.min_confidence:
+                result = "low_confidence"
+            else:
+                result = "fast_path"
+            span.set(result=result)
+            if route is not None:
+                span.set(intent=route.intent, confidence=route.confidence)
+        self._count(result, route.intent if route else "none")
+        if result != "fast_path":
+            return {}
+        return {"messages": [AIMessage(content="", tool_calls=route.tool_calls)]}
+
+    def _count(self, result: str, intent: str):
+        with self._lock:
+            self.counts[result] += 1
+        metrics.inc("router_total", result=result, intent=intent)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            total = sum(self.counts.values())
+            fast = self.counts["fast_path"]
+            return dict(
+                self.counts, fast_path_rate=round(fast / total, 3) if total else 0.0
+            )
+
+
+def route_after_router(state) -> str:
+    """Conditional edge: straight to tools if the router emitted calls."""
+    last = state["messages"][-1]
+    if isinstance(last, AIMessage) and last.tool_calls:
+        return "tools"
+    return "chatbot"
@@ -0,0 +1,284 @@
+"""Headless HTTP / SSE API in front of the compiled graph.
+
+Run several workers behind a proxy:
+    uvicorn server:app --workers 4 --port 8000
+
+Every worker shares the same SQLite DB (CHAT_DB_PATH) for chats and
+graph checkpoints, so any worker can continue any chat.
+
+Chat routes are scoped to the caller's X-Chat-Owner header, a random key
+per user (the Streamlit UI sends its own). The key is trusted as is, so
+put real authentication in the proxy in front. CHAT_SHARED=1 drops the
+header and shares one history between everyone.
+"""
+
+import asyncio
+import dataclasses
+import json
+import os
+import re
+import uuid
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import Optional
+
+from fastapi import Depends, FastAPI, Header, HTTPException, Request
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import BaseModel
+
+from engine import get_engine
+from metrics import metrics
+from storage import CHAT_SHARED, SHARED_OWNER, get_store
+from streaming import astream_engine_turn
+from tool_history import ToolTranscript
+
+MAX_CONCURRENT_TURNS = int(os.getenv("MAX_CONCURRENT_TURNS", "64"))
+# how long a new turn may wait for a free slot before we answer 503
+TURN_QUEUE_TIMEOUT = float(os.getenv("TURN_QUEUE_TIMEOUT", "5"))
+SHUTDOWN_GRACE = float(os.getenv("SHUTDOWN_GRACE", "30"))
+# a chat's turn claim in the DB lapses after this long (its worker died)
+TURN_CLAIM_TTL = float(os.getenv("TURN_CLAIM_TTL", "300"))
+
+
+class TurnGate:
+    """Caps in-flight turns, one turn per chat, and drains on shutdown.
+
+    This is per process; send_message() also claims the chat in the DB so
+    that two workers can't run turns on the same chat either.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.slots = asyncio.Semaphore(limit)
+        self.busy_chats = set()
+        self.in_flight = 0
+        self.draining = False
+        self.idle = asyncio.Event()
+        self.idle.set()
+
+    async def acquire(self, chat_id: str):
+        if self.draining:
+            raise HTTPException(503, "server is shutting down", {"Retry-After": "1"})
+        if chat_id in self.busy_chats:
+            raise HTTPException(409, "a reply for this chat is already running")
+        try:
+            await asyncio.wait_for(self.slots.acquire(), TURN_QUEUE_TIMEOUT)
+        except asyncio.TimeoutError:
+            raise HTTPException(503, "server busy, try again", {"Retry-After": "2"})
+        if chat_id in self.busy_chats:
+            # another request for this chat got in while we waited
+            self.slots.release()
+            raise HTTPException(409, "a reply for this chat is already running")
+        self.busy_chats.add(chat_id)
+        self.in_flight += 1
+        self.idle.clear()
+
+    def release(self, chat_id: str):
+        self.busy_chats.discard(chat_id)
+        self.in_flight -= 1
+        self.slots.release()
+        if self.in_flight == 0:
+            self.idle.set()
+
+    async def drain(self, timeout: float):
+        self.draining = True
+        try:
+            await asyncio.wait_for(self.idle.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    app.state.gate = TurnGate(MAX_CONCURRENT_TURNS)
+    # build engine + open this loop's async graph before taking traffic
+    await get_engine().aget_graph()
+    yield
+    await app.state.gate.drain(SHUTDOWN_GRACE)
+
+
+app = FastAPI(title="GPT-burrito", lifespan=lifespan)
+
+
+class NewChat(BaseModel):
+    title: Optional[str] = None
+
+
+class NewMessage(BaseModel):
+    content: str
+    # lets a client that made up its own chat id (the Streamlit UI) create
+    # the chat on its first message
+    title: Optional[str] = None
+    created_at: Optional[str] = None
+
+
+def chat_owner(x_chat_owner: Optional[str] = Header(None)) -> str:
+    """The caller's owner key; every chat route only sees that owner's chats."""
+    if CHAT_SHARED:
+        return SHARED_OWNER
+    if not x_chat_owner or not re.fullmatch(r"[\w-]{16,64}", x_chat_owner):
+        raise HTTPException(400, "X-Chat-Owner header (16-64 letters) required")
+    return x_chat_owner
+
+
+def _new_chat(title: Optional[str] = None, chat_id: Optional[str] = None) -> dict:
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M")
+    return {
+        "id": chat_id or str(uuid.uuid4())[:8],
+        "title": title or f"Chat {timestamp}",
+        "created_at": timestamp,
+    }
+
+
+@app.post("/chats", status_code=201)
+async def create_chat(body: NewChat, owner: str = Depends(chat_owner)):
+    chat = _new_chat(body.title)
+    await asyncio.to_thread(get_store().save_messages, owner, chat, [])
+    return chat
+
+
+@app.get("/chats")
+async def list_chats(
+    limit: int = 20, offset: int = 0, owner: str = Depends(chat_owner)
+):
+    store = get_store()
+    chats = await asyncio.to_thread(store.list_chats, owner, min(limit, 100), offset)
+    total = await asyncio.to_thread(store.count_chats, owner)
+    return {"chats": chats, "total": total}
+
+
+@app.get("/chats/search")
+async def search_chats(q: str, limit: int = 20, owner: str = Depends(chat_owner)):
+    results = await asyncio.to_thread(get_store().search, owner, q, min(limit, 100))
+    return {"chats": results}
+
+
+@app.get("/chats/{chat_id}/messages")
+async def get_messages(chat_id: str, owner: str = Depends(chat_owner)):
+    store = get_store()
+    chat = await asyncio.to_thread(store.get_chat, owner, chat_id)
+    if chat is None:
+        raise HTTPException(404, "chat not found")
+    messages = await asyncio.to_thread(store.load_messages, owner, chat_id)
+    return {"chat": chat, "messages": messages}
+
+
+@app.delete("/chats/{chat_id}", status_code=204)
+async def delete_chat(chat_id: str, owner: str = Depends(chat_owner)):
+    if not await asyncio.to_thread(get_store().delete_chat, owner, chat_id):
+        raise HTTPException(404, "chat not found")
+    await asyncio.to_thread(get_engine().delete_thread, chat_id)
+
+
+class TurnStream(StreamingResponse):
+    """StreamingResponse that calls `release` however the response ends. A
+    client that goes away before the body starts never runs the
+    generator's finally, nor a background task."""
+
+    def __init__(self, content, release, **kwargs):
+        super().__init__(content, **kwargs)
+        self.release = release
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.release()
+
+
+def _sse(event) -> str:
+    return f"event: {event.kind}\ndata: {json.dumps(dataclasses.asdict(event))}\n\n"
+
+
+@app.post("/chats/{chat_id}/messages")
+async def send_message(
+    chat_id: str,
+    body: NewMessage,
+    request: Request,
+    owner: str = Depends(chat_owner),
+):
+    store = get_store()
+    engine = get_engine()
+    chat = await asyncio.to_thread(store.get_chat, owner, chat_id)
+    new = chat is None
+    if new:
+        if body.title is None:
+            raise HTTPException(404, "chat not found")
+        chat = _new_chat(body.title, chat_id)
+        if body.created_at:
+            chat["created_at"] = body.created_at
+
+    gate: TurnGate = request.app.state.gate
+    await gate.acquire(chat_id)
+    try:
+        # another worker process may be running this chat
+        token = await asyncio.to_thread(store.claim_turn, chat_id, TURN_CLAIM_TTL)
+    except BaseException:
+        gate.release(chat_id)
+        raise
+    if token is None:
+        gate.release(chat_id)
+        raise HTTPException(409, "a reply for this chat is already running")
+    released = False
+
+    def release():
+        # from the generator's finally and from TurnStream, whichever is first
+        nonlocal released
+        if not released:
+            released = True
+            gate.release(chat_id)
+            # a one-row delete, done inline so a cancelled stream can't skip it
+            store.release_turn(chat_id, token)
+
+    if new:
+        try:
+            # claim the chat id before its graph state is touched
+            await asyncio.to_thread(store.save_messages, owner, chat, [])
+        except PermissionError:
+            release()
+            raise HTTPException(404, "chat not found") from None
+
+    async def events():
+        try:
+            history = await asyncio.to_thread(store.load_messages, owner, chat_id)
+            history.append({"role": "user", "content": body.content})
+            state = await asyncio.to_thread(
+                engine.turn_state, chat_id, history, body.content
+            )
+            config = {"configurable": {"thread_id": chat_id}}
+            # the client reading slowly pauses the graph (backpressure);
+            # a client disconnect cancels it
+            tool_rows = ToolTranscript()
+            async for event in astream_engine_turn(engine, state, config):
+                tool_rows.feed(event)
+                if event.kind == "done" and event.text:
+                    history.extend(tool_rows.rows)
+                    history.append({"role": "assistant", "content": event.text})
+                    await asyncio.to_thread(store.save_messages, owner, chat, history)
+                yield _sse(event)
+        finally:
+            release()
+
+    return TurnStream(
+        events(),
+        release,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.get("/healthz")
+async def healthz(request: Request):
+    gate: TurnGate = request.app.state.gate
+    if gate.draining:
+        raise HTTPException(503, "draining")
+    return {"in_flight": gate.in_flight, "limit": gate.limit}
+
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    if not metrics.enabled:
+        raise HTTPException(404, "metrics are off (set METRICS_ENABLED=1)")
+    return PlainTextResponse(
+        metrics.prometheus(), media_type="text/plain; version=0.0.4"
+    )
@@ -0,0 +1,505 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+# one chat history for every visitor (the old single-user behaviour); by
+# default each visitor only sees the chats saved under their own owner key
+CHAT_SHARED = os.getenv("CHAT_SHARED", "").lower() in ("1", "true")
+# owner of every chat in shared mode, and of chats saved before owners
+SHARED_OWNER = ""
+
+
+def open_sqlite(path: str) -> sqlite3.Connection:
+    """Open a SQLite connection shared between threads, in WAL mode.
+
+    WAL lets readers (sidebar, other sessions) run while a turn is writing.
+    """
+    if path != ":memory:":
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+class ChatStore(ABC):
+    """Where chats live. Metadata is cheap to list, messages load on demand.
+
+    A chat is {"id", "title", "created_at"}; a message is {"role", "content"}.
+    Tool rows (role "tool", see tool_history.py) also carry "name" and "args".
+    Every chat belongs to an owner key (one per visitor) and every call is
+    scoped to one: another owner's chat is simply not there.
+    """
+
+    @abstractmethod
+    def list_chats(self, owner: str, limit: int = 20, offset: int = 0) -> List[Dict]:
+        ...
+
+    @abstractmethod
+    def count_chats(self, owner: str) -> int: ...
+
+    @abstractmethod
+    def get_chat(self, owner: str, chat_id: str) -> Optional[Dict]: ...
+
+    @abstractmethod
+    def load_messages(self, owner: str, chat_id: str) -> List[Dict]: ...
+
+    @abstractmethod
+    def save_messages(self, owner: str, chat: Dict, messages: List[Dict]):
+        """Persist `messages` for `chat`, creating the chat row on first save.
+        Raises PermissionError if the chat id belongs to another owner."""
+
+    @abstractmethod
+    def delete_chat(self, owner: str, chat_id: str) -> bool:
+        """Delete the chat; False if `owner` has no such chat."""
+
+    @abstractmethod
+    def search(self, owner: str, query: str, limit: int = 20) -> List[Dict]:
+        """`owner`'s chats whose messages match `query`, best first, each
+        with a "snippet" of its best matching message."""
+
+
+def fts_query(text: str) -> Optional[str]:
+    """User text -> FTS5 query: every word must match, the last one as a
+    prefix (search-as-you-type). Quoting each word keeps FTS syntax
+    characters in the input from being parsed as operators."""
+    words = re.findall(r"\w+", text)
+    if not words:
+        return None
+    return " ".join(f'"{w}"' for w in words) + "*"
+
+
+def _tool_column(message: Dict) -> Optional[str]:
+    if message["role"] != "tool":
+        return None
+    return json.dumps(
+        {"name": message.get("name", ""), "args": message.get("args") or {}},
+        ensure_ascii=False,
+    )
+
+
+def _message(role: str, content: str, tool: Optional[str]) -> Dict:
+    message = {"role": role, "content": content}
+    if tool:
+        message.update(json.loads(tool))
+    return message
+
+
+class SQLiteChatStore(ChatStore):
+    """SQLite backed store with an LRU of recently opened transcripts.
+
+    Messages are append-only per chat, so saving a turn only writes the
+    rows that are new since the last save. An FTS5 index over message
+    text is kept in sync by triggers, so it grows with each save and
+    shrinks with each delete instead of being rebuilt.
+    """
+
+    # search() ranks by relevance up to this many matching messages
+    RANK_LIMIT = 2000
+
+    def __init__(self, path: str = "chats.db", cache_size: int = 32):
+        self.path = path
+        self.cache_size = cache_size
+        self._conn = open_sqlite(path)
+        self._lock = threading.Lock()
+        # chat_id -> list of messages, most recently used last
+        self._cache: "OrderedDict[str, List[Dict]]" = OrderedDict()
+        self._create_tables()
+
+    def _create_tables(self):
+        with self._lock, self._conn:
+            self._conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS chats (
+                    id TEXT PRIMARY KEY,
+                    title TEXT NOT NULL,
+                    created_at TEXT NOT NULL,
+                    owner TEXT NOT NULL DEFAULT ''
+                );
+                CREATE TABLE IF NOT EXISTS messages (
+                    chat_id TEXT NOT NULL,
+                    seq INTEGER NOT NULL,
+                    role TEXT NOT NULL,
+                    content TEXT NOT NULL,
+                    tool TEXT,
+                    PRIMARY KEY (chat_id, seq)
+                );
+                CREATE TABLE IF NOT EXISTS turn_claims (
+                    chat_id TEXT PRIMARY KEY,
+                    token TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                );
+                """
+            )
+            columns = [r[1] for r in self._conn.execute("PRAGMA table_info(messages)")]
+            if "tool" not in columns:
+                # DB from before tool rows were stored
+                self._conn.execute("ALTER TABLE messages ADD COLUMN tool TEXT")
+            columns = [r[1] for r in self._conn.execute("PRAGMA table_info(chats)")]
+            if "owner" not in columns:
+                # DB from before owners: its chats become the shared history
+                self._conn.execute(
+                    "ALTER TABLE chats ADD COLUMN owner TEXT NOT NULL DEFAULT ''"
+                )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS chats_owner ON chats (owner)"
+            )
+            indexed = self._conn.execute(
+                "SELECT sql FROM sqlite_master WHERE name = 'messages_fts_insert'"
+            ).fetchone()
+            if indexed and "new.role" not in indexed[0]:
+                # DB from when tool rows were indexed too: new triggers, reindex
+                self._conn.executescript(
+                    """
+                    DROP TRIGGER messages_fts_insert;
+                    DROP TRIGGER IF EXISTS messages_fts_delete;
+                    """
+                )
+                indexed = None
+            try:
+                self._conn.executescript(
+                    """
+                    CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+                        content,
+                        content='messages',
+                        content_rowid='rowid',
+                        tokenize='unicode61 remove_diacritics 2'
+                    );
+                    CREATE TRIGGER IF NOT EXISTS messages_fts_insert
+                    AFTER INSERT ON messages
+                    WHEN new.role IN ('user', 'assistant') BEGIN
+                        INSERT INTO messages_fts (rowid, content)
+                        VALUES (new.rowid, new.content);
+                    END;
+                    CREATE TRIGGER IF NOT EXISTS messages_fts_delete
+                    AFTER DELETE ON messages
+                    WHEN old.role IN ('user', 'assistant') BEGIN
+                        INSERT INTO messages_fts (messages_fts, rowid, content)
+                        VALUES ('delete', old.rowid, old.content);
+                    END;
+                    """
+                )
+            except sqlite3.OperationalError:
+                # SQLite built without FTS5: search() falls back to LIKE
+                self._fts = False
+            else:
+                self._fts = True
+                if not indexed:
+                    # DB from before the index existed (or indexed tool
+                    # output): index the chat messages once. Not 'rebuild',
+                    # which would read tool rows back in
+                    self._conn.executescript(
+                        """
+                        INSERT INTO messages_fts (messages_fts) VALUES ('delete-all');
+                        INSERT INTO messages_fts (rowid, content)
+                        SELECT rowid, content FROM messages
+                        WHERE role IN ('user', 'assistant');
+                        """
+                    )
+
+    @contextmanager
+    def _write(self):
+        """Transaction that takes SQLite's write lock up front (BEGIN
+        IMMEDIATE), so its reads and writes can't interleave with another
+        worker process writing the same DB."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield
+            except BaseException:
+                self._conn.rollback()
+                raise
+            self._conn.commit()
+
+    # ---- LRU of transcripts ----
+
+    def _cache_get(self, chat_id: str) -> Optional[List[Dict]]:
+        messages = self._cache.get(chat_id)
+        if messages is not None:
+            self._cache.move_to_end(chat_id)
+        return messages
+
+    def _cache_put(self, chat_id: str, messages: List[Dict]):
+        self._cache[chat_id] = messages
+        self._cache.move_to_end(chat_id)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    # ---- ChatStore ----
+
+    def list_chats(self, owner: str, limit: int = 20, offset: int = 0) -> List[Dict]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, title, created_at FROM chats WHERE owner = ? "
+                "ORDER BY rowid DESC LIMIT ? OFFSET ?",
+                (owner, limit, offset),
+            ).fetchall()
+        return [{"id": r[0], "title": r[1], "created_at": r[2]} for r in rows]
+
+    def count_chats(self, owner: str) -> int:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM chats WHERE owner = ?", (owner,)
+            ).fetchone()[0]
+
+    def _owns(self, owner: str, chat_id: str) -> bool:
+        # caller holds the lock
+        return (
+            self._conn.execute(
+                "SELECT 1 FROM chats WHERE id = ? AND owner = ?", (chat_id, owner)
+            ).fetchone()
+            is not None
+        )
+
+    def get_chat(self, owner: str, chat_id: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, title, created_at FROM chats WHERE id = ? AND owner = ?",
+                (chat_id, owner),
+            ).fetchone()
+        if row is None:
+            return None
+        return {"id": row[0], "title": row[1], "created_at": row[2]}
+
+    def load_messages(self, owner: str, chat_id: str) -> List[Dict]:
+        with self._lock:
+            if not self._owns(owner, chat_id):
+                return []
+            cached = self._cache_get(chat_id)
+            if cached is not None and len(cached) != self._stored(chat_id):
+                # another worker process saved a turn since
+                cached = None
+            if cached is None:
+                rows = self._conn.execute(
+                    "SELECT role, content, tool FROM messages "
+                    "WHERE chat_id = ? ORDER BY seq",
+                    (chat_id,),
+                ).fetchall()
+                cached = [_message(*r) for r in rows]
+                self._cache_put(chat_id, cached)
+        # callers append to their copy; the cache keeps what is on disk
+        return list(cached)
+
+    def _stored(self, chat_id: str) -> int:
+        # caller holds the lock
+        return self._conn.execute(
+            "SELECT COUNT(*) FROM messages WHERE chat_id = ?", (chat_id,)
+        ).fetchone()[0]
+
+    def save_messages(self, owner: str, chat: Dict, messages: List[Dict]):
+        chat_id = chat["id"]
+        with self._write():
+            self._conn.execute(
+                "INSERT OR IGNORE INTO chats (id, title, created_at, owner) "
+                "VALUES (?, ?, ?, ?)",
+                (chat_id, chat["title"], chat["created_at"], owner),
+            )
+            if not self._owns(owner, chat_id):
+                raise PermissionError(f"chat {chat_id} belongs to another owner")
+            stored = self._stored(chat_id)
+            self._conn.executemany(
+                "INSERT INTO messages (chat_id, seq, role, content, tool) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [
+                    (chat_id, seq, msg["role"], msg["content"], _tool_column(msg))
+                    for seq, msg in enumerate(messages[stored:], start=stored)
+                ],
+            )
+            self._cache_put(chat_id, list(messages))
+
+    def delete_chat(self, owner: str, chat_id: str) -> bool:
+        with self._lock, self._conn:
+            deleted = self._conn.execute(
+                "DELETE FROM chats WHERE id = ? AND owner = ?", (chat_id, owner)
+            ).rowcount
+            if deleted:
+                self._conn.execute(
+                    "DELETE FROM messages WHERE chat_id = ?", (chat_id,)
+                )
+                self._cache.pop(chat_id, None)
+        return bool(deleted)
+
+    # ---- one turn per chat, across worker processes ----
+
+    def claim_turn(self, chat_id: str, ttl: float) -> Optional[str]:
+        """Mark a turn as running for `chat_id`; returns a token for
+        release_turn(), or None if any worker already runs one. A claim
+        lapses after `ttl` seconds, in case its worker died mid-turn."""
+        token = uuid.uuid4().hex
+        now = time.time()
+        with self._write():
+            self._conn.execute(
+                "DELETE FROM turn_claims WHERE chat_id = ? AND expires_at <= ?",
+                (chat_id, now),
+            )
+            claimed = self._conn.execute(
+                "INSERT OR IGNORE INTO turn_claims (chat_id, token, expires_at) "
+                "VALUES (?, ?, ?)",
+                (chat_id, token, now + ttl),
+            ).rowcount
+        return token if claimed else None
+
+    def release_turn(self, chat_id: str, token: str):
+        with self._write():
+            self._conn.execute(
+                "DELETE FROM turn_claims WHERE chat_id = ? AND token = ?",
+                (chat_id, token),
+            )
+
+    def search(self, owner: str, query: str, limit: int = 20) -> List[Dict]:
+        match = fts_query(query)
+        if match is None:
+            return []
+        with self._lock:
+            if self._fts:
+                # bm25 ranking scores every match; for a word that is in a
+                # huge share of messages that costs 100ms+ and says little,
+                # so past RANK_LIMIT matches the newest messages win instead
+                matches = self._conn.execute(
+                    "SELECT COUNT(*) FROM (SELECT 1 FROM messages_fts "
+                    "JOIN messages m ON m.rowid = messages_fts.rowid "
+                    "JOIN chats c ON c.id = m.chat_id "
+                    "WHERE messages_fts MATCH ? AND c.owner = ? LIMIT ?)",
+                    (match, owner, self.RANK_LIMIT + 1),
+                ).fetchone()[0]
+                if matches <= self.RANK_LIMIT:
+                    order = "rank"
+                else:
+                    order = "messages_fts.rowid DESC"
+                # over-fetch since one chat can own several of the top hits
+                rows = self._conn.execute(
+                    "SELECT c.id, c.title, c.created_at, "
+                    "snippet(messages_fts, 0, '**', '**', '…', 12) "
+                    "FROM messages_fts JOIN messages m ON m.rowid = messages_fts.rowid "
+                    "JOIN chats c ON c.id = m.chat_id "
+                    f"WHERE messages_fts MATCH ? AND c.owner = ? ORDER BY {order} "
+                    "LIMIT ?",
+                    (match, owner, limit * 10),
+                ).fetchall()
+            else:
+                like = "%" + query.strip() + "%"
+                rows = self._conn.execute(
+                    "SELECT c.id, c.title, c.created_at, substr(m.content, 1, 80) "
+                    "FROM messages m JOIN chats c ON c.id = m.chat_id "
+                    "WHERE m.content LIKE ? AND m.role IN ('user', 'assistant') "
+                    "AND c.owner = ? ORDER BY m.rowid DESC LIMIT ?",
+                    (like, owner, limit * 10),
+                ).fetchall()
+        best: "OrderedDict[str, Dict]" = OrderedDict()
+        for chat_id, title, created_at, snippet in rows:
+            if chat_id not in best:
+                best[chat_id] = {
+                    "id": chat_id,
+                    "title": title,
+                    "created_at": created_at,
+                    "snippet": snippet,
+                }
+                if len(best) == limit:
+                    break
+        return list(best.values())
+
+    def close(self):
+        self._conn.close()
+
+
+class RemoteChatStore(ChatStore):
+    """Chats kept by a server.py worker (CHAT_API_URL), over its REST API.
+
+    The owner key goes along as the X-Chat-Owner header. The server saves
+    each turn itself and drops a chat's graph state when the chat is
+    deleted, so save_messages() has nothing to do here.
+    """
+
+    def __init__(self, api_url: str):
+        self.api_url = api_url.rstrip("/")
+
+    def _request(self, method: str, path: str, owner: str, **params):
+        # imported here so the local-only path does not need the HTTP client
+        from http_client import get_client
+
+        return get_client().session.request(
+            method,
+            f"{self.api_url}{path}",
+            params=params,
+            headers=owner_headers(owner),
+            timeout=(3.05, 10),
+        )
+
+    def _get(self, path: str, owner: str, **params) -> Dict:
+        response = self._request("GET", path, owner, **params)
+        response.raise_for_status()
+        return response.json()
+
+    def list_chats(self, owner: str, limit: int = 20, offset: int = 0) -> List[Dict]:
+        return self._get("/chats", owner, limit=limit, offset=offset)["chats"]
+
+    def count_chats(self, owner: str) -> int:
+        return self._get("/chats", owner, limit=0)["total"]
+
+    def _transcript(self, owner: str, chat_id: str) -> Optional[Dict]:
+        response = self._request("GET", f"/chats/{chat_id}/messages", owner)
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+        return response.json()
+
+    def get_chat(self, owner: str, chat_id: str) -> Optional[Dict]:
+        transcript = self._transcript(owner, chat_id)
+        return transcript["chat"] if transcript else None
+
+    def load_messages(self, owner: str, chat_id: str) -> List[Dict]:
+        transcript = self._transcript(owner, chat_id)
+        return transcript["messages"] if transcript else []
+
+    def save_messages(self, owner: str, chat: Dict, messages: List[Dict]):
+        pass
+
+    def delete_chat(self, owner: str, chat_id: str) -> bool:
+        response = self._request("DELETE", f"/chats/{chat_id}", owner)
+        if response.status_code == 404:
+            return False
+        response.raise_for_status()
+        return True
+
+    def search(self, owner: str, query: str, limit: int = 20) -> List[Dict]:
+        return self._get("/chats/search", owner, q=query, limit=limit)["chats"]
+
+
+def owner_headers(owner: str) -> Dict[str, str]:
+    """Request headers that tell server.py whose chats a call is about."""
+    return {"X-Chat-Owner": owner} if owner else {}
+
+
+# process-wide store, shared by every Streamlit session / thread
+_store: Optional[ChatStore] = None
+_store_lock = threading.Lock()
+
+
+def get_store(path: Optional[str] = None) -> ChatStore:
+    """Return the shared chat store, opening it on first use or path change."""
+    global _store
+    if path is None:
+        path = os.getenv("CHAT_DB_PATH", "chats.db")
+
+    store = _store
+    if store is not None and store.path == path:
+        return store
+
+    with _store_lock:
+        if _store is None or _store.path != path:
+            if _store is not None:
+                _store.close()
+            _store = SQLiteChatStore(
+                path, cache_size=int(os.getenv("CHAT_CACHE_SIZE", "32"))
+            )
+        return _store
@@ -0,0 +1,258 @@
+import json
+import queue
+import time
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+
+from langchain_core.messages import AIMessage, AIMessageChunk, ToolMessage
+
+from metrics import metrics
+
+
+@dataclass
+class StreamEvent:
+    """One thing that happened while a turn was running.
+
+    kind is one of:
+      "token"      - text chunk of the assistant reply (text)
+      "tool_start" - model asked for a tool (name, args, label)
+      "tool_end"   - tool finished (name, text = tool output)
+      "done"       - turn finished (text = final reply, ttft = seconds or None)
+      "error"      - the turn did not run (text = why, for the user)
+    """
+
+    kind: str
+    text: str = ""
+    name: str = ""
+    args: Dict[str, Any] = field(default_factory=dict)
+    label: str = ""
+    ttft: Optional[float] = None
+
+
+def tool_label(name: str, args: Dict[str, Any]) -> str:
+    """Human friendly progress line for a tool call."""
+    if name == "get_weather":
+        return f"🌦️ Fetching weather for {args.get('city', '...')}…"
+    if name == "get_weather_batch":
+        return f"🌦️ Fetching weather for {', '.join(args.get('cities', []))}…"
+    if name == "web_search":
+        return f"🔎 Searching the web for “{args.get('query', '')}”…"
+    if name == "fetch_pages":
+        return f"📄 Reading {len(args.get('urls', []))} pages…"
+    return f"🔧 Running {name}…"
+
+
+class _TurnEvents:
+    """Turns raw (mode, chunk) pairs from graph.stream / astream into StreamEvents."""
+
+    def __init__(self, config=None):
+        self.thread_id = (config or {}).get("configurable", {}).get("thread_id")
+        self.started_at = time.time()
+        self.start = time.perf_counter()
+        self.ttft: Optional[float] = None
+        self.final_text = ""
+        self.tool_calls = 0
+        self.budget_exhausted: Optional[str] = None
+
+    def feed(self, mode: str, chunk) -> List[StreamEvent]:
+        if mode == "messages":
+            message, metadata = chunk
+            if metadata.get("langgraph_node") != "chatbot":
+                return []
+            if isinstance(message, AIMessageChunk) and message.content:
+                if self.ttft is None:
+                    self.ttft = time.perf_counter() - self.start
+                return [StreamEvent("token", text=message.content)]
+            return []
+
+        # mode == "updates": {node_name: {"messages": ...}}
+        events = []
+        for node, update in chunk.items():
+            if not update or "messages" not in update:
+                continue
+            if update.get("budget") and update["budget"].get("exhausted"):
+                self.budget_exhausted = update["budget"]["exhausted"]
+            messages = update["messages"]
+            if not isinstance(messages, list):
+                messages = [messages]
+            for message in messages:
+                if isinstance(message, AIMessage):
+                    if message.tool_calls:
+                        self.tool_calls += len(message.tool_calls)
+                        for call in message.tool_calls:
+                            events.append(
+                                StreamEvent(
+                                    "tool_start",
+                                    name=call["name"],
+                                    args=call["args"],
+                                    label=tool_label(call["name"], call["args"]),
+                                )
+                            )
+                    else:
+                        self.final_text = message.content
+                elif isinstance(message, ToolMessage):
+                    events.append(
+                        StreamEvent(
+                            "tool_end", name=message.name or "", text=message.content
+                        )
+                    )
+        return events
+
+    def done(self) -> StreamEvent:
+        return StreamEvent("done", text=self.final_text, ttft=self.ttft)
+
+    def record(self, status: str):
+        """Whole-turn span; recorded after the fact since the turn spans
+        generator yields (a `with` block could not bind the thread_id)."""
+        if not metrics.enabled:
+            return
+        metrics.record(
+            "turn",
+            "turn",
+            self.thread_id,
+            self.started_at,
+            time.perf_counter() - self.start,
+            status,
+            {
+                "ttft_ms": None if self.ttft is None else round(self.ttft * 1000, 1),
+                "tool_calls": self.tool_calls,
+                "budget_exhausted": self.budget_exhausted,
+            },
+        )
+        if self.ttft is not None:
+            metrics.observe("ttft_seconds", self.ttft)
+        metrics.write_textfile()
+
+
+STREAM_MODES = ["messages", "updates"]
+
+
+def stream_turn(graph, state, config) -> Iterator[StreamEvent]:
+    """Run one turn and yield tokens and tool progress as they happen.
+
+    Uses LangGraph "messages" mode for LLM tokens and "updates" mode for
+    finished node outputs, so tool calls show up the moment the model
+    emits them and the final reply is taken from the completed AIMessage.
+    """
+    turn = _TurnEvents(config)
+    status = "cancelled"
+    try:
+        for mode, chunk in graph.stream(
+            state, config=config, stream_mode=STREAM_MODES
+        ):
+            yield from turn.feed(mode, chunk)
+        status = "ok"
+    except Exception:
+        status = "error"
+        raise
+    finally:
+        turn.record(status)
+    yield turn.done()
+
+
+async def astream_turn(graph, state, config) -> AsyncIterator[StreamEvent]:
+    """Async stream_turn() for graphs driven by astream."""
+    turn = _TurnEvents(config)
+    status = "cancelled"
+    try:
+        async for mode, chunk in graph.astream(
+            state, config=config, stream_mode=STREAM_MODES
+        ):
+            for event in turn.feed(mode, chunk):
+                yield event
+        status = "ok"
+    except Exception:
+        status = "error"
+        raise
+    finally:
+        turn.record(status)
+    yield turn.done()
+
+
+async def astream_engine_turn(engine, state, config) -> AsyncIterator[StreamEvent]:
+    """astream_turn() on the engine's async graph for the running loop."""
+    graph = await engine.aget_graph()
+    async for event in astream_turn(graph, state, config):
+        yield event
+
+
+_END = object()
+
+
+def iter_on_loop(background, agen: AsyncIterator) -> Iterator:
+    """Drive an async generator on a BackgroundLoop and iterate it from a
+    sync thread. Stopping early (e.g. a Streamlit rerun) cancels the work."""
+    items: "queue.Queue" = queue.Queue()
+
+    async def pump():
+        try:
+            async for item in agen:
+                items.put(item)
+        except BaseException as exc:
+            items.put(exc)
+        finally:
+            items.put(_END)
+
+    future = background.submit(pump())
+    try:
+        while True:
+            item = items.get()
+            if item is _END:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        future.cancel()
+
+
+# what the user sees when server.py does not run the turn
+REMOTE_ERRORS = {
+    409: "Is chat ka pichla jawab abhi chal raha hai - uske khatam hone ke baad "
+    "dobara bhejo.",
+    503: "Server abhi busy hai, thodi der me dobara try karo.",
+    "unreachable": "Chat server se connect nahi ho paya, thodi der me try karo.",
+}
+
+
+def stream_remote_turn(
+    api_url: str, owner: str, chat: Dict, prompt: str
+) -> Iterator[StreamEvent]:
+    """Same events as stream_turn(), but from a server.py worker over SSE.
+
+    The server saves the turn to the shared store itself. A turn the server
+    turns away (busy, draining, one already running for this chat) or can't
+    be reached for ends in a single "error" event.
+    """
+    # imported here so the local-only path does not need the HTTP client
+    import requests
+
+    from http_client import get_client
+    from storage import owner_headers
+
+    try:
+        response = get_client().session.post(
+            f"{api_url.rstrip('/')}/chats/{chat['id']}/messages",
+            headers=owner_headers(owner),
+            json={
+                "content": prompt,
+                "title": chat["title"],
+                "created_at": chat["created_at"],
+            },
+            stream=True,
+            # no read timeout: tokens may pause while tools run
+            timeout=(3.05, None),
+        )
+    except requests.ConnectionError:
+        yield StreamEvent("error", text=REMOTE_ERRORS["unreachable"])
+        return
+    with response:
+        if response.status_code >= 400:
+            text = REMOTE_ERRORS.get(response.status_code)
+            yield StreamEvent(
+                "error", text=text or f"Server error (HTTP {response.status_code})."
+            )
+            return
+        for line in response.iter_lines(decode_unicode=True):
+            if line and line.startswith("data: "):
+                yield StreamEvent(**json.loads(line[len("data: "):]))
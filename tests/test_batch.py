@@ -0,0 +1,40 @@
+import asyncio
+import json
+
+from batch import run_batch
+from benchmarks.fakes import echo_reply, install_fake_llm
+from engine import Engine, EngineConfig
+
+
+def write_lines(path, lines):
+    path.write_text("".join(line + "\n" for line in lines), encoding="utf-8")
+
+
+def test_rerun_skips_finished_items_and_survives_a_torn_line(tmp_path):
+    items = tmp_path / "items.jsonl"
+    write_lines(
+        items,
+        [
+            json.dumps({"id": "a", "prompt": "who made you?"}),
+            "",
+            json.dumps({"id": "b", "prompt": "hello"}),
+            json.dumps({"id": "c", "prompt": "bye"}),
+        ],
+    )
+    out = tmp_path / "out.jsonl"
+    # "a" finished; the run died while writing "b"
+    out.write_text(json.dumps({"id": "a"}) + '\n{"id": "b", "repl', encoding="utf-8")
+
+    engine = Engine(EngineConfig(api_key="test", db_path=str(tmp_path / "batch.db")))
+    install_fake_llm(engine, replies=[echo_reply])
+    try:
+        stats = asyncio.run(run_batch(engine, str(items), str(out), workers=2))
+    finally:
+        engine.close()
+
+    assert (stats["items"], stats["skipped"], stats["errors"]) == (2, 1, 0)
+    lines = out.read_text(encoding="utf-8").splitlines()
+    assert lines[1] == '{"id": "b", "repl'
+    results = {r["id"]: r for r in map(json.loads, lines[2:])}
+    assert results["b"]["replies"] == ["echo: hello"]
+    assert results["c"]["line"] == 4
@@ -0,0 +1,91 @@
+import asyncio
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage
+
+import budget
+import tools
+from benchmarks.fakes import install_fake_llm
+from benchmarks.upstreams import FakeUpstreams
+from engine import Engine, EngineConfig
+
+
+def always_a_tool(messages):
+    """A model that never stops asking for the weather."""
+    call = {"name": "get_weather", "args": {"city": "Pune"}, "id": f"w{len(messages)}"}
+    return AIMessage(content="", tool_calls=[call])
+
+
+@pytest.fixture
+def upstreams(monkeypatch):
+    upstreams = FakeUpstreams(delay=0).start()
+    monkeypatch.setattr(tools, "WTTR_URL", f"{upstreams.url}/weather")
+    tools.weather_cache.clear()
+    yield upstreams
+    tools.weather_cache.clear()
+    upstreams.stop()
+
+
+def make_engine(tmp_path, **limits):
+    config = EngineConfig(api_key="test", db_path=str(tmp_path / "c.db"), **limits)
+    engine = Engine(config)
+    install_fake_llm(engine, replies=[always_a_tool])
+    return engine
+
+
+def turn(engine, text="Pune ka mausam?"):
+    config = {"configurable": {"thread_id": "t1"}}
+    return engine.graph.invoke({"messages": [HumanMessage(content=text)]}, config)
+
+
+def test_tool_loop_ends_at_the_round_limit(tmp_path, upstreams):
+    engine = make_engine(tmp_path, max_tool_rounds=2)
+    try:
+        state = turn(engine)
+    finally:
+        engine.close()
+    assert [m.type for m in state["messages"]].count("tool") == 2
+    assert state["messages"][-1].content == budget.FALLBACK_REPLY
+    assert state["budget"]["exhausted"] == "tool_rounds"
+
+
+def test_out_of_time_turn_answers_without_tools(tmp_path, upstreams):
+    engine = make_engine(tmp_path, turn_timeout=0)
+    try:
+        state = turn(engine)
+    finally:
+        engine.close()
+    assert [m.type for m in state["messages"]] == ["human", "ai"]
+    assert state["budget"]["exhausted"] == "time"
+    assert upstreams.requests == 0
+
+
+def test_async_tool_loop_ends_at_the_round_limit(tmp_path, upstreams):
+    engine = make_engine(tmp_path, max_tool_rounds=1)
+
+    async def aturn():
+        graph = await engine.aget_graph()
+        config = {"configurable": {"thread_id": "t1"}}
+        state = {"messages": [HumanMessage(content="Pune ka mausam?")]}
+        return await graph.ainvoke(state, config)
+
+    try:
+        state = asyncio.run(aturn())
+    finally:
+        engine.close()
+    assert [m.type for m in state["messages"]].count("tool") == 1
+    assert state["messages"][-1].content == budget.FALLBACK_REPLY
+    assert state["budget"]["exhausted"] == "tool_rounds"
+
+
+def test_check_names_the_first_limit_hit():
+    limits = budget.TurnLimits(max_tool_rounds=2, max_seconds=60, max_tokens=100)
+    turn_budget = limits.start()
+    assert budget.check(turn_budget, limits) is None
+    turn_budget["tokens"] = 100
+    assert budget.check(turn_budget, limits) == "tokens"
+    turn_budget["tool_rounds"] = 2
+    assert budget.check(turn_budget, limits) == "tool_rounds"
+    budget.exhaust(turn_budget, "tool_rounds")
+    budget.exhaust(turn_budget, "time")
+    assert turn_budget["exhausted"] == "tool_rounds"
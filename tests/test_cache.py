@@ -0,0 +1,104 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from cache import DiskCache, TTLCache
+
+
+def test_cancelled_caller_does_not_cancel_other_waiters():
+    cache = TTLCache()
+    calls = []
+
+    async def slow_load(key):
+        calls.append(key)
+        await asyncio.sleep(0.2)
+        return f"{key}: Sunny +30°C"
+
+    async def scenario():
+        leader = asyncio.ensure_future(cache.aget_or_load("delhi", slow_load))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(cache.aget_or_load("delhi", slow_load))
+        # chat A's tool times out while chat B waits on the same load
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(leader, timeout=0.05)
+        return await follower
+
+    assert asyncio.run(scenario()) == "delhi: Sunny +30°C"
+    assert calls == ["delhi"]
+    assert cache.get("delhi") == "delhi: Sunny +30°C"
+
+
+def test_load_error_reaches_every_waiter_and_is_not_cached():
+    cache = TTLCache()
+
+    async def failing_load(key):
+        await asyncio.sleep(0.05)
+        raise ConnectionError("wttr.in down")
+
+    async def scenario():
+        return await asyncio.gather(
+            cache.aget_or_load("pune", failing_load),
+            cache.aget_or_load("pune", failing_load),
+            return_exceptions=True,
+        )
+
+    errors = asyncio.run(scenario())
+    assert [type(e) for e in errors] == [ConnectionError, ConnectionError]
+    assert cache.stats()["coalesced"] == 1
+    assert cache.get("pune") is None
+
+
+def test_threads_asking_for_one_key_share_a_single_load():
+    cache = TTLCache()
+    calls = []
+
+    def slow_load(key):
+        calls.append(key)
+        time.sleep(0.2)
+        if len(calls) == 1:
+            raise ConnectionError("wttr.in down")
+        return f"{key}: Haze +31°C"
+
+    def load(_):
+        try:
+            return cache.get_or_load("mumbai", slow_load)
+        except ConnectionError as exc:
+            return exc
+
+    with ThreadPoolExecutor(4) as pool:
+        results = list(pool.map(load, range(4)))
+    # the failed load reached every thread and left nothing behind
+    assert calls == ["mumbai"]
+    assert all(isinstance(r, ConnectionError) for r in results)
+    assert cache.get_or_load("mumbai", slow_load) == "mumbai: Haze +31°C"
+    assert cache.stats()["coalesced"] == 3
+
+
+def test_disk_cache_opens_its_db_on_first_use_off_the_loop(tmp_path, monkeypatch):
+    path = tmp_path / "search.db"
+    cache = DiskCache(str(path), "web_search")
+    assert not path.exists()
+    loop_threads = []
+    read = cache._read
+
+    def spy(key):
+        loop_threads.append(threading.current_thread())
+        return read(key)
+
+    monkeypatch.setattr(cache, "_read", spy)
+
+    async def load(key):
+        return f"results for {key}"
+
+    async def scenario():
+        value = await cache.aget_or_load("ipl score", load, lambda key: "")
+        return value, threading.current_thread()
+
+    value, loop_thread = asyncio.run(scenario())
+    assert value == "results for ipl score"
+    assert path.exists()
+    assert loop_threads and loop_thread not in loop_threads
+    assert cache.get_or_load("ipl score", lambda key: "") == "results for ipl score"
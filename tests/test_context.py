@@ -0,0 +1,50 @@
+from langchain_core.messages import AIMessage, HumanMessage
+
+from context import ContextWindow
+
+
+def history(turns):
+    messages = []
+    for i in range(turns):
+        messages.append(HumanMessage(content=f"question {i} " + "x" * 400, id=f"h{i}"))
+        messages.append(AIMessage(content=f"answer {i} " + "y" * 400, id=f"a{i}"))
+    return messages
+
+
+class Summarizer:
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.calls = []
+
+    def __call__(self, previous, messages):
+        self.calls.append(len(messages))
+        if self.fail:
+            raise RuntimeError("summarizer down")
+        return previous + f"[{len(messages)}]"
+
+
+def test_backlog_is_folded_in_bounded_chunks():
+    summarize = Summarizer()
+    window = ContextWindow(
+        max_tokens=1000, summarize=summarize, fold_tokens=500, max_folds=2
+    )
+    messages = history(20)
+    _, saved = window.build("system", messages)
+    # two summarizer calls of at most two turns each, not one giant call
+    assert summarize.calls == [4, 4]
+    assert saved["folded"] == 8
+
+    # the next call (e.g. after a restart) continues from the saved state
+    _, saved = window.build("system", messages, saved)
+    assert saved["folded"] == 16
+    assert summarize.calls == [4, 4, 4, 4]
+
+
+def test_failed_fold_does_not_advance():
+    window = ContextWindow(max_tokens=1000, summarize=Summarizer(fail=True))
+    messages = history(20)
+    sent, saved = window.build("system", messages, {"folded": 0, "summary": "old"})
+    assert saved == {"folded": 0, "summary": "old"}
+    # the prompt still fits; the unfolded turns are retried next time
+    assert sum(window.message_tokens(m) for m in sent) <= 1000
+    assert sent[-1] is messages[-1]
@@ -0,0 +1,118 @@
+import asyncio
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+
+from budget import deadline_scope
+from http_client import CircuitBreaker, CircuitOpenError, DeadlineExceeded, HttpClient
+from metrics import metrics
+
+
+@pytest.fixture
+def server():
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = b"Sunny +30C"
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    httpd = HTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{httpd.server_port}"
+    httpd.shutdown()
+
+
+@pytest.fixture
+def flaky():
+    """Answers 503 to the first `failures` requests, then 200."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            httpd.requests += 1
+            status = 503 if httpd.requests <= httpd.failures else 200
+            self.send_response(status)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    httpd = HTTPServer(("127.0.0.1", 0), Handler)
+    httpd.requests, httpd.failures = 0, 2
+    httpd.url = f"http://127.0.0.1:{httpd.server_port}"
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield httpd
+    httpd.shutdown()
+
+
+@pytest.fixture
+def recorded(monkeypatch):
+    monkeypatch.setattr(metrics, "enabled", True)
+    metrics.reset()
+    yield metrics
+    metrics.reset()
+
+
+def test_metrics_are_labelled_by_upstream_not_host(server, recorded):
+    client = HttpClient()
+    client.get(f"{server}/delhi", upstream="wttr")
+    with client.stream(f"{server}/some/page", upstream="pages") as response:
+        response.content
+    assert recorded.counter_value("http_requests_total", upstream="wttr", status=200)
+    assert recorded.counter_value("http_requests_total", upstream="pages", status=200)
+    assert "127.0.0.1" not in recorded.prometheus()
+    assert [span.attrs["host"] for span in recorded.recent_spans("-")] == [
+        server.split("//")[1]
+    ] * 2
+
+
+@pytest.mark.parametrize("use_async", [False, True])
+def test_failed_calls_are_retried(flaky, use_async):
+    client = HttpClient(retries=2, backoff=0)
+    if use_async:
+        response = asyncio.run(client.aget(flaky.url))
+    else:
+        response = client.get(flaky.url)
+    assert response.status_code == 200
+    assert flaky.requests == 3
+    assert not client.breaker.is_open(flaky.url.split("//")[1])
+
+
+def test_last_failure_is_returned_once_retries_run_out(flaky):
+    flaky.failures = 10
+    response = HttpClient(retries=1, backoff=0).get(flaky.url)
+    assert response.status_code == 503
+    assert flaky.requests == 2
+
+
+def test_open_breaker_skips_the_host_until_the_cooldown(flaky):
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.2)
+    client = HttpClient(retries=0, breaker=breaker)
+    for _ in range(2):
+        client.get(flaky.url)
+    with pytest.raises(CircuitOpenError):
+        client.get(flaky.url)
+    assert flaky.requests == 2
+    time.sleep(0.25)
+    # half-open: one probe goes through, and its success closes the breaker
+    assert client.get(flaky.url).status_code == 200
+    assert not breaker.is_open(flaky.url.split("//")[1])
+
+
+def test_no_retry_past_the_turn_deadline(flaky):
+    client = HttpClient(retries=2)
+    # a backoff that would end after the deadline
+    client._sleep_for = lambda attempt: 1.0
+    with deadline_scope(time.time() + 0.5), pytest.raises(DeadlineExceeded):
+        client.get(flaky.url)
+    assert flaky.requests == 1
+    with deadline_scope(time.time() - 1), pytest.raises(DeadlineExceeded):
+        client.get(flaky.url)
+    assert flaky.requests == 1
@@ -0,0 +1,74 @@
+import asyncio
+import time
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage
+
+from benchmarks.fakes import FakeChatModel
+from model_pool import Backend, BackendsExhausted, ModelPool
+
+PROMPT = [HumanMessage(content="namaste")]
+
+
+def backend(name, **kwargs):
+    model = FakeChatModel(replies=[AIMessage(content=f"from {name}")], **kwargs)
+    return Backend(name, model)
+
+
+def ask(pool, use_async):
+    if use_async:
+        return asyncio.run(pool.ainvoke(PROMPT))
+    return pool.invoke(PROMPT)
+
+
+@pytest.mark.parametrize("use_async", [False, True])
+def test_failing_backend_fails_over_to_the_next(use_async):
+    pool = ModelPool(backends=[backend("main", fail_rate=1.0), backend("fallback")])
+    reply = ask(pool, use_async)
+    assert reply.content == "from fallback"
+    assert reply.response_metadata["backend"] == "fallback"
+    main, fallback = pool.stats()
+    assert (main["errors"], fallback["ok"]) == (1, 1)
+
+
+@pytest.mark.parametrize("use_async", [False, True])
+def test_turn_fails_only_when_every_backend_does(use_async):
+    pool = ModelPool(
+        backends=[backend("main", fail_rate=1.0), backend("fallback", fail_rate=1.0)]
+    )
+    with pytest.raises(BackendsExhausted, match="main: .*fallback: "):
+        ask(pool, use_async)
+
+
+def test_backend_that_keeps_failing_goes_to_the_back():
+    pool = ModelPool(backends=[backend("main", fail_rate=1.0), backend("fallback")])
+    for _ in range(3):
+        pool.invoke(PROMPT)
+    assert [b.name for b in pool.order()] == ["fallback", "main"]
+    assert pool.stats()[0]["failing"]
+
+
+@pytest.mark.parametrize("use_async", [False, True])
+def test_slow_backend_is_hedged(use_async):
+    pool = ModelPool(
+        backends=[backend("main", latency=1.0), backend("fallback", latency=0.05)],
+        hedge=True,
+        hedge_delay=0.1,
+        hedge_min_delay=0.1,
+    )
+    start = time.monotonic()
+    reply = ask(pool, use_async)
+    assert time.monotonic() - start < 0.5
+    assert reply.content == "from fallback"
+
+
+@pytest.mark.parametrize("use_async", [False, True])
+def test_backend_with_no_first_token_times_out(use_async):
+    pool = ModelPool(
+        backends=[backend("main", latency=1.0), backend("fallback")],
+        first_token_timeout=0.1,
+    )
+    start = time.monotonic()
+    assert ask(pool, use_async).content == "from fallback"
+    assert time.monotonic() - start < 0.5
+    assert pool.stats()[0]["errors"] == 1
@@ -0,0 +1,95 @@
+import asyncio
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+
+import pages
+
+
+def resolves_to(address):
+    def getaddrinfo(host, port, *args, **kwargs):
+        return [(socket.AF_INET, socket.SOCK_STREAM, 6, "", (address, 0))]
+
+    return getaddrinfo
+
+
+@pytest.mark.parametrize("address", ["10.0.0.5", "127.0.0.1", "169.254.169.254"])
+def test_host_resolving_to_private_address_is_refused(monkeypatch, address):
+    monkeypatch.setattr(pages, "PAGE_ALLOW_PRIVATE", False)
+    monkeypatch.setattr(socket, "getaddrinfo", resolves_to(address))
+    with pytest.raises(pages.PageError, match="private address"):
+        pages._check("http://innocent.example.com/")
+
+
+def test_host_resolving_to_public_address_is_allowed(monkeypatch):
+    monkeypatch.setattr(pages, "PAGE_ALLOW_PRIVATE", False)
+    monkeypatch.setattr(socket, "getaddrinfo", resolves_to("93.184.216.34"))
+    pages._check("https://example.com/")
+
+
+def test_every_redirect_hop_is_checked(monkeypatch):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            self.send_response(302)
+            self.send_header("Location", "http://internal.test/secret")
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    checked = []
+
+    def check(url):
+        checked.append(url)
+        if "internal.test" in url:
+            raise pages.PageError("private address")
+
+    monkeypatch.setattr(pages, "_check", check)
+    monkeypatch.setattr(pages, "_cached", lambda url: (None, False))
+    url = f"http://127.0.0.1:{server.server_port}/start"
+    try:
+        with pytest.raises(pages.PageError, match="private address"):
+            pages.fetch_page(url)
+    finally:
+        server.shutdown()
+    assert checked == [url, "http://internal.test/secret"]
+
+
+@pytest.mark.parametrize("use_async", [False, True])
+@pytest.mark.parametrize("status, outcome", [(304, "revalidated"), (500, "stale")])
+def test_stale_page_is_revalidated_or_kept(monkeypatch, use_async, status, outcome):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            self.send_response(status)
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/page"
+    cached = {"url": url, "title": "old", "paragraphs": ["old text"], "etag": "v1"}
+    counted = []
+    monkeypatch.setattr(pages, "PAGE_ALLOW_PRIVATE", True)
+    monkeypatch.setattr(pages, "_cached", lambda url: (cached, False))
+
+    def store(page, result):
+        counted.append(result)
+        return page
+
+    monkeypatch.setattr(pages, "_store", store)
+    monkeypatch.setattr(pages, "_count", counted.append)
+    try:
+        if use_async:
+            page = asyncio.run(pages.afetch_page(url))
+        else:
+            page = pages.fetch_page(url)
+    finally:
+        server.shutdown()
+    assert page is cached
+    assert counted == [outcome]
@@ -0,0 +1,62 @@
+import asyncio
+
+from langchain_core.messages import AIMessage, HumanMessage
+
+from benchmarks.fakes import FakeChatModel
+from context import llm_summarizer
+from model_pool import Backend, ModelPool
+from rate_limit import Bucket, MemoryBuckets, RateLimiter
+
+REPLY = [AIMessage(content="theek hai bhai")]
+
+
+def limiter(upstream, rpm=600):
+    buckets = [Bucket(f"{upstream}:requests", "requests", rpm, rpm / 60.0)]
+    return RateLimiter(upstream, buckets, MemoryBuckets(), max_wait=120.0)
+
+
+def test_cancelled_waiter_gives_back_its_grant():
+    groq = limiter("groq", rpm=1)
+
+    async def main():
+        await groq.aacquire({"requests": 1})
+        waiter = asyncio.ensure_future(groq.aacquire({"requests": 1}))
+        await asyncio.sleep(0.01)
+        waiter.cancel()
+        # granted (e.g. by the refill timer) before the cancel lands
+        groq.store.take([(groq.buckets[0], -1)], force=True)
+        with groq._lock:
+            groq._dispatch_locked()
+        results = await asyncio.gather(waiter, return_exceptions=True)
+        assert isinstance(results[0], asyncio.CancelledError)
+
+    asyncio.run(main())
+    # the cancelled caller's request went back in the bucket
+    assert groq.store.take([(groq.buckets[0], 1)]) == 0
+
+
+def test_pool_queues_each_attempt_on_its_backends_limiter():
+    groq, other = limiter("groq"), limiter("other")
+    pool = ModelPool(
+        backends=[
+            Backend(
+                "groq:slow", FakeChatModel(replies=REPLY, latency=0.5), limiter=groq
+            ),
+            Backend("other:fast", FakeChatModel(replies=REPLY), limiter=other),
+        ],
+        hedge=True,
+        hedge_delay=0.05,
+    )
+    pool.invoke([HumanMessage(content="hi")])
+    # the hedge went to the fallback and was billed to its own provider
+    assert (groq.granted, other.granted) == (1, 1)
+
+    asyncio.run(pool.ainvoke([HumanMessage(content="hi")]))
+    assert (groq.granted, other.granted) == (2, 2)
+
+
+def test_summarizer_waits_on_the_limiter():
+    groq = limiter("groq")
+    summarize = llm_summarizer(FakeChatModel(replies=REPLY), groq)
+    summarize("", [HumanMessage(content="purani baat")])
+    assert groq.granted == 1
@@ -0,0 +1,35 @@
+from rendering import build_message_html, escape_markdown_html, visible_window
+
+
+def test_user_text_is_shown_as_typed():
+    html = build_message_html("user", "<img src=x onerror=alert(1)>\n**bold** & co")
+    assert "<img" not in html
+    assert "&lt;img src=x onerror=alert(1)&gt;<br>**bold** &amp; co" in html
+
+
+def test_reply_keeps_markdown_but_not_raw_html():
+    reply = "**Delhi** > Mumbai <script>alert(1)</script>"
+    assert escape_markdown_html(reply) == (
+        "**Delhi** > Mumbai &lt;script>alert(1)&lt;/script>"
+    )
+
+
+def test_code_in_replies_is_left_alone():
+    reply = "Use `<div>` like this:\n```html\n<div>hi</div>\n```\nnot <b>this</b>"
+    assert escape_markdown_html(reply) == (
+        "Use `<div>` like this:\n```html\n<div>hi</div>\n```\nnot &lt;b>this&lt;/b>"
+    )
+    # an unclosed fence runs to the end while the reply is still streaming
+    assert escape_markdown_html("```\n<p>") == "```\n<p>"
+
+
+def test_window_skips_tool_rows():
+    messages = [
+        {"role": "user", "content": "weather in Pune"},
+        {"role": "tool", "content": "Sunny +25°C"},
+        {"role": "assistant", "content": "Pune me dhoop hai"},
+        {"role": "user", "content": "thanks"},
+    ]
+    hidden, shown = visible_window(messages, 2)
+    assert hidden == 1
+    assert [m["content"] for m in shown] == ["Pune me dhoop hai", "thanks"]
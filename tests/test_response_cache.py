@@ -0,0 +1,67 @@
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+
+from benchmarks.fakes import echo_reply, install_fake_llm
+from engine import Engine, EngineConfig
+from response_cache import ResponseCache
+
+
+@pytest.fixture
+def engine(tmp_path):
+    config = EngineConfig(
+        api_key="test", db_path=str(tmp_path / "chats.db"), response_cache=True
+    )
+    engine = Engine(config)
+    yield engine
+    engine.close()
+
+
+def ask(engine, thread_id, text):
+    config = {"configurable": {"thread_id": thread_id}}
+    state = {"messages": [HumanMessage(content=text)]}
+    return engine.graph.invoke(state, config)["messages"][-1]
+
+
+def counted(prompts):
+    def reply(messages):
+        prompts.append(messages[-1].content)
+        return echo_reply(messages)
+
+    return reply
+
+
+def test_same_opening_question_is_answered_from_the_cache(engine):
+    prompts = []
+    install_fake_llm(engine, replies=[counted(prompts)])
+    first = ask(engine, "t1", "Tumhe kisne banaya?")
+    second = ask(engine, "t2", "tumhe  kisne banaya")
+    assert second.content == first.content
+    assert second.response_metadata["cache"] == "hit"
+    assert prompts == ["Tumhe kisne banaya?"]
+    stats = engine.response_cache.stats()
+    assert (stats["hits"], stats["misses"], stats["size"]) == (1, 1, 1)
+
+
+def test_time_sensitive_questions_always_reach_the_model(engine):
+    prompts = []
+    install_fake_llm(engine, replies=[counted(prompts)])
+    ask(engine, "t1", "aaj ka score kya hai")
+    ask(engine, "t2", "aaj ka score kya hai")
+    assert len(prompts) == 2
+    assert engine.response_cache.stats()["bypassed"] == 2
+    assert engine.response_cache.stats()["size"] == 0
+
+
+def test_only_plain_text_replies_are_stored():
+    cache = ResponseCache("groq:test", [])
+    messages = [SystemMessage(content="system"), HumanMessage(content="hello")]
+    key = cache.lookup(messages)
+    call = {"name": "web_search", "args": {"query": "hello"}, "id": "s0"}
+    cache.put(key, AIMessage(content="", tool_calls=[call]))
+    cache.put(key, AIMessage(content="   "))
+    assert cache.get(key) is None
+    cache.put(key, AIMessage(content="Namaste!"))
+    assert cache.get(key).content == "Namaste!"
+    # another model (or system prompt) never shares an entry
+    assert ResponseCache("groq:other", []).key(messages) != key
+    assert cache.key([SystemMessage(content="other")] + messages[1:]) != key
@@ -0,0 +1,55 @@
+import pytest
+
+from router import PreRouter
+
+TOOLS = ["get_weather", "get_weather_batch", "web_search"]
+
+
+def calls(text):
+    route = PreRouter(TOOLS).classify(text)
+    if route is None:
+        return None
+    return [(call["name"], call["args"]) for call in route.tool_calls]
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        ("weather in London", [("get_weather", {"city": "London"})]),
+        ("what is the weather in Paris today?", [("get_weather", {"city": "Paris"})]),
+        ("temperature in Pune", [("get_weather", {"city": "Pune"})]),
+        ("Delhi ka mausam kaisa hai", [("get_weather", {"city": "Delhi"})]),
+        (
+            "weather in Delhi and Mumbai",
+            [("get_weather_batch", {"cities": ["Delhi", "Mumbai"]})],
+        ),
+        (
+            "search for best biryani in Hyderabad",
+            [("web_search", {"query": "best biryani in Hyderabad"})],
+        ),
+        ("IPL score google karo", [("web_search", {"query": "IPL score"})]),
+    ],
+)
+def test_routes(text, expected):
+    assert calls(text) == expected
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        # a forecast day or a unit is more than get_weather(city) answers
+        "weather in London tomorrow",
+        "weather in Delhi next week",
+        "what is the weather in Paris in celsius",
+        "Mumbai ka kal ka weather",
+        # not a city
+        "temperature of water at sea level",
+        "weather in there",
+        # nothing to search for
+        "google kya hai",
+        "search karo",
+        "search for it",
+    ],
+)
+def test_declines(text):
+    assert calls(text) is None
@@ -0,0 +1,61 @@
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+from starlette.requests import ClientDisconnect
+
+import engine
+import server
+import storage
+from benchmarks.fakes import install_fake_llm
+
+OWNER = {"X-Chat-Owner": "a" * 32}
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setenv("GROQ_API_KEY", "test")
+    monkeypatch.setenv("CHAT_DB_PATH", str(tmp_path / "chats.db"))
+    engine.reset_engine()
+    install_fake_llm(engine.get_engine())
+    with TestClient(server.app) as client:
+        yield client
+    engine.reset_engine()
+
+
+def send(client, chat_id, text):
+    body = {"content": text, "title": "Test", "created_at": "2024-01-01 10:00"}
+    return client.post(f"/chats/{chat_id}/messages", json=body, headers=OWNER)
+
+
+def test_chat_claimed_by_another_worker_is_busy(client, tmp_path):
+    # a second worker process, same DB
+    other = storage.SQLiteChatStore(str(tmp_path / "chats.db"))
+    token = other.claim_turn("c1", ttl=60)
+    assert send(client, "c1", "hello").status_code == 409
+    other.release_turn("c1", token)
+
+    response = send(client, "c1", "hello")
+    assert response.status_code == 200
+    assert "event: done" in response.text
+    # and the claim is gone once the turn ended
+    assert other.claim_turn("c1", ttl=60) is not None
+
+
+def test_turn_stream_releases_when_the_client_is_gone():
+    released = []
+
+    async def body():
+        yield "never sent"
+
+    async def receive():
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        raise OSError("client went away")
+
+    stream = server.TurnStream(body(), lambda: released.append(True))
+    scope = {"type": "http", "asgi": {"spec_version": "2.4"}}
+    with pytest.raises(ClientDisconnect):
+        asyncio.run(stream(scope, receive, send))
+    assert released == [True]
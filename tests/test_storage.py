@@ -0,0 +1,126 @@
+import sqlite3
+
+import pytest
+
+from storage import SHARED_OWNER, ChatStore, RemoteChatStore, SQLiteChatStore
+
+ASHA = "a" * 32
+RAVI = "b" * 32
+CHAT = {"id": "c1", "title": "Weather", "created_at": "2024-01-01T00:00:00"}
+MESSAGES = [
+    {"role": "user", "content": "mumbai ka mausam"},
+    {
+        "role": "tool",
+        "content": "Mumbai: Smoke +31°C",
+        "name": "get_weather",
+        "args": {"city": "Mumbai"},
+    },
+    {"role": "assistant", "content": "Mumbai me dhuan hai, 31 degree"},
+]
+
+
+def test_search_skips_tool_output(tmp_path):
+    store = SQLiteChatStore(str(tmp_path / "chats.db"))
+    store.save_messages(ASHA, CHAT, MESSAGES)
+    assert store.search(ASHA, "smoke") == []
+    [hit] = store.search(ASHA, "dhuan")
+    assert hit["snippet"] == "Mumbai me **dhuan** hai, 31 degree"
+    store.delete_chat(ASHA, "c1")
+    assert store.search(ASHA, "dhuan") == []
+
+
+def test_old_index_with_tool_rows_is_rebuilt(tmp_path):
+    path = str(tmp_path / "chats.db")
+    SQLiteChatStore(path).close()
+    conn = sqlite3.connect(path)
+    # triggers as they were before tool rows were left out
+    conn.executescript(
+        """
+        DROP TRIGGER messages_fts_insert;
+        DROP TRIGGER messages_fts_delete;
+        CREATE TRIGGER messages_fts_insert AFTER INSERT ON messages BEGIN
+            INSERT INTO messages_fts (rowid, content)
+            VALUES (new.rowid, new.content);
+        END;
+        INSERT INTO chats (id, title, created_at)
+        VALUES ('c1', 'Weather', '2024-01-01T00:00:00');
+        INSERT INTO messages VALUES ('c1', 0, 'user', 'mumbai ka mausam', NULL);
+        INSERT INTO messages VALUES ('c1', 1, 'tool', 'Haze +31°C', '{}');
+        """
+    )
+    conn.commit()
+    conn.close()
+
+    store = SQLiteChatStore(path)
+    assert store.search(SHARED_OWNER, "haze") == []
+    assert [hit["id"] for hit in store.search(SHARED_OWNER, "mausam")] == ["c1"]
+    store.delete_chat(SHARED_OWNER, "c1")
+    assert store.search(SHARED_OWNER, "mausam") == []
+
+
+def test_chat_stores_implement_every_method():
+    with pytest.raises(TypeError):
+        ChatStore()
+    assert not SQLiteChatStore.__abstractmethods__
+    assert not RemoteChatStore.__abstractmethods__
+
+
+def test_chats_are_only_visible_to_their_owner(tmp_path):
+    store = SQLiteChatStore(str(tmp_path / "chats.db"))
+    store.save_messages(ASHA, CHAT, MESSAGES)
+    assert [c["id"] for c in store.list_chats(ASHA)] == ["c1"]
+    assert store.count_chats(RAVI) == 0
+    assert store.list_chats(RAVI) == []
+    assert store.get_chat(RAVI, "c1") is None
+    assert store.load_messages(RAVI, "c1") == []
+    assert not store.delete_chat(RAVI, "c1")
+    with pytest.raises(PermissionError):
+        store.save_messages(RAVI, CHAT, MESSAGES + MESSAGES)
+    assert store.load_messages(ASHA, "c1") == MESSAGES
+    assert store.delete_chat(ASHA, "c1")
+
+
+def test_chats_from_before_owners_become_the_shared_history(tmp_path):
+    path = str(tmp_path / "chats.db")
+    conn = sqlite3.connect(path)
+    conn.executescript(
+        """
+        CREATE TABLE chats (id TEXT PRIMARY KEY, title TEXT NOT NULL,
+                            created_at TEXT NOT NULL);
+        INSERT INTO chats VALUES ('c1', 'Weather', '2024-01-01T00:00:00');
+        """
+    )
+    conn.close()
+    store = SQLiteChatStore(path)
+    assert [c["id"] for c in store.list_chats(SHARED_OWNER)] == ["c1"]
+    assert store.list_chats(ASHA) == []
+
+
+def test_search_only_finds_the_owners_chats(tmp_path):
+    store = SQLiteChatStore(str(tmp_path / "chats.db"))
+    store.save_messages(ASHA, CHAT, MESSAGES)
+    store.save_messages(RAVI, dict(CHAT, id="c2"), MESSAGES)
+    assert [hit["id"] for hit in store.search(ASHA, "mausam")] == ["c1"]
+    assert [hit["id"] for hit in store.search(RAVI, "mausam")] == ["c2"]
+    assert store.search("c" * 32, "mausam") == []
+
+
+def test_transcript_saved_by_another_worker_is_not_served_stale(tmp_path):
+    path = str(tmp_path / "chats.db")
+    mine, other = SQLiteChatStore(path), SQLiteChatStore(path)
+    mine.save_messages(ASHA, CHAT, MESSAGES[:1])
+    assert mine.load_messages(ASHA, "c1") == MESSAGES[:1]
+    other.save_messages(ASHA, CHAT, MESSAGES)
+    assert mine.load_messages(ASHA, "c1") == MESSAGES
+
+
+def test_turn_claim_is_exclusive_until_released_or_lapsed(tmp_path):
+    path = str(tmp_path / "chats.db")
+    mine, other = SQLiteChatStore(path), SQLiteChatStore(path)
+    token = mine.claim_turn("c1", ttl=60)
+    assert token is not None
+    assert other.claim_turn("c1", ttl=60) is None
+    mine.release_turn("c1", token)
+    assert other.claim_turn("c1", ttl=-1) is not None
+    # a dead worker's claim lapses
+    assert mine.claim_turn("c1", ttl=60) is not None
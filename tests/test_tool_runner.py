@@ -0,0 +1,63 @@
+import time
+
+from langchain_core.messages import AIMessage
+from langchain_core.tools import tool
+
+from tool_runner import ToolRunner
+
+
+@tool
+def slow_tool(city: str) -> str:
+    """Takes far longer than the runner allows."""
+    time.sleep(2)
+    return city
+
+
+def test_single_call_times_out():
+    runner = ToolRunner([slow_tool], timeout=0.2)
+    call = {"name": "slow_tool", "args": {"city": "Pune"}, "id": "call_1"}
+    state = {"messages": [AIMessage(content="", tool_calls=[call])]}
+    start = time.monotonic()
+    [message] = runner.run(state)["messages"]
+    assert time.monotonic() - start < 1
+    assert message.status == "error"
+    assert message.content == "Error: slow_tool timed out"
+
+
+@tool
+def nap(seconds: float) -> str:
+    """Sleeps for `seconds`."""
+    time.sleep(seconds)
+    return f"slept {seconds}"
+
+
+def nap_calls(*seconds):
+    return [
+        {"name": "nap", "args": {"seconds": s}, "id": f"call_{i}"}
+        for i, s in enumerate(seconds)
+    ]
+
+
+def test_calls_share_one_timeout():
+    runner = ToolRunner([nap], timeout=0.3)
+    state = {"messages": [AIMessage(content="", tool_calls=nap_calls(0.1, 0.45, 0.7))]}
+    start = time.monotonic()
+    messages = runner.run(state)["messages"]
+    assert time.monotonic() - start < 0.45
+    assert [m.content for m in messages] == [
+        "slept 0.1",
+        "Error: nap timed out",
+        "Error: nap timed out",
+    ]
+
+
+def test_sync_tools_stop_at_the_turn_deadline():
+    runner = ToolRunner([nap], timeout=15)
+    state = {
+        "messages": [AIMessage(content="", tool_calls=nap_calls(0.1, 0.7, 0.9))],
+        "budget": {"deadline": time.time() + 0.3},
+    }
+    start = time.monotonic()
+    messages = runner.run(state)["messages"]
+    assert time.monotonic() - start < 0.45
+    assert [m.status for m in messages] == ["success", "error", "error"]
@@ -0,0 +1,41 @@
+import asyncio
+
+import pytest
+
+import tools
+from benchmarks.upstreams import FakeUpstreams
+from tools import canonicalize_query
+
+
+def test_query_key_ignores_case_spacing_and_stop_words():
+    assert canonicalize_query("What is the  Delhi weather?") == "delhi weather"
+
+
+@pytest.mark.parametrize(
+    "first, second",
+    [
+        ("flights delhi to mumbai", "flights mumbai to delhi"),
+        ("India vs Pakistan score", "Pakistan vs India score"),
+        ("celsius to fahrenheit", "fahrenheit to celsius"),
+    ],
+)
+def test_query_key_keeps_word_order(first, second):
+    assert canonicalize_query(first) != canonicalize_query(second)
+
+
+def test_weather_batch_asks_wttr_once_per_city(monkeypatch):
+    upstreams = FakeUpstreams(delay=0)
+    upstreams.start()
+    monkeypatch.setattr(tools, "WTTR_URL", f"{upstreams.url}/weather")
+    tools.weather_cache.clear()
+    try:
+        table = tools.get_weather_batch.invoke({"cities": ["Delhi", "New York"]})
+        again = asyncio.run(tools.aget_weather_batch(["Pune", "Delhi"]))
+    finally:
+        tools.weather_cache.clear()
+        upstreams.stop()
+    assert "| Delhi | Sunny +25°C (delhi) |" in table
+    assert "| New York | Sunny +25°C (new york) |" in table
+    assert "| Pune | Sunny +25°C (pune) |" in again
+    # Delhi came from the cache the second time
+    assert upstreams.requests == 3
@@ -0,0 +1,175 @@
+"""Tool calls and results kept in history, in a compact form.
+
+The stored transcript keeps a "tool" row per call between the user
+message and the reply, so a follow-up ("and tomorrow?", "open the second
+link") can be answered from the earlier result instead of calling the
+tool again. Results are stored compacted: blank and repeated lines
+dropped, long lines cut, and at most TOOL_RESULT_TOKENS per result.
+
+The same compaction is applied to tool results of earlier turns when the
+prompt is built (see ContextWindow), so old search dumps don't eat the
+token budget; the current turn's results go to the model in full.
+"""
+
+import json
+import os
+import re
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+from langchain_core.messages import (
+    AIMessage,
+    BaseMessage,
+    HumanMessage,
+    ToolMessage,
+)
+
+from context import count_tokens
+
+TOOL_RESULT_TOKENS = int(os.getenv("TOOL_RESULT_TOKENS", "300"))
+# a single line longer than this is cut (search snippets, error dumps)
+LINE_CHARS = 240
+
+_SPACES = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=4096)
+def compact_result(text: str, max_tokens: int = TOOL_RESULT_TOKENS) -> str:
+    """Tool output without blank / duplicate lines, capped at max_tokens."""
+    lines, seen = [], set()
+    for line in text.splitlines():
+        line = line.strip()
+        key = _SPACES.sub(" ", line).casefold()
+        if not line or key in seen:
+            continue
+        seen.add(key)
+        if len(line) > LINE_CHARS:
+            line = line[: LINE_CHARS - 1].rstrip() + "…"
+        lines.append(line)
+
+    kept, used = [], 0
+    for i, line in enumerate(lines):
+        tokens = count_tokens(line + "\n")
+        if used + tokens > max_tokens:
+            kept.append(f"… ({len(lines) - i} more lines cut)")
+            break
+        kept.append(line)
+        used += tokens
+    return "\n".join(kept)
+
+
+def _call_key(name: str, args: Dict) -> str:
+    return f"{name}:{json.dumps(args, sort_keys=True, ensure_ascii=False)}"
+
+
+def compact_history(
+    messages: List[BaseMessage], max_tokens: int = TOOL_RESULT_TOKENS
+) -> List[BaseMessage]:
+    """Copy of `messages` with earlier turns' tool results compacted.
+
+    Messages are replaced, never removed, so indexes and tool_call ids
+    still line up. A call repeated later (same tool, same args) keeps only
+    its latest result; the older ones point to it.
+    """
+    last_human = max(
+        (i for i, m in enumerate(messages) if isinstance(m, HumanMessage)),
+        default=-1,
+    )
+    calls = {}
+    for message in messages[:last_human]:
+        if isinstance(message, AIMessage):
+            for call in message.tool_calls:
+                calls[call["id"]] = _call_key(call["name"], call["args"])
+
+    result = list(messages)
+    latest = set()
+    for i in range(last_human - 1, -1, -1):
+        message = messages[i]
+        if not isinstance(message, ToolMessage) or not isinstance(
+            message.content, str
+        ):
+            continue
+        key = calls.get(message.tool_call_id)
+        if key is not None and key in latest:
+            content, suffix = f"(same as the later {message.name} result)", "dup"
+        else:
+            content, suffix = compact_result(message.content, max_tokens), "compact"
+            if key is not None:
+                latest.add(key)
+        if content != message.content:
+            # own id: ContextWindow caches token counts by message id
+            new_id = f"{message.id}-{suffix}" if message.id else None
+            result[i] = message.model_copy(update={"content": content, "id": new_id})
+    return result
+
+
+class ToolTranscript:
+    """Collects one turn's tool calls from StreamEvents as stored "tool" rows.
+
+    A row is {"role": "tool", "name", "args", "content"}; content is the
+    compacted result. Results arrive in call order, so each tool_end is
+    paired with the oldest pending call of that tool.
+    """
+
+    def __init__(self, max_tokens: int = TOOL_RESULT_TOKENS):
+        self.max_tokens = max_tokens
+        self._pending: List[Dict] = []
+        self.rows: List[Dict] = []
+
+    def feed(self, event):
+        if event.kind == "tool_start":
+            self._pending.append({"name": event.name, "args": dict(event.args)})
+        elif event.kind == "tool_end":
+            call = self._pop(event.name)
+            self.rows.append(
+                {
+                    "role": "tool",
+                    "name": event.name,
+                    "args": call["args"] if call else {},
+                    "content": compact_result(event.text, self.max_tokens),
+                }
+            )
+
+    def _pop(self, name: str) -> Optional[Dict]:
+        for i, call in enumerate(self._pending):
+            if call["name"] == name:
+                return self._pending.pop(i)
+        return None
+
+
+def history_messages(history: List[Dict]) -> List[BaseMessage]:
+    """Stored transcript -> model messages. Consecutive tool rows become one
+    AIMessage with their calls followed by the ToolMessages."""
+    messages: List[BaseMessage] = []
+    batch: List[Dict] = []
+
+    def flush():
+        if not batch:
+            return
+        ids = [f"history_{len(messages)}_{i}" for i in range(len(batch))]
+        messages.append(
+            AIMessage(
+                content="",
+                tool_calls=[
+                    {"name": row["name"], "args": row.get("args") or {}, "id": id_}
+                    for row, id_ in zip(batch, ids)
+                ],
+            )
+        )
+        for row, id_ in zip(batch, ids):
+            messages.append(
+                ToolMessage(content=row["content"], name=row["name"], tool_call_id=id_)
+            )
+        batch.clear()
+
+    for msg in history:
+        if msg["role"] == "tool":
+            batch.append(msg)
+            continue
+        flush()
+        if msg["role"] == "user":
+            messages.append(HumanMessage(content=msg["content"]))
+        else:
+            messages.append(AIMessage(content=msg["content"]))
+    flush()
+    return messages
@@ -0,0 +1,154 @@
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Dict, List, Optional
+
+from langchain_core.messages import AIMessage, ToolMessage
+from langchain_core.runnables import RunnableConfig
+from langchain_core.tools import BaseTool
+
+from budget import deadline_scope, remaining
+from metrics import metrics
+from rate_limit import chat_scope
+
+
+class ToolRunner:
+    """Graph node that runs all tool calls of one AIMessage concurrently.
+
+    At most `max_concurrency` calls run at once, each call gets `timeout`
+    seconds, and the ToolMessages come back in the order of the calls.
+    Sync graphs run tools on threads, async graphs (astream / ainvoke)
+    run the tools' coroutines on the event loop. The turn's deadline (see
+    budget.py) shortens `timeout` and is visible to the HTTP client; once
+    it has passed, calls are skipped.
+    """
+
+    def __init__(self, tools: List[BaseTool], max_concurrency: int = 4, timeout: float = 15.0):
+        self.tools_by_name: Dict[str, BaseTool] = {t.name: t for t in tools}
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+
+    def _tool_calls(self, state) -> list:
+        message = state["messages"][-1]
+        if not isinstance(message, AIMessage):
+            return []
+        return message.tool_calls
+
+    def _error(self, call, text: str) -> ToolMessage:
+        return ToolMessage(
+            content=text, name=call["name"], tool_call_id=call["id"], status="error"
+        )
+
+    def _result(self, call, output) -> ToolMessage:
+        return ToolMessage(
+            content=str(output), name=call["name"], tool_call_id=call["id"]
+        )
+
+    def _deadline(self, state) -> Optional[float]:
+        return (state.get("budget") or {}).get("deadline")
+
+    def _time_left(self, deadline: Optional[float]) -> float:
+        left = remaining(deadline) if deadline is not None else None
+        return self.timeout if left is None else min(self.timeout, left)
+
+    def _skipped(self, calls) -> List[ToolMessage]:
+        messages = []
+        for call in calls:
+            metrics.inc("tool_calls_total", tool=call["name"], status="skipped")
+            messages.append(
+                self._error(call, f"Error: {call['name']} skipped, turn time is up")
+            )
+        return messages
+
+    def _finish(self, span, message: ToolMessage) -> ToolMessage:
+        status = "ok" if message.status == "success" else "error"
+        if status == "error" and message.content.endswith("timed out"):
+            status = "timeout"
+        span.set(status=status, result_chars=len(message.content))
+        metrics.inc("tool_calls_total", tool=message.name, status=status)
+        return message
+
+    def _run_one(self, call) -> ToolMessage:
+        tool = self.tools_by_name.get(call["name"])
+        if tool is None:
+            return self._error(call, f"Error: unknown tool {call['name']}")
+        with metrics.span(call["name"], "tool", args=call["args"]) as span:
+            try:
+                message = self._result(call, tool.invoke(call["args"]))
+            except Exception as e:
+                message = self._error(call, f"Error: {call['name']} failed: {e}")
+            return self._finish(span, message)
+
+    def run(self, state, config: RunnableConfig = None):
+        thread_id = (config or {}).get("configurable", {}).get("thread_id")
+        deadline = self._deadline(state)
+        calls = self._tool_calls(state)
+        with metrics.span("tools", "node", thread_id=thread_id):
+            timeout = self._time_left(deadline)
+            if timeout <= 0:
+                return {"messages": self._skipped(calls)}
+            # rate limited calls queue under this chat
+            with deadline_scope(deadline), chat_scope(thread_id):
+                return {"messages": self._run_calls(calls, deadline)}
+
+    def _run_calls(self, calls, deadline: Optional[float]) -> List[ToolMessage]:
+        if not calls:
+            return []
+        # a single call goes through the pool too, so it gets the timeout
+        pool = ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(calls)))
+        try:
+            # each call gets a copy of our context so its spans keep the thread_id
+            futures = [
+                pool.submit(contextvars.copy_context().run, self._run_one, call)
+                for call in calls
+            ]
+            # one wall-clock limit for the whole batch, not a fresh one per
+            # call: the tool timeout or the turn's deadline, whichever is first
+            done, _ = wait(futures, timeout=max(0.0, self._time_left(deadline)))
+            messages = []
+            for call, future in zip(calls, futures):
+                if future in done:
+                    messages.append(future.result())
+                else:
+                    message = self._error(call, f"Error: {call['name']} timed out")
+                    metrics.inc("tool_calls_total", tool=call["name"], status="timeout")
+                    messages.append(message)
+        finally:
+            # don't wait for stragglers - their HTTP timeout ends them
+            pool.shutdown(wait=False, cancel_futures=True)
+        return messages
+
+    async def _arun_one(
+        self, call, semaphore: asyncio.Semaphore, timeout: float
+    ) -> ToolMessage:
+        tool = self.tools_by_name.get(call["name"])
+        if tool is None:
+            return self._error(call, f"Error: unknown tool {call['name']}")
+        async with semaphore:
+            with metrics.span(call["name"], "tool", args=call["args"]) as span:
+                try:
+                    output = await asyncio.wait_for(
+                        tool.ainvoke(call["args"]), timeout=timeout
+                    )
+                    message = self._result(call, output)
+                except asyncio.TimeoutError:
+                    message = self._error(call, f"Error: {call['name']} timed out")
+                except Exception as e:
+                    message = self._error(call, f"Error: {call['name']} failed: {e}")
+                return self._finish(span, message)
+
+    async def arun(self, state, config: RunnableConfig = None):
+        thread_id = (config or {}).get("configurable", {}).get("thread_id")
+        deadline = self._deadline(state)
+        calls = self._tool_calls(state)
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        with metrics.span("tools", "node", thread_id=thread_id):
+            timeout = self._time_left(deadline)
+            if timeout <= 0:
+                return {"messages": self._skipped(calls)}
+            # gather keeps call order; its tasks copy both scopes
+            with deadline_scope(deadline), chat_scope(thread_id):
+                messages = await asyncio.gather(
+                    *(self._arun_one(call, semaphore, timeout) for call in calls)
+                )
+        return {"messages": list(messages)}
@@ -1,7 +1,16 @@
+import asyncio
+import contextvars
 import os
-import requests
+import re
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
 from langchain_core.tools import tool
 from dotenv import load_dotenv
+from cache import DiskCache, SharedStore, TTLCache, cache_path
+from http_client import get_client
+from pages import aread_pages, read_pages
+from rate_limit import get_limiter
 
 load_dotenv()
 
@@ -13,40 +22,290 @@ API_SECRET = os.getenv("X_API_SECRET")
 ACCESS_TOKEN = os.getenv("X_ACCESS_TOKEN")
 ACCESS_SECRET = os.getenv("X_ACCESS_SECRET")
 
+# Upstream endpoints - override to point tools at a local fake server
+WTTR_URL = os.getenv("WTTR_URL", "https://wttr.in")
+GOOGLE_CSE_URL = os.getenv("GOOGLE_CSE_URL", "https://www.googleapis.com/customsearch/v1")
+
+# Weather cache - same few cities get asked again and again
+WEATHER_CACHE_TTL = float(os.getenv("WEATHER_CACHE_TTL", "600"))
+WEATHER_CACHE_SIZE = int(os.getenv("WEATHER_CACHE_SIZE", "256"))
+# set to a sqlite path to share the cache between server workers
+WEATHER_CACHE_DB = os.getenv("WEATHER_CACHE_DB")
+# wttr.in requests (one per city) in flight at once, and cities per tool call
+WEATHER_CONCURRENCY = int(os.getenv("WEATHER_CONCURRENCY", "8"))
+WEATHER_MAX_CITIES = int(os.getenv("WEATHER_MAX_CITIES", "20"))
+
+CITY_ALIASES = {
+    "bombay": "mumbai",
+    "calcutta": "kolkata",
+    "madras": "chennai",
+    "bengaluru": "bangalore",
+    "gurgaon": "gurugram",
+    "poona": "pune",
+    "banaras": "varanasi",
+    "benares": "varanasi",
+    "delhi ncr": "delhi",
+    "nyc": "new york",
+    "new york city": "new york",
+    "la": "los angeles",
+    "sf": "san francisco",
+}
+
+weather_cache = TTLCache(
+    maxsize=WEATHER_CACHE_SIZE,
+    ttl=WEATHER_CACHE_TTL,
+    shared=SharedStore(WEATHER_CACHE_DB, "weather") if WEATHER_CACHE_DB else None,
+)
+
+
+# Search cache - on disk, survives restarts, CSE quota is precious
+search_cache = DiskCache(
+    os.getenv("SEARCH_CACHE_DB") or cache_path("search_cache.db"),
+    # v2: keys keep word order; v1 entries age out on their own
+    "web_search_v2",
+    ttl=float(os.getenv("SEARCH_CACHE_TTL", "3600")),
+    stale=float(os.getenv("SEARCH_CACHE_STALE", "86400")),
+    max_bytes=int(os.getenv("SEARCH_CACHE_MAX_BYTES", str(50 * 1024 * 1024))),
+)
+
+STOP_WORDS = {
+    "a", "an", "the", "of", "in", "on", "for", "to", "and", "or", "is", "are",
+    "what", "whats", "how", "about", "me", "please", "tell", "with", "by",
+    "kya", "hai", "ka", "ki", "ke", "ko", "batao", "bata", "mein",
+}
+
+
+class WeatherUnavailable(Exception):
+    pass
+
+
+def normalize_city(city: str) -> str:
+    """Cache key for a city: lowercase, no accents, single spaces, aliases resolved."""
+    city = unicodedata.normalize("NFKD", city)
+    city = "".join(ch for ch in city if not unicodedata.combining(ch))
+    city = re.sub(r"[\s,]+", " ", city.lower()).strip(" .")
+    return CITY_ALIASES.get(city, city)
+
+
+def canonicalize_query(query: str) -> str:
+    """Cache key for a search: case, spacing, punctuation and stop words don't
+    matter ("What is the Delhi weather?" == "delhi weather"). Word order does:
+    "flights delhi to mumbai" and "flights mumbai to delhi" are different."""
+    query = unicodedata.normalize("NFKC", query).lower()
+    words = re.findall(r"\w+", query)
+    terms = [w for w in words if w not in STOP_WORDS] or words
+    return " ".join(terms)
+
+
+def _fetch_weather(city_key: str) -> str:
+    url = f"{WTTR_URL}/{city_key}?format=%C+%t"
+    response = get_client().get(url, upstream="wttr")
+    if response.status_code != 200:
+        raise WeatherUnavailable(city_key)
+    return response.text
+
+
+async def _afetch_weather(city_key: str) -> str:
+    url = f"{WTTR_URL}/{city_key}?format=%C+%t"
+    response = await get_client().aget(url, upstream="wttr")
+    if response.status_code != 200:
+        raise WeatherUnavailable(city_key)
+    return response.text
+
 
 @tool()
 def get_weather(city: str):
     """this tool return weather data about city name"""
-    url = f"https://wttr.in/{city}?format=%C+%t"
     try:
-        response = requests.get(url)
-        if response.status_code == 200:
-            return f"Weather in {city} is {response.text}"
-        else:
-            return f"Cannot fetch {city} data sorry!"
+        report = weather_cache.get_or_load(normalize_city(city), _fetch_weather)
+        return f"Weather in {city} is {report}"
+    except WeatherUnavailable:
+        return f"Cannot fetch {city} data sorry!"
     except Exception as e:
         return f"Error fetching weather data: {str(e)}"
 
 
+async def aget_weather(city: str):
+    try:
+        report = await weather_cache.aget_or_load(
+            normalize_city(city), _afetch_weather
+        )
+        return f"Weather in {city} is {report}"
+    except WeatherUnavailable:
+        return f"Cannot fetch {city} data sorry!"
+    except Exception as e:
+        return f"Error fetching weather data: {str(e)}"
+
+
+get_weather.coroutine = aget_weather
+
+
+def _fetch_cities(city_keys: List[str]) -> Dict[str, object]:
+    """city key -> report, or the exception for that city. wttr.in has no
+    multi-city request, so each city is its own request, several at once."""
+    if not city_keys:
+        return {}
+    pool = ThreadPoolExecutor(max_workers=min(WEATHER_CONCURRENCY, len(city_keys)))
+    try:
+        # copied context: the turn's deadline reaches the HTTP client
+        futures = {
+            key: pool.submit(contextvars.copy_context().run, _fetch_weather, key)
+            for key in city_keys
+        }
+        reports = {}
+        for key, future in futures.items():
+            try:
+                reports[key] = future.result().strip()
+            except Exception as e:
+                reports[key] = e
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+    return reports
+
+
+async def _afetch_cities(city_keys: List[str]) -> Dict[str, object]:
+    semaphore = asyncio.Semaphore(WEATHER_CONCURRENCY)
+
+    async def fetch(key: str):
+        async with semaphore:
+            try:
+                return (await _afetch_weather(key)).strip()
+            except Exception as e:
+                return e
+
+    reports = await asyncio.gather(*(fetch(key) for key in city_keys))
+    return dict(zip(city_keys, reports))
+
+
+def _plan_weather(cities: List[str]):
+    """(cities to report, cities over the cap, city -> cache key, cached
+    reports by key, keys still to fetch). Aliases share one key and fetch."""
+    cities = [c.strip() for c in cities if c and c.strip()]
+    cities, skipped = cities[:WEATHER_MAX_CITIES], cities[WEATHER_MAX_CITIES:]
+    keys = {city: normalize_city(city) for city in cities}
+    reports = weather_cache.get_many(list(keys.values()))
+    misses = [key for key in dict.fromkeys(keys.values()) if key not in reports]
+    return cities, skipped, keys, reports, misses
+
+
+def _store_reports(reports: Dict[str, object]):
+    for key, report in reports.items():
+        if isinstance(report, str):
+            weather_cache.set(key, report)
+
+
+def _weather_table(cities, keys, reports, skipped) -> str:
+    """Compact per-city table; a failed city gets its own error row."""
+    rows = ["| City | Weather |", "|---|---|"]
+    for city in cities:
+        report = reports.get(keys[city])
+        if isinstance(report, WeatherUnavailable):
+            report = "❌ not found"
+        elif isinstance(report, Exception):
+            # class name only - a full requests error is a paragraph
+            report = f"❌ error ({type(report).__name__})"
+        rows.append(f"| {city} | {report} |")
+    for city in skipped:
+        rows.append(f"| {city} | skipped, max {WEATHER_MAX_CITIES} cities per call |")
+    return "\n".join(rows)
+
+
+@tool()
+def get_weather_batch(cities: List[str]):
+    """Weather for several cities at once (e.g. "compare Delhi, Mumbai and Pune").
+    Returns one table row per city."""
+    cities, skipped, keys, reports, misses = _plan_weather(cities)
+    fetched = _fetch_cities(misses)
+    _store_reports(fetched)
+    return _weather_table(cities, keys, {**reports, **fetched}, skipped)
+
+
+async def aget_weather_batch(cities: List[str]):
+    cities, skipped, keys, reports, misses = _plan_weather(cities)
+    fetched = await _afetch_cities(misses)
+    _store_reports(fetched)
+    return _weather_table(cities, keys, {**reports, **fetched}, skipped)
+
+
+get_weather_batch.coroutine = aget_weather_batch
+
+
+def _search_params(query: str) -> dict:
+    return {"q": query, "key": GOOGLE_API_KEY, "cx": GOOGLE_CSE_ID}
+
+
+def _format_search(results: dict) -> str:
+    informations = []
+    if "items" in results:
+        for item in results["items"]:
+            informations.append(
+                f"{item['title']}: {item['link']}\n{item.get('snippet', '')}"
+            )
+
+    return "\n\n".join(informations[:5])  # Top 5 results
+
+
+def _fetch_search(query: str) -> str:
+    limiter = get_limiter("google_cse")
+    if limiter is not None:
+        # waits in line (or raises RateLimited) before spending quota
+        limiter.acquire({"queries": 1})
+    response = get_client().get(
+        GOOGLE_CSE_URL, params=_search_params(query), upstream="cse"
+    )
+    # quota / key errors must not end up in the cache
+    response.raise_for_status()
+    return _format_search(response.json())
+
+
+async def _afetch_search(query: str) -> str:
+    limiter = get_limiter("google_cse")
+    if limiter is not None:
+        await limiter.aacquire({"queries": 1})
+    response = await get_client().aget(
+        GOOGLE_CSE_URL, params=_search_params(query), upstream="cse"
+    )
+    response.raise_for_status()
+    return _format_search(response.json())
+
+
 @tool()
 def web_search(query: str):
     """If the user query cannot be answered from the LLM knowledge base or context,
     invoke the web Search Query tool with the query text. Return results using the tool output.
     """
-    url = "https://www.googleapis.com/customsearch/v1"
-    params = {"q": query, "key": GOOGLE_API_KEY, "cx": GOOGLE_CSE_ID}
-
     try:
-        response = requests.get(url, params=params)
-        results = response.json()
+        return search_cache.get_or_load(
+            canonicalize_query(query), lambda _key: _fetch_search(query)
+        )
+    except Exception as e:
+        return f"Error performing web search: {str(e)}"
 
-        informations = []
-        if "items" in results:
-            for item in results["items"]:
-                informations.append(
-                    f"{item['title']}: {item['link']}\n{item.get('snippet', '')}"
-                )
 
-        return "\n\n".join(informations[:5])  # Top 5 results
+async def aweb_search(query: str):
+    try:
+        return await search_cache.aget_or_load(
+            canonicalize_query(query),
+            lambda _key: _afetch_search(query),
+            lambda _key: _fetch_search(query),
+        )
     except Exception as e:
         return f"Error performing web search: {str(e)}"
+
+
+web_search.coroutine = aweb_search
+
+
+@tool()
+def fetch_pages(urls: List[str], query: str):
+    """Read the actual content of web pages, e.g. the top links from web_search,
+    when the snippets are not enough. Returns the passages most relevant to
+    `query` from each page."""
+    return read_pages(urls, canonicalize_query(query).split())
+
+
+async def afetch_pages(urls: List[str], query: str):
+    return await aread_pages(urls, canonicalize_query(query).split())
+
+
+fetch_pages.coroutine = afetch_pages